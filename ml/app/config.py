@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 from functools import lru_cache
+from typing import Any, Dict
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -15,11 +16,83 @@ class Settings(BaseSettings):
     mongo_uri: str = Field(default="mongodb://mongo:27017", alias="MONGO_URI")
     mongo_db: str = Field(default="career_coach", alias="MONGO_DB")
 
+    # "yandex", or "fake" for a deterministic offline stand-in (no credentials needed)
+    llm_backend: str = Field(default="yandex", alias="LLM_BACKEND")
+    fake_llm_latency_dist: str = Field(default="lognormal", alias="FAKE_LLM_LATENCY_DIST")  # none|constant|uniform|lognormal
+    fake_llm_latency_seconds: float = Field(default=0.0, alias="FAKE_LLM_LATENCY_SECONDS")  # median completion latency
+    fake_llm_latency_sigma: float = Field(default=0.5, alias="FAKE_LLM_LATENCY_SIGMA")
+    fake_embed_latency_scale: float = Field(default=0.1, alias="FAKE_EMBED_LATENCY_SCALE")
+    fake_embed_dim: int = Field(default=256, alias="FAKE_EMBED_DIM")
+    fake_chat_turns: int = Field(default=3, alias="FAKE_CHAT_TURNS")
+
     yandex_folder_id: str = Field(default="", alias="YANDEX_FOLDER_ID")
     yandex_api_key: str = Field(default="", alias="YANDEX_API_KEY")
     yandex_iam_token: str = Field(default="", alias="YANDEX_IAM_TOKEN")
+    # File with a rotated IAM token; re-read every YANDEX_CLIENT_REFRESH_SECONDS
+    yandex_iam_token_file: str = Field(default="", alias="YANDEX_IAM_TOKEN_FILE")
+    yandex_client_refresh_seconds: float = Field(default=300.0, alias="YANDEX_CLIENT_REFRESH_SECONDS")
+    # Max concurrent blocking SDK calls offloaded from the event loop
+    llm_thread_pool_size: int = Field(default=16, alias="LLM_THREAD_POOL_SIZE")
+    # Outbound call admission: token bucket over call starts plus concurrency caps per priority class
+    llm_rate_per_second: float = Field(default=10.0, alias="LLM_RATE_PER_SECOND")
+    llm_rate_burst: int = Field(default=10, alias="LLM_RATE_BURST")
+    llm_max_concurrency: int = Field(default=16, alias="LLM_MAX_CONCURRENCY")
+    llm_concurrency_chat: int = Field(default=16, alias="LLM_CONCURRENCY_CHAT")
+    llm_concurrency_match: int = Field(default=12, alias="LLM_CONCURRENCY_MATCH")
+    llm_concurrency_trajectory: int = Field(default=8, alias="LLM_CONCURRENCY_TRAJECTORY")
+    llm_concurrency_batch: int = Field(default=4, alias="LLM_CONCURRENCY_BATCH")
+    # Per-attempt timeout, retries with jittered exponential backoff, and hedging after the site's p95;
+    # LLM_CALL_POLICIES overrides them per call site, e.g. {"gaps": {"timeout": 60, "hedge": true}}
+    llm_timeout_seconds: float = Field(default=45.0, alias="LLM_TIMEOUT_SECONDS")
+    llm_retries: int = Field(default=2, alias="LLM_RETRIES")
+    llm_backoff_base_seconds: float = Field(default=0.5, alias="LLM_BACKOFF_BASE_SECONDS")
+    llm_backoff_max_seconds: float = Field(default=8.0, alias="LLM_BACKOFF_MAX_SECONDS")
+    llm_hedge: bool = Field(default=False, alias="LLM_HEDGE")
+    llm_hedge_quantile: float = Field(default=0.95, alias="LLM_HEDGE_QUANTILE")
+    llm_hedge_min_samples: int = Field(default=20, alias="LLM_HEDGE_MIN_SAMPLES")
+    llm_call_policies: Dict[str, Dict[str, Any]] = Field(default_factory=dict, alias="LLM_CALL_POLICIES")
+    # Price per 1000 tokens by model name ("yandexgpt", "yandexgpt-lite", "text_embeddings"), for cost accounting
+    llm_token_prices: Dict[str, float] = Field(default_factory=dict, alias="LLM_TOKEN_PRICES")
+    # Response cache for deterministic prompts; a Mongo TTL of 0 keeps it in memory only
+    llm_cache_enabled: bool = Field(default=True, alias="LLM_CACHE_ENABLED")
+    llm_cache_max_entries: int = Field(default=2048, alias="LLM_CACHE_MAX_ENTRIES")
+    llm_cache_ttl_seconds: float = Field(default=3600.0, alias="LLM_CACHE_TTL_SECONDS")
+    llm_cache_mongo_ttl_seconds: int = Field(default=7 * 24 * 3600, alias="LLM_CACHE_MONGO_TTL_SECONDS")
+    # Query embeddings are deterministic; Mongo keeps them as float16
+    embed_cache_enabled: bool = Field(default=True, alias="EMBED_CACHE_ENABLED")
+    embed_cache_max_entries: int = Field(default=8192, alias="EMBED_CACHE_MAX_ENTRIES")
+    embed_cache_ttl_seconds: float = Field(default=24 * 3600.0, alias="EMBED_CACHE_TTL_SECONDS")
+    embed_cache_mongo_ttl_seconds: int = Field(default=30 * 24 * 3600, alias="EMBED_CACHE_MONGO_TTL_SECONDS")
 
     message_window_size: int = Field(default=12, alias="MESSAGE_WINDOW_SIZE")
+    # Trajectory build stages running at once (independent stages overlap; LLM calls are still admitted by the scheduler)
+    trajectory_stage_concurrency: int = Field(default=4, alias="TRAJECTORY_STAGE_CONCURRENCY")
+    # Build job queue: worker loops per process (0: this process only enqueues), poll interval, lease of a
+    # running job (a crashed worker's job is picked up again once it lapses), and retention of finished jobs
+    trajectory_workers: int = Field(default=2, alias="TRAJECTORY_WORKERS")
+    trajectory_job_poll_seconds: float = Field(default=1.0, alias="TRAJECTORY_JOB_POLL_SECONDS")
+    trajectory_job_lease_seconds: float = Field(default=300.0, alias="TRAJECTORY_JOB_LEASE_SECONDS")
+    trajectory_job_max_attempts: int = Field(default=2, alias="TRAJECTORY_JOB_MAX_ATTEMPTS")
+    trajectory_job_ttl_seconds: int = Field(default=7 * 24 * 3600, alias="TRAJECTORY_JOB_TTL_SECONDS")
+    # How long POST /trajectory/build waits for its job before answering 202 with the job (kept under proxy timeouts)
+    trajectory_build_wait_seconds: float = Field(default=25.0, alias="TRAJECTORY_BUILD_WAIT_SECONDS")
+    # One structured call for projects/tips of all gaps; gaps the answer leaves out get their own call
+    recs_batch: bool = Field(default=True, alias="RECS_BATCH")
+
+    faiss_index_persist: bool = Field(default=True, alias="FAISS_INDEX_PERSIST")
+    faiss_index_mmap: bool = Field(default=True, alias="FAISS_INDEX_MMAP")
+    # FAISS index_factory strings, e.g. "HNSW32,Flat", "HNSW32,SQ8", "IVF4096,PQ32", "IVF1024,SQ8"
+    faiss_index_factory: str = Field(default="HNSW32,Flat", alias="FAISS_INDEX_FACTORY")
+    faiss_courses_index_factory: str = Field(default="HNSW32,Flat", alias="FAISS_COURSES_INDEX_FACTORY")
+    faiss_train_sample: int = Field(default=100_000, alias="FAISS_TRAIN_SAMPLE")
+    faiss_nprobe: int = Field(default=16, alias="FAISS_NPROBE")
+    faiss_ef_search: int = Field(default=64, alias="FAISS_EF_SEARCH")
+    faiss_ef_search_factor: float = Field(default=1.5, alias="FAISS_EF_SEARCH_FACTOR")
+    hybrid_search: bool = Field(default=True, alias="HYBRID_SEARCH")
+    rrf_k: int = Field(default=60, alias="RRF_K")
+
+    admin_token: str = Field(default="", alias="ADMIN_TOKEN")
+    ingest_embed_concurrency: int = Field(default=8, alias="INGEST_EMBED_CONCURRENCY")
 
     
     backend_jwt_secret: str = Field(default="", alias="BACKEND_JWT_SECRET")
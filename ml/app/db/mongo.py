@@ -36,7 +36,23 @@ async def ensure_indexes() -> None:
     db = await get_db()
     await db["sessions"].create_index("user_id")
     await db["profiles"].create_index("user_id")
+    # One stored profile per session; older documents without session_id are left out.
+    await db["profiles"].create_index(
+        "session_id",
+        unique=True,
+        partialFilterExpression={"session_id": {"$type": "string"}},
+        name="session_unique",
+    )
     await db["messages"].create_index([("session_id", 1), ("created_at", 1)])
+    await db["llm_cache"].create_index("expires_at", expireAfterSeconds=0)
+    await db["embedding_cache"].create_index("expires_at", expireAfterSeconds=0)
+    await db["trajectory_jobs"].create_index("job_id", unique=True)
+    # At most one queued/running job per session; finished jobs drop the `active` flag.
+    await db["trajectory_jobs"].create_index(
+        "session_id", unique=True, partialFilterExpression={"active": True}, name="session_active_unique"
+    )
+    await db["trajectory_jobs"].create_index([("active", 1), ("status", 1), ("created_at", 1)])
+    await db["trajectory_jobs"].create_index("expires_at", expireAfterSeconds=0)
 
 
 def sanitize_mongo_doc(doc: Optional[dict[str, Any]]) -> Optional[dict[str, Any]]:
@@ -12,9 +12,11 @@ from app.routers.chat import router as chat_router
 from app.routers.profile import router as profile_router
 from app.routers.match import router as match_router
 from app.routers.trajectory import router as trajectory_router
+from app.routers.admin import router as admin_router
+from app.services.trajectory_jobs import workers as trajectory_workers
 from app.startup.seed_vacancies import seed_vacancies_if_needed
 from app.startup.seed_courses import seed_courses_if_needed
-from app.startup.load_embeddings import build_faiss
+from app.startup.load_embeddings import build_faiss, build_filters, build_keyword_indexes
 from app.models import HealthResponse
 logging.basicConfig(
     level=logging.INFO,
@@ -31,11 +33,15 @@ async def lifespan(app: FastAPI):  # noqa: ANN001
     await ensure_indexes()
     await seed_vacancies_if_needed()
     await seed_courses_if_needed()
-    build_faiss()
+    await build_keyword_indexes()
+    await build_faiss()
+    await build_filters()
+    trajectory_workers.start()
 
     try:
         yield
     finally:
+        await trajectory_workers.stop()
         await close_mongo()
 
 
@@ -56,5 +62,6 @@ app.include_router(chat_router, prefix="/chat", tags=["chat"])
 app.include_router(profile_router, prefix="/profile", tags=["profile"])
 app.include_router(match_router, prefix="/match", tags=["match"])
 app.include_router(trajectory_router, prefix="/trajectory", tags=["trajectory"])
+app.include_router(admin_router, prefix="/admin", tags=["admin"])
 
 
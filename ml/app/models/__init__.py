@@ -3,6 +3,7 @@ from .schemas import (
     Message,
     SessionState,
     Session,
+    LLMUsage,
     CreateSessionRequest,
     CreateSessionResponse,
     GetSessionResponse,
@@ -18,6 +19,7 @@ __all__ = [
     "Message",
     "SessionState",
     "Session",
+    "LLMUsage",
     "CreateSessionRequest",
     "CreateSessionResponse",
     "GetSessionResponse",
@@ -0,0 +1,15 @@
+from __future__ import annotations
+
+from typing import Literal
+
+from pydantic import BaseModel, ConfigDict, Field
+
+
+class IngestResponse(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    corpus: Literal["vacancies", "courses"]
+    received: int = Field(description="Строк во входном файле")
+    upserted: int = Field(description="Документов вставлено/обновлено в Mongo")
+    embedded: int = Field(description="Строк добавлено в индекс")
+    duplicates: int = Field(default=0, description="Повторов уже известных позиций (только в Mongo)")
+    index_total: int = Field(description="Размер индекса после загрузки")
@@ -42,12 +42,24 @@ class MatchCoursesResponse(BaseModel):
 # Requests
 
 
+class VacancyFilters(BaseModel):
+    """Допустимые значения атрибутов вакансии; значения одного поля объединяются через OR, поля — через AND."""
+
+    model_config = ConfigDict(extra="forbid")
+    location: Optional[List[str]] = Field(default=None, description="Город/регион")
+    experience: Optional[List[str]] = Field(default=None, description="Требуемый опыт")
+    job_type: Optional[List[str]] = Field(default=None, description="Тип занятости")
+    type: Optional[List[str]] = Field(default=None, description="Формат работы")
+
+
 class MatchVacanciesRequest(BaseModel):
     model_config = ConfigDict(extra="forbid")
     resume: str
     k_faiss: int = Field(default=100, ge=1, le=2000)
     k_stage1: int = Field(default=20, ge=1, le=200)
     k_stage2: int = Field(default=5, ge=1, le=100)
+    ef_search: Optional[int] = Field(default=None, ge=16, le=4096, description="HNSW efSearch; по умолчанию выводится из k_faiss")
+    filters: Optional[VacancyFilters] = None
 
 
 class MatchCoursesRequest(BaseModel):
@@ -58,6 +70,7 @@ class MatchCoursesRequest(BaseModel):
     k_faiss: int = Field(default=100, ge=1, le=2000)
     k_stage1: int = Field(default=20, ge=1, le=200)
     k_stage2: int = Field(default=5, ge=1, le=100)
+    ef_search: Optional[int] = Field(default=None, ge=16, le=4096, description="HNSW efSearch; по умолчанию выводится из k_faiss")
 
 
 class MatchFutureRequest(BaseModel):
@@ -72,3 +85,5 @@ class MatchFutureRequest(BaseModel):
     k_faiss: int = Field(default=100, ge=1, le=2000)
     k_stage1: int = Field(default=20, ge=1, le=200)
     k_stage2: int = Field(default=5, ge=1, le=100)
+    ef_search: Optional[int] = Field(default=None, ge=16, le=4096, description="HNSW efSearch; по умолчанию выводится из k_faiss")
+    filters: Optional[VacancyFilters] = None
@@ -31,11 +31,23 @@ class SessionState(BaseModel):
     last_updated_at: str
 
 
+class LLMUsage(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    calls: int = Field(default=0, description="Число обращений к LLM")
+    input_tokens: int = Field(default=0, description="Токены запросов")
+    output_tokens: int = Field(default=0, description="Токены ответов")
+    total_tokens: int = Field(default=0, description="Всего токенов")
+    seconds: float = Field(default=0.0, description="Суммарное время вызовов, с")
+    cost: float = Field(default=0.0, description="Стоимость по LLM_TOKEN_PRICES")
+    by_site: Dict[str, Dict[str, float]] = Field(default_factory=dict, description="Те же счётчики по местам вызова")
+
+
 class Session(BaseModel):
     model_config = ConfigDict(extra="forbid")
     session_id: str
     user_id: str
     state: SessionState
+    usage: Optional[LLMUsage] = None
 
 
 class CreateSessionRequest(BaseModel):
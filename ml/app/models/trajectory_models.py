@@ -1,11 +1,12 @@
 from __future__ import annotations
 
 from math import ceil
-from typing import List, Optional, Literal
+from typing import Any, Dict, List, Optional, Literal
 
 from pydantic import BaseModel, ConfigDict, Field
 
 from app.models.match_models import MatchedVacancy
+from app.models.schemas import LLMUsage
 
 
 class RecommendationItem(BaseModel):
@@ -63,5 +64,25 @@ class TrajectoryResponse(BaseModel):
     current_positions: List[MatchedVacancy] = Field(default_factory=list, description="Доступные сейчас вакансии")
     groups: List[GapGroup] = Field(default_factory=list, description="Группы gap для закрытия")
     future_positions: List[MatchedVacancy] = Field(default_factory=list, description="Целевые вакансии")
+    usage: Optional[LLMUsage] = Field(default=None, description="Расход токенов LLM на построение")
 
 
+class TrajectoryStageStatus(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    status: Literal["pending", "running", "done"] = Field(description="Состояние этапа")
+    seconds: Optional[float] = Field(default=None, description="Длительность этапа, с")
+
+
+class TrajectoryJobResponse(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    job_id: str = Field(description="Идентификатор задачи")
+    session_id: str = Field(description="Идентификатор сессии")
+    status: Literal["queued", "running", "done", "failed"] = Field(description="Состояние задачи")
+    deduplicated: bool = Field(default=False, description="Возвращена уже выполняющаяся задача этой сессии")
+    stages: Dict[str, TrajectoryStageStatus] = Field(default_factory=dict, description="Прогресс по этапам")
+    partial: Dict[str, Any] = Field(default_factory=dict, description="Готовые части результата")
+    result: Optional[TrajectoryResponse] = Field(default=None, description="Траектория (когда задача выполнена)")
+    error: Optional[str] = Field(default=None, description="Ошибка (когда задача упала)")
+    created_at: str = Field(description="Время постановки в очередь")
+    started_at: Optional[str] = Field(default=None, description="Время начала (последней попытки)")
+    finished_at: Optional[str] = Field(default=None, description="Время завершения")
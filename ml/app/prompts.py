@@ -212,6 +212,16 @@ RECS_USER_INSTRUCTIONS = (
 ).strip()
 
 
+RECS_BATCH_USER_INSTRUCTIONS = (
+    """
+Для КАЖДОГО gap из списка сгенерируй проекты и практические советы для его закрытия.
+Проекты должны быть прикладными, со сформулированными измеримыми исходами (метрики/артефакты).
+Советы должны быть краткими, ориентированными на действие.
+Ключи ответа — названия gap в точности как в списке.
+"""
+).strip()
+
+
 # Planner (grouping) prompts
 PLANNER_SYSTEM_PROMPT = (
     """
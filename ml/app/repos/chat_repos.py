@@ -15,6 +15,14 @@ class SessionsRepository:
         doc = await self._coll.find_one({"session_id": session_id})
         return sanitize_mongo_doc(doc)
 
+    async def add_usage(self, session_id: str, usage: dict[str, Any]) -> None:
+        """Add a UsageMeter summary to the session's running LLM usage totals."""
+        inc = {f"usage.{k}": v for k, v in usage.items() if k != "by_site"}
+        for site, counters in usage.get("by_site", {}).items():
+            inc.update({f"usage.by_site.{site}.{k}": v for k, v in counters.items()})
+        if inc:
+            await self._coll.update_one({"session_id": session_id}, {"$inc": inc})
+
 
 class MessagesRepository:
     def __init__(self, db: AsyncIOMotorDatabase) -> None:
@@ -28,6 +36,11 @@ class MessagesRepository:
     async def insert_one(self, message: dict[str, Any]) -> None:
         await self._coll.insert_one(message)
 
+    async def find_last_message(self, session_id: str) -> Optional[dict[str, Any]]:
+        # Both messages of a turn share created_at; the assistant's is inserted second, so its _id is larger.
+        doc = await self._coll.find_one({"session_id": session_id}, sort=[("created_at", -1), ("_id", -1)])
+        return sanitize_mongo_doc(doc)
+
     async def find_last_assistant_message(self, session_id: str) -> Optional[dict[str, Any]]:
         doc = await self._coll.find_one({"session_id": session_id, "role": "assistant"}, sort=[("created_at", -1)])
         return sanitize_mongo_doc(doc)
@@ -1,9 +1,33 @@
 from __future__ import annotations
 
-from typing import Any, Iterable, List
+from typing import Any, Iterable, List, Optional
 
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
 from app.db.mongo import sanitize_many
+from app.startup.duplicates import DUP_FIELD
+
+
+async def _upsert_by_idx(coll, docs: List[dict[str, Any]]) -> int:  # noqa: ANN001
+    if not docs:
+        return 0
+    ops = [UpdateOne({"idx": int(d["idx"])}, {"$set": d}, upsert=True) for d in docs]
+    res = await coll.bulk_write(ops, ordered=False)
+    return int(res.upserted_count + res.modified_count)
+
+
+async def _max_idx(coll) -> int:  # noqa: ANN001
+    doc = await coll.find_one({"idx": {"$ne": None}}, {"idx": 1}, sort=[("idx", -1)])
+    return int(doc["idx"]) if doc and doc.get("idx") is not None else 0
+
+
+async def _find_representative(coll, key: dict[str, Any]) -> Optional[int]:  # noqa: ANN001
+    # Seeding stores empty strings as None.
+    query = {k: (v if v not in ("", None) else None) for k, v in key.items()}
+    query[DUP_FIELD] = {"$exists": True}
+    doc = await coll.find_one(query, {DUP_FIELD: 1}, sort=[("idx", 1)])
+    return int(doc[DUP_FIELD]) if doc and doc.get(DUP_FIELD) is not None else None
 
 
 class VacanciesRepository:
@@ -15,6 +39,15 @@ class VacanciesRepository:
         docs = [d async for d in cur]
         return sanitize_many(docs)
 
+    async def upsert_many(self, docs: List[dict[str, Any]]) -> int:
+        return await _upsert_by_idx(self._coll, docs)
+
+    async def max_idx(self) -> int:
+        return await _max_idx(self._coll)
+
+    async def find_representative(self, key: dict[str, Any]) -> Optional[int]:
+        return await _find_representative(self._coll, key)
+
 
 class CoursesRepository:
     def __init__(self, db: AsyncIOMotorDatabase) -> None:
@@ -25,4 +58,11 @@ class CoursesRepository:
         docs = [d async for d in cur]
         return sanitize_many(docs)
 
+    async def upsert_many(self, docs: List[dict[str, Any]]) -> int:
+        return await _upsert_by_idx(self._coll, docs)
+
+    async def max_idx(self) -> int:
+        return await _max_idx(self._coll)
 
+    async def find_representative(self, key: dict[str, Any]) -> Optional[int]:
+        return await _find_representative(self._coll, key)
@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
+
+from app.db.mongo import sanitize_mongo_doc
+
+
+class ProfilesRepository:
+    """Extracted profiles, one per session, tagged with the last message they were built from."""
+
+    def __init__(self, db: AsyncIOMotorDatabase) -> None:
+        self._coll = db["profiles"]
+
+    async def find(self, session_id: str, last_message_id: Optional[str], version: str) -> Optional[dict[str, Any]]:
+        """The stored profile if it was extracted from the same transcript with the same prompt."""
+        doc = await self._coll.find_one(
+            {"session_id": session_id, "last_message_id": last_message_id, "version": version}
+        )
+        return sanitize_mongo_doc(doc)
+
+    async def upsert(
+        self,
+        session_id: str,
+        last_message_id: Optional[str],
+        version: str,
+        profile: dict[str, Any],
+        user_id: Optional[str] = None,
+    ) -> None:
+        data: dict[str, Any] = {
+            "session_id": session_id,
+            "last_message_id": last_message_id,
+            "version": version,
+            "profile": profile,
+            "updated_at": datetime.utcnow().isoformat(),
+        }
+        if user_id:
+            data["user_id"] = user_id
+        try:
+            await self._coll.update_one({"session_id": session_id}, {"$set": data}, upsert=True)
+        except DuplicateKeyError:
+            # A concurrent upsert inserted the session's document first; update that one.
+            await self._coll.update_one({"session_id": session_id}, {"$set": data})
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from typing import Any, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from app.db.mongo import sanitize_mongo_doc
+
+
+class TrajectoryJobsRepository:
+    """Queue of trajectory builds. Queued and running jobs carry `active: true` (one per session)."""
+
+    def __init__(self, db: AsyncIOMotorDatabase) -> None:
+        self._coll = db["trajectory_jobs"]
+
+    async def get(self, job_id: str) -> Optional[dict[str, Any]]:
+        doc = await self._coll.find_one({"job_id": job_id})
+        return sanitize_mongo_doc(doc)
+
+    async def find_active(self, session_id: str) -> Optional[dict[str, Any]]:
+        doc = await self._coll.find_one({"session_id": session_id, "active": True})
+        return sanitize_mongo_doc(doc)
+
+    async def create_or_get_active(self, job: dict[str, Any]) -> Tuple[dict[str, Any], bool]:
+        """Insert `job` unless its session already has an active one; returns (job, created)."""
+        for _ in range(3):
+            try:
+                await self._coll.insert_one({**job, "active": True})
+                return await self.get(job["job_id"]) or job, True
+            except DuplicateKeyError:
+                existing = await self.find_active(job["session_id"])
+                if existing is not None:
+                    return existing, False
+                # The active job finished between the insert and the lookup: try again.
+        raise RuntimeError(f"Cannot enqueue trajectory job for session {job['session_id']}")
+
+    async def claim(self, worker_id: str, lease_seconds: float) -> Optional[dict[str, Any]]:
+        """Take the oldest queued job, or a running one whose lease has lapsed."""
+        now = datetime.utcnow()
+        doc = await self._coll.find_one_and_update(
+            {
+                "active": True,
+                "$or": [{"status": "queued"}, {"status": "running", "lease_until": {"$lt": now}}],
+            },
+            {
+                "$set": {
+                    "status": "running",
+                    "worker": worker_id,
+                    "started_at": now.isoformat(),
+                    "lease_until": now + timedelta(seconds=lease_seconds),
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+        return sanitize_mongo_doc(doc)
+
+    @staticmethod
+    def _owned(job_id: str, worker_id: str) -> dict[str, Any]:
+        # A worker whose lease lapsed and whose job was claimed again must not write to it.
+        return {"job_id": job_id, "worker": worker_id, "status": "running"}
+
+    async def extend_lease(self, job_id: str, worker_id: str, lease_seconds: float) -> bool:
+        """False if the job is no longer this worker's (another worker claimed it)."""
+        res = await self._coll.update_one(
+            self._owned(job_id, worker_id),
+            {"$set": {"lease_until": datetime.utcnow() + timedelta(seconds=lease_seconds)}},
+        )
+        return res.matched_count > 0
+
+    async def release(self, job_id: str, worker_id: str) -> None:
+        """Put a running job back in the queue without counting the interrupted attempt."""
+        await self._coll.update_one(
+            self._owned(job_id, worker_id),
+            {"$set": {"status": "queued"}, "$unset": {"lease_until": ""}, "$inc": {"attempts": -1}},
+        )
+
+    async def update_stage(
+        self,
+        job_id: str,
+        worker_id: str,
+        stage: str,
+        info: dict[str, Any],
+        partial: Optional[dict[str, Any]] = None,
+    ) -> None:
+        update = {f"stages.{stage}": info, "updated_at": datetime.utcnow().isoformat()}
+        update.update({f"partial.{k}": v for k, v in (partial or {}).items()})
+        await self._coll.update_one(self._owned(job_id, worker_id), {"$set": update})
+
+    async def _close(self, job_id: str, worker_id: str, fields: dict[str, Any], ttl_seconds: int) -> bool:
+        now = datetime.utcnow()
+        res = await self._coll.update_one(
+            self._owned(job_id, worker_id),
+            {
+                "$set": {**fields, "finished_at": now.isoformat(), "expires_at": now + timedelta(seconds=ttl_seconds)},
+                "$unset": {"active": "", "lease_until": ""},
+            },
+        )
+        return res.matched_count > 0
+
+    async def finish(self, job_id: str, worker_id: str, result: dict[str, Any], ttl_seconds: int) -> bool:
+        """Mark the job done; False if it is no longer this worker's."""
+        return await self._close(job_id, worker_id, {"status": "done", "result": result}, ttl_seconds)
+
+    async def fail(self, job_id: str, worker_id: str, error: str, client_error: bool, ttl_seconds: int) -> bool:
+        fields = {"status": "failed", "error": error, "client_error": client_error}
+        return await self._close(job_id, worker_id, fields, ttl_seconds)
@@ -12,13 +12,26 @@ class TrajectoryRepository:
         self._coll = db["trajectories"]
 
     async def get_by_session(self, session_id: str) -> Optional[dict[str, Any]]:
-        doc = await self._coll.find_one({"session_id": session_id})
+        doc = await self._coll.find_one({"session_id": session_id}, {"stages": 0})
         return sanitize_mongo_doc(doc)
 
-    async def upsert(self, session_id: str, trajectory: dict[str, Any], user_id: str = None) -> None:
+    async def get_stages(self, session_id: str) -> Optional[dict[str, Any]]:
+        """Per-stage fingerprints and outputs saved with the session's last build."""
+        doc = await self._coll.find_one({"session_id": session_id}, {"stages": 1})
+        return doc.get("stages") if doc else None
+
+    async def upsert(
+        self,
+        session_id: str,
+        trajectory: dict[str, Any],
+        user_id: str = None,
+        stages: Optional[dict[str, Any]] = None,
+    ) -> None:
         trajectory_data = {"session_id": session_id, **trajectory}
         if user_id:
             trajectory_data["user_id"] = user_id
+        if stages is not None:
+            trajectory_data["stages"] = stages
         await self._coll.update_one(
             {"session_id": session_id},
             {"$set": trajectory_data},
@@ -26,7 +39,7 @@ class TrajectoryRepository:
         )
 
     async def list_by_user(self, user_id: str) -> List[dict[str, Any]]:
-        docs = await self._coll.find({"user_id": user_id}).sort("created_at", -1).to_list(None)
+        docs = await self._coll.find({"user_id": user_id}, {"stages": 0}).sort("created_at", -1).to_list(None)
         return sanitize_many(docs)
 
 
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import hmac
+from typing import Any, Dict, Literal
+
+from fastapi import APIRouter, Depends, File, Header, HTTPException, UploadFile
+
+from app.config import get_settings
+from app.db.mongo import get_db
+from app.models.ingest_models import IngestResponse
+from app.repos.match_repos import CoursesRepository, VacanciesRepository
+from app.services.ingest_service import IngestService, read_delta
+from app.services.llm_cache import embedding_cache, llm_cache
+from app.services.llm_policy import call_stats
+from app.services.llm_scheduler import scheduler
+from app.services.llm_usage import usage_stats
+from app.services.trajectory_jobs import workers as trajectory_workers
+from app.services.yandex_sdk import registry
+
+
+router = APIRouter()
+
+
+def get_ingest_service() -> IngestService:
+    return IngestService()
+
+
+async def require_admin(x_admin_token: str = Header(None)) -> None:
+    settings = get_settings()
+    if not settings.admin_token:
+        raise HTTPException(status_code=403, detail="Admin API is disabled")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, settings.admin_token):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+@router.post("/ingest/{corpus}", response_model=IngestResponse, dependencies=[Depends(require_admin)])
+async def ingest(
+    corpus: Literal["vacancies", "courses"],
+    file: UploadFile = File(...),
+    service: IngestService = Depends(get_ingest_service),
+    db=Depends(get_db),  # noqa: ANN001
+) -> IngestResponse:
+    try:
+        df = read_delta(await file.read(), file.filename or "")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to read delta: {e}")
+
+    repo = VacanciesRepository(db) if corpus == "vacancies" else CoursesRepository(db)
+    try:
+        return await service.ingest(corpus, df, repo)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ingestion failed: {e}")
+
+
+@router.get("/metrics", dependencies=[Depends(require_admin)])
+async def metrics() -> Dict[str, Any]:
+    return {
+        "llm_client": registry.stats(),
+        "llm_cache": llm_cache.stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "llm_scheduler": scheduler.stats(),
+        "llm_calls": call_stats.stats(),
+        "llm_usage": usage_stats.summary(),
+        "trajectory_workers": trajectory_workers.stats(),
+    }
@@ -1,6 +1,11 @@
 from __future__ import annotations
 
+import json
+import logging
+from typing import Any, AsyncIterator, Dict
+
 from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi.responses import StreamingResponse
 
 from app.db.mongo import get_db
 from app.models import ChatResponse, ChatRequest
@@ -40,3 +45,41 @@ async def chat(
         raise HTTPException(status_code=500, detail=f"Chat failed: {e}")
 
 
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/{session_id}/stream")
+async def chat_stream(
+    session_id: str,
+    req: ChatRequest,
+    authorization: str = Header(None),
+    service: ChatService = Depends(get_chat_service),
+    sessions_repo: SessionsRepository = Depends(get_sessions_repo),
+    messages_repo: MessagesRepository = Depends(get_messages_repo),
+) -> StreamingResponse:
+    """Server-sent events: `delta` ({"text"}) per generated piece of the reply, then `done` (ChatResponse)."""
+    try:
+        events = await service.stream_reply(session_id, req.text, sessions_repo, messages_repo)
+    except ValueError as e:
+        raise HTTPException(status_code=404 if "Session not found" in str(e) else 400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Chat failed: {e}")
+
+    async def body() -> AsyncIterator[str]:
+        try:
+            async for event in events:
+                if "delta" in event:
+                    yield _sse("delta", {"text": event["delta"]})
+                else:
+                    yield _sse("done", event["final"].model_dump())
+        except Exception as e:
+            logging.getLogger(__name__).exception("Chat stream failed for %s", session_id)
+            yield _sse("error", {"detail": f"Chat failed: {e}"})
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
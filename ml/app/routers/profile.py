@@ -5,6 +5,8 @@ from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
 from app.db.mongo import get_db
 from app.models import ProfileResponse
 from app.repos.chat_repos import SessionsRepository, MessagesRepository
+from app.repos.profile_repo import ProfilesRepository
+from app.services.llm_usage import track_usage
 from app.services.profile_service import ProfileService
 
 
@@ -23,15 +25,22 @@ async def get_messages_repo(db=Depends(get_db)) -> MessagesRepository:  # noqa:
     return MessagesRepository(db)
 
 
+async def get_profiles_repo(db=Depends(get_db)) -> ProfilesRepository:  # noqa: ANN001
+    return ProfilesRepository(db)
+
+
 @router.get("/{session_id}", response_model=ProfileResponse)
 async def get_profile(
     session_id: str,
     service: ProfileService = Depends(get_profile_service),
     sessions_repo: SessionsRepository = Depends(get_sessions_repo),
     messages_repo: MessagesRepository = Depends(get_messages_repo),
+    profiles_repo: ProfilesRepository = Depends(get_profiles_repo),
 ) -> ProfileResponse:
     try:
-        data = await service.build_profile(session_id, sessions_repo, messages_repo)
+        with track_usage() as meter:
+            data = await service.build_profile(session_id, sessions_repo, messages_repo, profiles_repo)
+        await sessions_repo.add_usage(session_id, meter.summary())
         return ProfileResponse(**data)
     except ValueError as e:
         msg = str(e)
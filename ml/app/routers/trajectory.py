@@ -2,60 +2,103 @@ from __future__ import annotations
 
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi import APIRouter, Depends, HTTPException, Header, Request
+from fastapi.responses import JSONResponse
 
+from app.config import get_settings
 from app.db.mongo import get_db
-from app.models.trajectory_models import TrajectoryBuildRequest, TrajectoryResponse
-from app.repos.chat_repos import SessionsRepository, MessagesRepository
-from app.repos.match_repos import VacanciesRepository, CoursesRepository
+from app.models.trajectory_models import TrajectoryBuildRequest, TrajectoryJobResponse, TrajectoryResponse
+from app.repos.chat_repos import SessionsRepository
+from app.repos.trajectory_jobs_repo import TrajectoryJobsRepository
 from app.repos.trajectory_repo import TrajectoryRepository
-from app.services.trajectory_service import TrajectoryService
+from app.services.trajectory_jobs import TrajectoryJobConflict, TrajectoryJobService
 
 
 router = APIRouter()
 
 
-def get_traj_service() -> TrajectoryService:
-    return TrajectoryService()
+def get_job_service() -> TrajectoryJobService:
+    return TrajectoryJobService()
 
 
 async def get_sessions_repo(db=Depends(get_db)) -> SessionsRepository:  # noqa: ANN001
     return SessionsRepository(db)
 
 
-async def get_messages_repo(db=Depends(get_db)) -> MessagesRepository:  # noqa: ANN001
-    return MessagesRepository(db)
-
-
-async def get_vacancies_repo(db=Depends(get_db)) -> VacanciesRepository:  # noqa: ANN001
-    return VacanciesRepository(db)
-
-
-async def get_courses_repo(db=Depends(get_db)) -> CoursesRepository:  # noqa: ANN001
-    return CoursesRepository(db)
+async def get_jobs_repo(db=Depends(get_db)) -> TrajectoryJobsRepository:  # noqa: ANN001
+    return TrajectoryJobsRepository(db)
 
 
 async def get_traj_repo(db=Depends(get_db)) -> TrajectoryRepository:  # noqa: ANN001
     return TrajectoryRepository(db)
 
 
-@router.post("/build", response_model=TrajectoryResponse)
+@router.post(
+    "/build",
+    response_model=TrajectoryResponse,
+    responses={202: {"model": TrajectoryJobResponse, "description": "Still running; poll the job"}},
+)
 async def build_trajectory(
     payload: TrajectoryBuildRequest,
+    request: Request,
     authorization: str = Header(None),
-    service: TrajectoryService = Depends(get_traj_service),
+    service: TrajectoryJobService = Depends(get_job_service),
     sessions_repo: SessionsRepository = Depends(get_sessions_repo),
-    messages_repo: MessagesRepository = Depends(get_messages_repo),
-    vacancies_repo: VacanciesRepository = Depends(get_vacancies_repo),
-    courses_repo: CoursesRepository = Depends(get_courses_repo),
-    traj_repo: TrajectoryRepository = Depends(get_traj_repo),
-) -> TrajectoryResponse:
+    jobs_repo: TrajectoryJobsRepository = Depends(get_jobs_repo),
+) -> TrajectoryResponse | JSONResponse:
+    # Runs as a job and waits for it briefly: a fast (e.g. incremental) build answers with the trajectory as
+    # before, a slow one with 202 and the job to poll, well before a proxy would cut the connection.
     try:
-        return await service.build(payload, sessions_repo, messages_repo, vacancies_repo, courses_repo, traj_repo)
+        job, _ = await service.submit(payload, sessions_repo, jobs_repo)
+    except TrajectoryJobConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Trajectory build failed: {e}")
+    job = await service.wait(job["job_id"], jobs_repo, get_settings().trajectory_build_wait_seconds)
+    if job is None:
+        raise HTTPException(status_code=500, detail="Trajectory build failed: job disappeared")
+    if job["status"] == "done":
+        return TrajectoryResponse.model_validate(job["result"])
+    if job["status"] == "failed":
+        if job.get("client_error"):
+            raise HTTPException(status_code=400, detail=job.get("error"))
+        raise HTTPException(status_code=500, detail=f"Trajectory build failed: {job.get('error')}")
+    return JSONResponse(
+        status_code=202,
+        content=service.to_response(job).model_dump(mode="json"),
+        headers={"Location": str(request.url_for("get_trajectory_job", job_id=job["job_id"]))},
+    )
+
+
+@router.post("/jobs", response_model=TrajectoryJobResponse, status_code=202)
+async def submit_trajectory_job(
+    payload: TrajectoryBuildRequest,
+    authorization: str = Header(None),
+    service: TrajectoryJobService = Depends(get_job_service),
+    sessions_repo: SessionsRepository = Depends(get_sessions_repo),
+    jobs_repo: TrajectoryJobsRepository = Depends(get_jobs_repo),
+) -> TrajectoryJobResponse:
+    try:
+        job, created = await service.submit(payload, sessions_repo, jobs_repo)
+    except TrajectoryJobConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return service.to_response(job, deduplicated=not created)
+
+
+@router.get("/jobs/{job_id}", response_model=TrajectoryJobResponse)
+async def get_trajectory_job(
+    job_id: str,
+    service: TrajectoryJobService = Depends(get_job_service),
+    jobs_repo: TrajectoryJobsRepository = Depends(get_jobs_repo),
+) -> TrajectoryJobResponse:
+    job = await jobs_repo.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return service.to_response(job)
 
 
 @router.get("/user/{user_id}", response_model=List[TrajectoryResponse])
@@ -1,18 +1,65 @@
 from __future__ import annotations
 
 import json
+import logging
+import re
 from datetime import datetime
-from typing import List, Tuple
+from typing import Any, AsyncIterator, Dict, List, Tuple
 
 from app.models import Message, MessageRole, ChatResponse
 from app.prompts import CHAT_SYSTEM_PROMPT
-from app.services.yandex_sdk import run_structured_completion
+from app.services.llm_scheduler import llm_priority
+from app.services.llm_usage import track_usage
+from app.services.yandex_sdk import run_structured_completion_async, stream_structured_completion_async
 from app.repos.chat_repos import SessionsRepository, MessagesRepository
 
 
+REPLY_FIELD = "answer_to_user2"
+
+_JSON_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f", "/": "/", "\\": "\\", '"': '"'}
+
+
+def partial_string_field(raw: str, key: str) -> str:
+    """Decoded value of a top-level string field in a possibly truncated JSON object.
+
+    Returns the prefix that is complete so far: a trailing partial escape sequence is held back.
+    """
+    m = re.search(r'"%s"\s*:\s*"' % re.escape(key), raw)
+    if not m:
+        return ""
+    out: List[str] = []
+    i, n = m.end(), len(raw)
+    while i < n:
+        c = raw[i]
+        if c == '"':
+            break
+        if c != "\\":
+            out.append(c)
+            i += 1
+            continue
+        if i + 1 >= n:
+            break
+        e = raw[i + 1]
+        if e != "u":
+            out.append(_JSON_ESCAPES.get(e, e))
+            i += 2
+            continue
+        # \uXXXX, possibly the first half of a surrogate pair.
+        width = 12 if raw[i + 2:i + 4].lower() in ("d8", "d9", "da", "db") else 6
+        if i + width > n:
+            break
+        try:
+            out.append(json.loads('"' + raw[i:i + width] + '"'))
+        except ValueError:
+            pass
+        i += width
+    return "".join(out)
+
+
 class ChatService:
     def __init__(self) -> None:
         self._system_prompt = CHAT_SYSTEM_PROMPT
+        self._logger = logging.getLogger(__name__)
 
     def build_messages_payload(self, chat_messages: List[dict]) -> List[dict]:
         messages: List[dict] = [{"role": "system", "text": self._system_prompt}]
@@ -40,16 +87,15 @@ class ChatService:
         done = bool(data.get("done", False))
         return reply_text, done
 
-    async def generate_reply(
+    async def _start_turn(
         self,
         session_id: str,
         text: str,
         sessions_repo: SessionsRepository,
         messages_repo: MessagesRepository,
-    ) -> ChatResponse:
-        print(f"DEBUG: generate_reply called with session_id={session_id}, text='{text}'")
+    ) -> Tuple[str, List[dict]]:
+        """Persist the user message and return (turn timestamp, model payload)."""
         session = await sessions_repo.find_by_id(session_id)
-        print(f"DEBUG: session found: {session is not None}")
         if not session:
             raise ValueError("Session not found")
 
@@ -68,15 +114,21 @@ class ChatService:
         # build last K
         last_msgs = await messages_repo.list_by_session(session_id, limit=40)
         messages = self.build_messages_payload(last_msgs)
-        
-        # Debug logging
-        print(f"DEBUG: last_msgs count: {len(last_msgs)}")
-        print(f"DEBUG: messages to YandexGPT: {messages}")
-        
-        raw = run_structured_completion(messages, self.get_response_schema())
-        print(f"DEBUG: YandexGPT raw response: {raw}")
+        self._logger.debug("Chat: %s turn with %d history messages", session_id, len(last_msgs))
+        return now, messages
+
+    async def _finish_turn(
+        self,
+        session_id: str,
+        now: str,
+        raw: str,
+        usage: Dict[str, Any],
+        sessions_repo: SessionsRepository,
+        messages_repo: MessagesRepository,
+    ) -> ChatResponse:
+        """Persist the assistant message (tokens = the turn's LLM usage) and count usage on the session."""
         reply_text, done = self.parse_model_output(raw)
-        print(f"DEBUG: parsed reply_text: '{reply_text}', done: {done}")
+        self._logger.debug("Chat: %s reply of %d chars, done=%s", session_id, len(reply_text), done)
 
         assistant_msg = Message(
             message_id=now + ":assistant",
@@ -84,11 +136,51 @@ class ChatService:
             role=MessageRole.assistant,
             content=reply_text,
             created_at=now,
-            tokens=None,
+            tokens=usage["total_tokens"],
             done=done,
         )
         await messages_repo.insert_one(assistant_msg.model_dump())
+        await sessions_repo.add_usage(session_id, usage)
 
         return ChatResponse(session_id=session_id, reply=reply_text, done=done)
 
+    async def generate_reply(
+        self,
+        session_id: str,
+        text: str,
+        sessions_repo: SessionsRepository,
+        messages_repo: MessagesRepository,
+    ) -> ChatResponse:
+        now, messages = await self._start_turn(session_id, text, sessions_repo, messages_repo)
+
+        # Dialogue turns are not cached: a repeated turn should get a fresh reply.
+        with llm_priority("chat"), track_usage() as meter:
+            raw = await run_structured_completion_async(messages, self.get_response_schema(), cache=False, site="chat")
+        return await self._finish_turn(session_id, now, raw, meter.summary(), sessions_repo, messages_repo)
+
+    async def stream_reply(
+        self,
+        session_id: str,
+        text: str,
+        sessions_repo: SessionsRepository,
+        messages_repo: MessagesRepository,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Events for one turn: {"delta": str} while the reply is generated, then {"final": ChatResponse}.
+
+        The assistant message (with `done`) is persisted only once the stream has completed.
+        Raises ValueError before the first event if the session does not exist.
+        """
+        now, messages = await self._start_turn(session_id, text, sessions_repo, messages_repo)
+
+        async def events() -> AsyncIterator[Dict[str, Any]]:
+            raw, sent = "", ""
+            with llm_priority("chat"), track_usage() as meter:
+                async for raw in stream_structured_completion_async(messages, self.get_response_schema(), site="chat"):
+                    reply = partial_string_field(raw, REPLY_FIELD)
+                    if len(reply) > len(sent):
+                        yield {"delta": reply[len(sent):]}
+                        sent = reply
+            final = await self._finish_turn(session_id, now, raw, meter.summary(), sessions_repo, messages_repo)
+            yield {"final": final}
 
+        return events()
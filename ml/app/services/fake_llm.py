@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import random
+import re
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.config import get_settings
+from app.services.llm_usage import Usage, estimate_tokens, messages_tokens
+
+
+# Offline stand-in for YandexGPT and the embedding models. Answers are a pure function of the
+# request: structured answers are valid instances of the requested JSON schema, built from words
+# of the prompt, and embeddings are unit vectors seeded by the text hash. Token usage is estimated
+# from text length.
+
+_WORD_RE = re.compile(r"[A-Za-zА-Яа-яЁё][\w+#.-]{2,}")
+_CANDIDATE_RE = re.compile(r"^\s*(\d+):", re.MULTILINE)
+_LIMIT_RE = re.compile(r"(?:до|максимум|не более)\s+(\d+)", re.IGNORECASE)
+_GAP_NAME_RE = re.compile(r"""['"]name['"]:\s*['"]([^'"]+)['"]""")
+_WEEKLY_HOURS_RE = re.compile(r"weekly_hours=(\d+)")
+_FALLBACK_WORDS = ["Python", "SQL", "Docker", "аналитика", "коммуникация", "Kubernetes", "ML", "Git", "английский"]
+
+CHAT_QUESTIONS = [
+    "Расскажите, пожалуйста, о вашем текущем месте работы и должности.",
+    "Какие технологии и инструменты вы используете чаще всего?",
+    "Какие курсы вы проходили и чему научились?",
+    "Кем вы хотите работать через год-два и в каком формате?",
+]
+
+
+def _seed(*parts: Any) -> int:
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return int.from_bytes(hashlib.sha256(raw.encode("utf-8")).digest()[:8], "little")
+
+
+def fake_embed(text: str, dim: int = 256) -> np.ndarray:
+    """Deterministic unit vector derived from the text hash."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    v = np.random.default_rng(seed).standard_normal(dim).astype("float32")
+    return v / (np.linalg.norm(v) + 1e-12)
+
+
+def _user_text(messages: List[Dict[str, str]]) -> str:
+    return "\n".join(str(m.get("text", "")) for m in messages if m.get("role") == "user")
+
+
+def _system_text(messages: List[Dict[str, str]]) -> str:
+    return "\n".join(str(m.get("text", "")) for m in messages if m.get("role") == "system")
+
+
+class SchemaFaker:
+    """Builds an instance of a JSON schema (the subset used by the prompts in this repo)."""
+
+    def __init__(self, rng: random.Random, words: List[str]) -> None:
+        self.rng = rng
+        self.words = words or _FALLBACK_WORDS
+
+    def phrase(self, n: int = 3) -> str:
+        return " ".join(self.rng.choice(self.words) for _ in range(n))
+
+    def value(self, schema: Dict[str, Any], depth: int = 0) -> Any:
+        if "enum" in schema:
+            return self.rng.choice(schema["enum"])
+        kind = schema.get("type", "object" if "properties" in schema else "string")
+        if isinstance(kind, list):
+            kind = next((k for k in kind if k != "null"), "null")
+        if kind == "object":
+            return {k: self.value(v, depth + 1) for k, v in schema.get("properties", {}).items()}
+        if kind == "array":
+            lo = int(schema.get("minItems", 1))
+            hi = int(schema.get("maxItems", 3 if depth == 0 else 2))
+            return [self.value(schema.get("items", {}), depth + 1) for _ in range(self.rng.randint(lo, max(lo, hi)))]
+        if kind == "integer":
+            return self.rng.randint(int(schema.get("minimum", 1)), int(schema.get("maximum", 12)))
+        if kind == "number":
+            return round(self.rng.uniform(float(schema.get("minimum", 0)), float(schema.get("maximum", 10))), 2)
+        if kind == "boolean":
+            return self.rng.random() < 0.5
+        if kind == "null":
+            return None
+        return self.phrase(self.rng.randint(1, 4))
+
+
+class FakeBackend:
+    name = "fake"
+
+    def _sleep(self, scale: float = 1.0) -> None:
+        settings = get_settings()
+        median = settings.fake_llm_latency_seconds * scale
+        dist = settings.fake_llm_latency_dist
+        if dist == "none" or median <= 0:
+            return
+        if dist == "constant":
+            delay = median
+        elif dist == "uniform":
+            delay = random.uniform(0.0, 2.0 * median)
+        elif dist == "lognormal":
+            delay = median * float(np.random.lognormal(0.0, settings.fake_llm_latency_sigma))
+        else:
+            raise ValueError(f"Unknown FAKE_LLM_LATENCY_DIST: {dist}")
+        time.sleep(delay)
+
+    def _answer(self, messages: List[Dict[str, str]], json_schema: Dict[str, Any]) -> Any:
+        schema = json_schema.get("json_schema", json_schema)
+        user, system = _user_text(messages), _system_text(messages)
+        rng = random.Random(_seed(messages, schema))
+        faker = SchemaFaker(rng, _WORD_RE.findall(user)[:200])
+        props = schema.get("properties", {})
+
+        if schema.get("title") == "PickN":
+            ids = [int(x) for x in dict.fromkeys(_CANDIDATE_RE.findall(user))]
+            rng.shuffle(ids)
+            limit = _LIMIT_RE.search(system)
+            return {"selected": ids[: int(limit.group(1))] if limit else ids}
+        if "answer_to_user2" in props:
+            turns = sum(1 for m in messages if m.get("role") == "user")
+            done = turns >= get_settings().fake_chat_turns
+            reply = "Спасибо, информации достаточно." if done else CHAT_QUESTIONS[(turns - 1) % len(CHAT_QUESTIONS)]
+            return {"answer_to_user2": reply, "done": done}
+        if schema.get("title") == "GapGroups":
+            names = list(dict.fromkeys(_GAP_NAME_RE.findall(user)))
+            hours = _WEEKLY_HOURS_RE.search(user)
+            return [
+                {
+                    "group_id": i + 1,
+                    "title": f"Этап {i + 1}",
+                    "estimated_months": 1 + i,
+                    "hours_per_week": int(hours.group(1)) if hours else 10,
+                    "items": names[a:a + 2],
+                    "notes": faker.phrase(),
+                }
+                for i, a in enumerate(range(0, len(names), 2))
+            ]
+        return faker.value(schema)
+
+    def structured(
+        self,
+        messages: List[Dict[str, str]],
+        json_schema: Dict[str, Any],
+        model_name: str,
+        model_version: str,
+        max_tokens: Optional[int],
+    ) -> Tuple[str, Usage]:
+        self._sleep()
+        text = json.dumps(self._answer(messages, json_schema), ensure_ascii=False)
+        return text, Usage(messages_tokens(messages), estimate_tokens(text))
+
+    def text(self, messages: List[Dict[str, str]], model_name: str, model_version: str) -> Tuple[str, Usage]:
+        self._sleep()
+        text = " ".join(_WORD_RE.findall(_user_text(messages))[:80])
+        return text, Usage(messages_tokens(messages), estimate_tokens(text))
+
+    def stream(
+        self,
+        messages: List[Dict[str, str]],
+        json_schema: Dict[str, Any],
+        model_name: str,
+        model_version: str,
+        max_tokens: Optional[int],
+    ) -> Iterator[Tuple[str, Usage]]:
+        full = json.dumps(self._answer(messages, json_schema), ensure_ascii=False)
+        prompt_tokens = messages_tokens(messages)
+        step = max(1, len(full) // 8)
+        for end in range(step, len(full) + step, step):
+            self._sleep(1 / 8)
+            yield full[:end], Usage(prompt_tokens, estimate_tokens(full[:end]))
+
+    def embed(self, text: str, model_kind: str) -> Tuple[np.ndarray, Usage]:
+        self._sleep(get_settings().fake_embed_latency_scale)
+        # Same vector for query and doc kinds, so a query equal to a document text finds it.
+        return fake_embed(text, get_settings().fake_embed_dim), Usage(estimate_tokens(text))
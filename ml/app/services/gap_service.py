@@ -7,7 +7,7 @@ from typing import List, Dict, Any
 
 from app.models.schemas import UserProfile
 from app.models.trajectory_models import GapItem
-from app.services.yandex_sdk import run_structured_completion
+from app.services.yandex_sdk import run_structured_completion_async
 from app.prompts import GAP_ANALYSIS_SYSTEM_PROMPT, GAP_ANALYSIS_USER_INSTRUCTIONS
 
 
@@ -42,6 +42,13 @@ GAP_SCHEMA = {
 }
 
 
+def _loads(raw: str) -> Any:
+    try:
+        return json.loads(raw)
+    except (TypeError, ValueError):
+        return None
+
+
 class GapService:
     def __init__(self) -> None:
         self._logger = logging.getLogger(__name__)
@@ -59,16 +66,20 @@ class GapService:
             {"role": "user", "text": f"Профиль:\n{profile_text}\n\nБудущие вакансии:\n{future_block}\n\n{user_text}"},
         ]
 
-    def extract_gaps(self, profile: UserProfile, future_vacancies: List[Dict[str, Any]], limit: int = 10) -> List[GapItem]:
+    async def extract_gaps(self, profile: UserProfile, future_vacancies: List[Dict[str, Any]], limit: int = 10) -> List[GapItem]:
         messages = self.build_prompt(profile, future_vacancies, limit=limit)
         t0 = time.perf_counter()
-        raw = run_structured_completion(messages, GAP_SCHEMA)
+        # A malformed answer is retried and then raised: an empty gap list would pass for "no gaps".
+        raw = await run_structured_completion_async(
+            messages,
+            GAP_SCHEMA,
+            site="gaps",
+            cacheable=lambda r: isinstance(_loads(r), list),
+            require_valid=True,
+        )
         t1 = time.perf_counter()
         self._logger.info("Gaps: llm extraction took %.3fs", (t1 - t0))
-        try:
-            data = json.loads(raw)
-        except Exception:
-            data = []
+        data = json.loads(raw)
         gaps: List[GapItem] = []
         for g in data:
             try:
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import asyncio
+import io
+import logging
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Literal
+
+import numpy as np
+import polars as pl
+
+from app.config import get_settings
+from app.models.ingest_models import IngestResponse
+from app.repos.match_repos import CoursesRepository, VacanciesRepository
+from app.services.llm_scheduler import llm_priority
+from app.services.yandex_sdk import embed_text_async
+from app.startup import seed_courses, seed_vacancies
+from app.startup.duplicates import COURSE_DUP_KEY, DUP_FIELD, VACANCY_DUP_KEY, dup_key
+from app.startup.load_embeddings import CorpusIndex, course_index, vacancy_index
+
+
+Corpus = Literal["vacancies", "courses"]
+
+
+def vacancy_doc_text(d: Dict[str, Any]) -> str:
+    parts = [d.get("title"), d.get("key_skills"), d.get("description")]
+    return "\n".join(str(p) for p in parts if p)
+
+
+def course_doc_text(d: Dict[str, Any]) -> str:
+    if d.get("summary"):
+        return str(d["summary"])
+    parts = [d.get("Course Name"), d.get("Skills"), d.get("Course Description")]
+    return "\n".join(str(p) for p in parts if p)
+
+
+_CORPORA: Dict[
+    str,
+    tuple[Callable[[pl.DataFrame], pl.DataFrame], Callable[[Dict[str, Any]], str], CorpusIndex, tuple[str, ...]],
+] = {
+    "vacancies": (seed_vacancies.normalize_frame, vacancy_doc_text, vacancy_index, VACANCY_DUP_KEY),
+    "courses": (seed_courses.normalize_frame, course_doc_text, course_index, COURSE_DUP_KEY),
+}
+
+# One ingestion per corpus at a time; searches never wait on these.
+_INGEST_LOCKS: Dict[str, asyncio.Lock] = {name: asyncio.Lock() for name in _CORPORA}
+
+
+def read_delta(content: bytes, filename: str) -> pl.DataFrame:
+    name = filename.lower()
+    if name.endswith(".parquet"):
+        return pl.read_parquet(io.BytesIO(content))
+    if name.endswith((".ndjson", ".jsonl")):
+        return pl.read_ndjson(io.BytesIO(content))
+    raise ValueError("Unsupported delta format: expected .parquet or .ndjson")
+
+
+class IngestService:
+    def __init__(self) -> None:
+        self._logger = logging.getLogger(__name__)
+
+    async def embed_documents(self, texts: List[str]) -> np.ndarray:
+        sem = asyncio.Semaphore(max(1, get_settings().ingest_embed_concurrency))
+
+        async def one(text: str) -> np.ndarray:
+            async with sem:
+                # One-off catalog texts would only evict cached queries.
+                with llm_priority("batch"):
+                    return await embed_text_async(text, "doc", cache=False)
+
+        vectors = await asyncio.gather(*(one(t) for t in texts))
+        return np.vstack(vectors).astype("float32")
+
+    async def assign_clusters(
+        self,
+        docs: List[Dict[str, Any]],
+        key_columns: tuple[str, ...],
+        repo: VacanciesRepository | CoursesRepository,
+    ) -> None:
+        """Set `dup_of` on every doc: an existing cluster's representative, else the smallest idx in the batch."""
+        batch: Dict[tuple[str, ...], List[Dict[str, Any]]] = {}
+        for d in docs:
+            batch.setdefault(dup_key(d, key_columns), []).append(d)
+        for key, group in batch.items():
+            rep = await repo.find_representative(dict(zip(key_columns, key)))
+            if rep is None:
+                rep = min(int(d["idx"]) for d in group)
+            for d in group:
+                d[DUP_FIELD] = rep
+
+    async def ingest(
+        self,
+        corpus: Corpus,
+        df: pl.DataFrame,
+        repo: VacanciesRepository | CoursesRepository,
+    ) -> IngestResponse:
+        normalize, doc_text, index, key_columns = _CORPORA[corpus]
+        received = df.height
+        docs = [
+            {k: (None if v == "" else v) for k, v in row.items()}
+            for row in normalize(df).to_dicts()
+        ]
+
+        async with _INGEST_LOCKS[corpus]:
+            next_idx = await repo.max_idx() + 1
+            # Rows that came with an idx may replace an already indexed item.
+            existing = {int(d["idx"]) for d in docs if d.get("idx") is not None}
+            for d in docs:
+                if d.get("idx") is None:
+                    d["idx"] = next_idx
+                    next_idx += 1
+
+            await self.assign_clusters(docs, key_columns, repo)
+            reps = [d for d in docs if d[DUP_FIELD] == d["idx"]]
+            # Reposts of an indexed item are stored in Mongo only; their vectors would just crowd out distinct results.
+            to_embed = [d for d in reps if doc_text(d)]
+            t0 = time.perf_counter()
+            vectors = await self.embed_documents([doc_text(d) for d in to_embed]) if to_embed else None
+            t1 = time.perf_counter()
+            self._logger.info("Ingest: embedded %d %s took %.3fs", len(to_embed), corpus, (t1 - t0))
+
+            # Mongo first, so the index never returns an idx that cannot be fetched.
+            upserted = await repo.upsert_many(docs)
+            if index.filters is not None:
+                index.filters = index.filters.with_rows(docs)
+            if index.keywords is not None:
+                index.keywords = await asyncio.to_thread(index.keywords.with_docs, reps)
+            reposted = [int(d["idx"]) for d in docs if d[DUP_FIELD] != d["idx"] and int(d["idx"]) in existing]
+            if reposted:
+                # Re-ingested rows that became reposts drop out of search (tombstoned in the store).
+                await asyncio.to_thread(index.remove, reposted)
+
+            if vectors is not None:
+                ids = np.asarray([int(d["idx"]) for d in to_embed], dtype=np.int64)
+                source = f"ingest:{datetime.utcnow().isoformat()}"
+                t0 = time.perf_counter()
+                await asyncio.to_thread(index.append, ids, vectors, source)
+                t1 = time.perf_counter()
+                self._logger.info("Ingest: index append for %s took %.3fs", corpus, (t1 - t0))
+
+        return IngestResponse(
+            corpus=corpus,
+            received=received,
+            upserted=upserted,
+            embedded=len(to_embed),
+            duplicates=len(docs) - len(reps),
+            index_total=int(index.index.ntotal) if index.index is not None else 0,
+        )
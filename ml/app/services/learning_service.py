@@ -1,15 +1,18 @@
 from __future__ import annotations
 
+import asyncio
+import json
 import logging
 import time
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 from app.models.trajectory_models import GapItem, RecommendationItem
 from app.repos.match_repos import CoursesRepository
 from app.services.match_service import MatchService
 from app.models.match_models import MatchCoursesRequest
-from app.services.yandex_sdk import run_structured_completion
-from app.prompts import RECS_SYSTEM_PROMPT, RECS_USER_INSTRUCTIONS
+from app.services.yandex_sdk import run_structured_completion_async
+from app.config import get_settings
+from app.prompts import RECS_BATCH_USER_INSTRUCTIONS, RECS_SYSTEM_PROMPT, RECS_USER_INSTRUCTIONS
 
 
 RECS_SCHEMA = {
@@ -44,39 +47,58 @@ RECS_SCHEMA = {
 }
 
 
+def recs_batch_schema(gap_names: List[str]) -> Dict[str, Any]:
+    """RECS_SCHEMA for several gaps at once: an object keyed by gap name."""
+    return {
+        "title": "RecommendationsByGap",
+        "description": "Рекомендации (проекты и советы) для каждого gap; ключ — название gap.",
+        "type": "object",
+        "properties": {
+            name: {"type": "array", "description": f"Рекомендации для gap: {name}", "items": RECS_SCHEMA["items"]}
+            for name in gap_names
+        },
+        "required": list(gap_names),
+    }
+
+
 class LearningService:
     def __init__(self) -> None:
         self._match = MatchService()
         self._logger = logging.getLogger(__name__)
 
-    async def enrich_with_courses(
+    async def courses_for_gaps(
         self,
         gaps: List[GapItem],
         courses_repo: CoursesRepository,
         k: int = 5,
         field: Optional[str] = None,
         specialization: Optional[str] = None,
-    ) -> None:
-        for gap in gaps:
-            query = f"{gap.name} ({gap.kind})"
-            try:
-                t0 = time.perf_counter()
-                req = MatchCoursesRequest(
-                    desired_skills=query,
-                    field=field,
-                    specialization=specialization,
-                    k_faiss=100,
-                    k_stage1=min(20, k * 3),
-                    k_stage2=k,
-                )
-                resp = await self._match.match_courses(req, courses_repo)
-                courses = resp.result[:k]
-                t1 = time.perf_counter()
-                self._logger.info("Learning: courses for '%s' took %.3fs (k=%d)", gap.name, (t1 - t0), len(courses))
-            except Exception:
+    ) -> List[List[RecommendationItem]]:
+        """Course recommendations per gap (same order); a failed gap gets none."""
+        reqs = [
+            MatchCoursesRequest(
+                desired_skills=f"{gap.name} ({gap.kind})",
+                field=field,
+                specialization=specialization,
+                k_faiss=100,
+                k_stage1=min(20, k * 3),
+                k_stage2=k,
+            )
+            for gap in gaps
+        ]
+        t0 = time.perf_counter()
+        results = await self._match.match_courses_many(reqs, courses_repo)
+        t1 = time.perf_counter()
+        self._logger.info("Learning: courses for %d gaps took %.3fs", len(gaps), (t1 - t0))
+        out: List[List[RecommendationItem]] = []
+        for gap, resp in zip(gaps, results):
+            if isinstance(resp, Exception):
+                self._logger.warning("Learning: courses for '%s' failed: %s", gap.name, resp)
                 courses = []
-            for c in courses:
-                gap.recommendations.append(
+            else:
+                courses = resp.result[:k]
+            out.append(
+                [
                     RecommendationItem(
                         type="course",
                         title=c.name or "",
@@ -86,41 +108,108 @@ class LearningService:
                         expected_outcomes=None,
                         required=False,
                     )
-                )
+                    for c in courses
+                ]
+            )
+        return out
 
-    async def enrich_with_projects_and_tips(self, gaps: List[GapItem], limit: int = 2) -> None:
-        for gap in gaps:
-            user_text = RECS_USER_INSTRUCTIONS + f"\nВерни не более {int(limit)} элементов."
-            messages = [
-                {"role": "system", "text": RECS_SYSTEM_PROMPT},
-                {"role": "user", "text": f"Gap: {gap.name} ({gap.kind}). {user_text}"},
-            ]
-            try:
-                t0 = time.perf_counter()
-                raw = run_structured_completion(messages, RECS_SCHEMA)
-                import json
+    async def enrich_with_courses(
+        self,
+        gaps: List[GapItem],
+        courses_repo: CoursesRepository,
+        k: int = 5,
+        field: Optional[str] = None,
+        specialization: Optional[str] = None,
+    ) -> None:
+        courses = await self.courses_for_gaps(gaps, courses_repo, k=k, field=field, specialization=specialization)
+        for gap, items in zip(gaps, courses):
+            gap.recommendations.extend(items)
 
-                data = json.loads(raw)
-                t1 = time.perf_counter()
-                self._logger.info("Learning: llm recs for '%s' took %.3fs (n=%d)", gap.name, (t1 - t0), len(data))
-            except Exception:
-                data = []
-            for r in data[: int(limit)]:
-                try:
-                    gap.recommendations.append(
-                        RecommendationItem(
-                            type=r.get("type", "tip"),
-                            title=r.get("title", ""),
-                            url=r.get("url"),
-                            provider=r.get("provider"),
-                            duration_hours=r.get("duration_hours"),
-                            estimated_months=r.get("estimated_months"),
-                            expected_outcomes=r.get("expected_outcomes"),
-                            cost=r.get("cost"),
-                            required=bool(r.get("required", False)),
-                        )
+    async def _projects_and_tips(self, gap: GapItem, limit: int) -> List[RecommendationItem]:
+        user_text = RECS_USER_INSTRUCTIONS + f"\nВерни не более {int(limit)} элементов."
+        messages = [
+            {"role": "system", "text": RECS_SYSTEM_PROMPT},
+            {"role": "user", "text": f"Gap: {gap.name} ({gap.kind}). {user_text}"},
+        ]
+        try:
+            t0 = time.perf_counter()
+            raw = await run_structured_completion_async(messages, RECS_SCHEMA, site="recs")
+            data = json.loads(raw)
+            t1 = time.perf_counter()
+            self._logger.info("Learning: llm recs for '%s' took %.3fs (n=%d)", gap.name, (t1 - t0), len(data))
+        except Exception:
+            data = []
+        return self._to_items(data, limit)
+
+    def _to_items(self, data: Any, limit: int) -> List[RecommendationItem]:
+        items: List[RecommendationItem] = []
+        if not isinstance(data, list):
+            return items
+        for r in data[: int(limit)]:
+            try:
+                items.append(
+                    RecommendationItem(
+                        type=r.get("type", "tip"),
+                        title=r.get("title", ""),
+                        url=r.get("url"),
+                        provider=r.get("provider"),
+                        duration_hours=r.get("duration_hours"),
+                        estimated_months=r.get("estimated_months"),
+                        expected_outcomes=r.get("expected_outcomes"),
+                        cost=r.get("cost"),
+                        required=bool(r.get("required", False)),
                     )
-                except Exception:
-                    continue
+                )
+            except Exception:
+                continue
+        return items
+
+    async def _projects_and_tips_batch(self, gaps: List[GapItem], limit: int) -> Dict[str, List[RecommendationItem]]:
+        """One call for all gaps; only gaps with a non-empty answer are in the result."""
+        names = list(dict.fromkeys(gap.name for gap in gaps))
+        listing = "\n".join(f"- {gap.name} ({gap.kind})" for gap in gaps)
+        user_text = RECS_BATCH_USER_INSTRUCTIONS + f"\nДля каждого gap верни не более {int(limit)} элементов."
+        messages = [
+            {"role": "system", "text": RECS_SYSTEM_PROMPT},
+            {"role": "user", "text": f"Gaps:\n{listing}\n\n{user_text}"},
+        ]
+        try:
+            t0 = time.perf_counter()
+            raw = await run_structured_completion_async(
+                messages, recs_batch_schema(names), max_tokens=min(8000, 1000 * len(names)), site="recs_batch"
+            )
+            data = json.loads(raw)
+            t1 = time.perf_counter()
+            self._logger.info("Learning: batched llm recs for %d gaps took %.3fs", len(names), (t1 - t0))
+        except Exception as e:
+            self._logger.warning("Learning: batched llm recs failed: %s", e)
+            return {}
+        if not isinstance(data, dict):
+            return {}
+        out: Dict[str, List[RecommendationItem]] = {}
+        for name in names:
+            items = self._to_items(data.get(name), limit)
+            if items:
+                out[name] = items
+        return out
 
+    async def projects_and_tips_for_gaps(self, gaps: List[GapItem], limit: int = 2) -> List[List[RecommendationItem]]:
+        """LLM project/tip recommendations per gap (same order).
 
+        With RECS_BATCH, one call covers all gaps and only gaps missing from its answer get a
+        call of their own; otherwise every gap gets its own call. Per-gap calls run concurrently.
+        """
+        batched: Dict[str, List[RecommendationItem]] = {}
+        if get_settings().recs_batch and len(gaps) > 1:
+            batched = await self._projects_and_tips_batch(gaps, limit)
+        missing = [gap for gap in gaps if gap.name not in batched]
+        if batched and missing:
+            self._logger.info("Learning: %d gaps missing from batched recs, asking per gap", len(missing))
+        fallback = await asyncio.gather(*(self._projects_and_tips(gap, limit) for gap in missing))
+        by_name = {**batched, **{gap.name: items for gap, items in zip(missing, fallback)}}
+        return [list(by_name[gap.name]) for gap in gaps]
+
+    async def enrich_with_projects_and_tips(self, gaps: List[GapItem], limit: int = 2) -> None:
+        recs = await self.projects_and_tips_for_gaps(gaps, limit=limit)
+        for gap, items in zip(gaps, recs):
+            gap.recommendations.extend(items)
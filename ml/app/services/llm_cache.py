@@ -0,0 +1,247 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from bson import Binary
+
+from app.config import get_settings
+from app.db.mongo import get_db
+
+
+CACHE_COLLECTION = "llm_cache"
+EMBEDDING_COLLECTION = "embedding_cache"
+
+logger = logging.getLogger(__name__)
+
+# Result a cancelled leader leaves for the callers waiting on its key: call again.
+_RETRY = object()
+
+
+def cache_key(
+    kind: str,
+    model_name: str,
+    model_version: str,
+    messages: List[Dict[str, str]],
+    json_schema: Optional[Dict[str, Any]] = None,
+    max_tokens: Optional[int] = None,
+) -> str:
+    """Content address of one completion: identical inputs give the identical key."""
+    payload = {
+        "kind": kind,
+        "model": model_name,
+        "version": model_version,
+        "messages": messages,
+        "schema": json_schema,
+        "max_tokens": max_tokens,
+    }
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class TieredCache:
+    """Two-tier cache: an in-process LRU in front of a Mongo collection shared by workers.
+
+    Limits come from the `<prefix>_max_entries`, `<prefix>_ttl_seconds` and
+    `<prefix>_mongo_ttl_seconds` settings. Concurrent requests for the same key share one
+    upstream call; if its caller is cancelled, one of the waiting callers makes the call instead.
+    Subclasses define how values are stored in Mongo.
+    """
+
+    def __init__(self, collection: str, settings_prefix: str) -> None:
+        self.collection = collection
+        self.settings_prefix = settings_prefix
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[str, "asyncio.Future[Any]"] = {}
+        self._stats: Dict[str, int] = {
+            "memory_hits": 0,
+            "mongo_hits": 0,
+            "misses": 0,
+            "shared_inflight": 0,
+            "stores": 0,
+            "uncacheable": 0,
+            "mongo_errors": 0,
+        }
+
+    def _setting(self, name: str) -> Any:
+        return getattr(get_settings(), f"{self.settings_prefix}_{name}")
+
+    def _encode(self, value: Any) -> Dict[str, Any]:
+        return {"value": value}
+
+    def _decode(self, doc: Dict[str, Any]) -> Any:
+        return doc["value"]
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def _memory_get(self, key: str) -> Any:
+        with self._lock:
+            item = self._memory.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return value
+
+    def _memory_put(self, key: str, value: Any) -> None:
+        ttl = float(self._setting("ttl_seconds"))
+        max_entries = max(0, int(self._setting("max_entries")))
+        with self._lock:
+            self._memory[key] = (time.monotonic() + ttl, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > max_entries:
+                self._memory.popitem(last=False)
+
+    async def _mongo_get(self, key: str) -> Any:
+        if self._setting("mongo_ttl_seconds") <= 0:
+            return None
+        try:
+            db = await get_db()
+            doc = await db[self.collection].find_one({"_id": key, "expires_at": {"$gt": datetime.utcnow()}})
+            return self._decode(doc) if doc else None
+        except Exception as e:
+            self._count("mongo_errors")
+            logger.debug("%s: mongo read failed: %s", type(self).__name__, e)
+            return None
+
+    async def _mongo_put(self, key: str, value: Any, meta: Dict[str, Any]) -> None:
+        ttl = self._setting("mongo_ttl_seconds")
+        if ttl <= 0:
+            return
+        now = datetime.utcnow()
+        doc = {**self._encode(value), "created_at": now, "expires_at": now + timedelta(seconds=ttl), **meta}
+        try:
+            db = await get_db()
+            await db[self.collection].update_one({"_id": key}, {"$set": doc}, upsert=True)
+        except Exception as e:
+            self._count("mongo_errors")
+            logger.debug("%s: mongo write failed: %s", type(self).__name__, e)
+
+    async def get(self, key: str) -> Any:
+        value = self._memory_get(key)
+        if value is not None:
+            self._count("memory_hits")
+            return value
+        value = await self._mongo_get(key)
+        if value is not None:
+            self._count("mongo_hits")
+            self._memory_put(key, value)
+        return value
+
+    async def put(self, key: str, value: Any, meta: Optional[Dict[str, Any]] = None) -> None:
+        self._memory_put(key, value)
+        await self._mongo_put(key, value, meta or {})
+        self._count("stores")
+
+    async def get_or_call(
+        self,
+        key: str,
+        call: Callable[[], Awaitable[Any]],
+        meta: Optional[Dict[str, Any]] = None,
+        cacheable: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        """Cached value of `key`, else the result of call(), stored only if `cacheable` accepts it."""
+        value = await self.get(key)
+        if value is not None:
+            return value
+
+        while True:
+            pending = self._inflight.get(key)
+            if pending is None:
+                break
+            self._count("shared_inflight")
+            value = await asyncio.shield(pending)
+            if value is not _RETRY:
+                return value
+
+        self._count("misses")
+        future: "asyncio.Future[Any]" = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await call()
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody may be waiting; mark the exception as retrieved.
+            future.exception()
+            raise
+        except BaseException:
+            # Cancellation belongs to this caller only: the waiters retry and one of them leads.
+            future.set_result(_RETRY)
+            raise
+        else:
+            future.set_result(value)
+        finally:
+            self._inflight.pop(key, None)
+        if cacheable is not None and not cacheable(value):
+            self._count("uncacheable")
+            logger.warning("%s: response for %s not cached: rejected by its validator", type(self).__name__, key[:12])
+            return value
+        await self.put(key, value, meta)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            out["memory_entries"] = len(self._memory)
+        hits = out["memory_hits"] + out["mongo_hits"] + out["shared_inflight"]
+        lookups = hits + out["misses"]
+        out["hit_rate"] = round(hits / lookups, 4) if lookups else 0.0
+        return out
+
+
+class LLMCache(TieredCache):
+    """LLM response texts, keyed by cache_key."""
+
+    def __init__(self, collection: str = CACHE_COLLECTION) -> None:
+        super().__init__(collection, "llm_cache")
+
+
+class EmbeddingCache(TieredCache):
+    """Embedding vectors keyed by (model_kind, normalized text); Mongo keeps them as float16 bytes."""
+
+    def __init__(self, collection: str = EMBEDDING_COLLECTION) -> None:
+        super().__init__(collection, "embed_cache")
+
+    @staticmethod
+    def key(text: str, model_kind: str) -> str:
+        normalized = unicodedata.normalize("NFC", " ".join(text.split()))
+        return hashlib.sha256(f"{model_kind}\x00{normalized}".encode("utf-8")).hexdigest()
+
+    def _encode(self, value: np.ndarray) -> Dict[str, Any]:
+        return {"vector": Binary(np.asarray(value, dtype="<f2").tobytes()), "dim": int(value.shape[0])}
+
+    def _decode(self, doc: Dict[str, Any]) -> np.ndarray:
+        return np.frombuffer(bytes(doc["vector"]), dtype="<f2").astype("float32")
+
+    async def get_or_call(
+        self,
+        key: str,
+        call: Callable[[], Awaitable[Any]],
+        meta: Optional[Dict[str, Any]] = None,
+        cacheable: Optional[Callable[[Any], bool]] = None,
+    ) -> np.ndarray:
+        # Callers may normalize in place; never hand out the cached array itself.
+        return np.array(await super().get_or_call(key, call, meta, cacheable), dtype="float32")
+
+
+llm_cache = LLMCache()
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+import asyncio
+import collections
+import contextvars
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass, fields, replace
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+import grpc
+import numpy as np
+
+from yandex_cloud_ml_sdk.exceptions import AioRpcError
+
+from app.config import get_settings
+
+
+T = TypeVar("T")
+
+RETRYABLE_CODES = {
+    grpc.StatusCode.UNAVAILABLE,
+    grpc.StatusCode.DEADLINE_EXCEEDED,
+    grpc.StatusCode.RESOURCE_EXHAUSTED,
+    grpc.StatusCode.ABORTED,
+    grpc.StatusCode.INTERNAL,
+    grpc.StatusCode.UNKNOWN,
+}
+
+# Built-in per-site overrides; LLM_CALL_POLICIES (JSON, same shape) takes precedence.
+SITE_DEFAULTS: Dict[str, Dict[str, Any]] = {
+    # The whole transcript with max_tokens=8000: slow by nature.
+    "profile": {"timeout": 120.0},
+    # Projects/tips for all gaps in one answer.
+    "recs_batch": {"timeout": 90.0},
+    # Cheap and on the interactive path; a duplicate costs little.
+    "embed_query": {"timeout": 10.0, "hedge": True},
+    "embed_doc": {"timeout": 20.0},
+}
+
+LATENCY_WINDOW = 200
+
+logger = logging.getLogger(__name__)
+
+# time.monotonic() by which the running attempt must finish; backends hand the rest to the SDK.
+_attempt_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "llm_attempt_deadline", default=None
+)
+
+
+class InvalidLLMResponse(RuntimeError):
+    """The model answered, but not in the shape the call site requires; retried like a transient error."""
+
+
+def remaining_timeout() -> Optional[float]:
+    """Seconds left for the current attempt, or None outside call_with_policy."""
+    deadline = _attempt_deadline.get()
+    return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+
+@dataclass(frozen=True)
+class CallPolicy:
+    timeout: float
+    retries: int
+    backoff_base: float
+    backoff_max: float
+    hedge: bool
+    deadline: Optional[float] = None
+
+    def backoff(self, attempt: int) -> float:
+        # Full jitter keeps retries of a burst from arriving together.
+        return random.uniform(0.0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+
+def policy_for(site: str) -> CallPolicy:
+    settings = get_settings()
+    policy = CallPolicy(
+        timeout=settings.llm_timeout_seconds,
+        retries=settings.llm_retries,
+        backoff_base=settings.llm_backoff_base_seconds,
+        backoff_max=settings.llm_backoff_max_seconds,
+        hedge=settings.llm_hedge,
+    )
+    names = {f.name for f in fields(CallPolicy)}
+    for overrides in (SITE_DEFAULTS.get(site), settings.llm_call_policies.get(site)):
+        if overrides:
+            policy = replace(policy, **{k: v for k, v in overrides.items() if k in names})
+    return policy
+
+
+def is_retryable(e: BaseException) -> bool:
+    if isinstance(e, AioRpcError):
+        return e.code() in RETRYABLE_CODES
+    return isinstance(e, (asyncio.TimeoutError, TimeoutError, ConnectionError, InvalidLLMResponse))
+
+
+class CallStats:
+    """Per call site counters and a window of successful attempt latencies (for the hedge delay)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._latency: Dict[str, Deque[float]] = collections.defaultdict(
+            lambda: collections.deque(maxlen=LATENCY_WINDOW)
+        )
+        self._counts: Dict[str, Dict[str, int]] = collections.defaultdict(
+            lambda: dict.fromkeys(("calls", "attempts", "retries", "timeouts", "hedges", "hedge_wins", "failures"), 0)
+        )
+
+    def count(self, site: str, name: str) -> None:
+        with self._lock:
+            self._counts[site][name] += 1
+
+    def observe(self, site: str, seconds: float) -> None:
+        with self._lock:
+            self._latency[site].append(seconds)
+
+    def quantile(self, site: str, q: float) -> Optional[float]:
+        with self._lock:
+            window = list(self._latency[site])
+        if len(window) < max(1, get_settings().llm_hedge_min_samples):
+            return None
+        return float(np.quantile(window, q))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sites = set(self._counts) | set(self._latency)
+            out: Dict[str, Any] = {}
+            for site in sorted(sites):
+                window = list(self._latency[site])
+                out[site] = {
+                    **self._counts[site],
+                    "p50_seconds": round(float(np.quantile(window, 0.5)), 3) if window else None,
+                    "p95_seconds": round(float(np.quantile(window, 0.95)), 3) if window else None,
+                }
+            return out
+
+
+call_stats = CallStats()
+
+
+async def _attempt(site: str, policy: CallPolicy, call: Callable[[], Awaitable[T]], timeout: float) -> T:
+    """One attempt; with hedging, a duplicate is started if the first is slower than the site's p95."""
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    hedge_after = call_stats.quantile(site, get_settings().llm_hedge_quantile) if policy.hedge else None
+    # Tasks copy the context when created, so both the first call and a hedge see the deadline.
+    token = _attempt_deadline.set(time.monotonic() + timeout)
+    first = asyncio.ensure_future(call())
+    tasks = {first}
+    try:
+        if hedge_after is None or hedge_after >= timeout:
+            # Not wait_for: it would wait for the cancelled call, which only ends when its thread does.
+            done, _ = await asyncio.wait(tasks, timeout=timeout)
+            if not done:
+                raise asyncio.TimeoutError()
+            result = first.result()
+            call_stats.observe(site, loop.time() - started)
+            return result
+
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if not done:
+            call_stats.count(site, "hedges")
+            tasks.add(asyncio.ensure_future(call()))
+        deadline = started + timeout
+        last: Optional[BaseException] = None
+        while tasks:
+            done, tasks = await asyncio.wait(
+                tasks, timeout=max(0.0, deadline - loop.time()), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                raise asyncio.TimeoutError()
+            for t in done:
+                if t.exception() is None:
+                    if t is not first:
+                        call_stats.count(site, "hedge_wins")
+                    call_stats.observe(site, loop.time() - started)
+                    return t.result()
+                last = t.exception()
+        assert last is not None
+        raise last
+    finally:
+        _attempt_deadline.reset(token)
+        for t in tasks:
+            t.cancel()
+
+
+async def call_with_policy(site: str, call: Callable[[], Awaitable[T]], policy: Optional[CallPolicy] = None) -> T:
+    """Run call() under the site's timeout, retry and hedging policy."""
+    policy = policy or policy_for(site)
+    loop = asyncio.get_running_loop()
+    budget_end = loop.time() + policy.deadline if policy.deadline else None
+    call_stats.count(site, "calls")
+    attempt = 0
+    while True:
+        timeout = policy.timeout
+        if budget_end is not None:
+            timeout = min(timeout, budget_end - loop.time())
+        call_stats.count(site, "attempts")
+        try:
+            return await _attempt(site, policy, call, max(timeout, 0.0))
+        except Exception as e:
+            if isinstance(e, (asyncio.TimeoutError, TimeoutError)):
+                call_stats.count(site, "timeouts")
+            delay = policy.backoff(attempt)
+            out_of_time = budget_end is not None and loop.time() + delay >= budget_end
+            if attempt >= policy.retries or not is_retryable(e) or out_of_time:
+                call_stats.count(site, "failures")
+                raise
+            attempt += 1
+            call_stats.count(site, "retries")
+            logger.warning("LLM call %s failed (%r), retry %d/%d in %.2fs", site, e, attempt, policy.retries, delay)
+            await asyncio.sleep(delay)
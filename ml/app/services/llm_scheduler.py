@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from app.config import get_settings
+
+
+# Lower value is served first when the API quota is the bottleneck.
+PRIORITIES: Dict[str, int] = {"chat": 0, "match": 1, "trajectory": 2, "batch": 3}
+DEFAULT_PRIORITY = "match"
+
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar("llm_priority", default=DEFAULT_PRIORITY)
+
+
+@contextlib.contextmanager
+def llm_priority(name: str) -> Iterator[None]:
+    """Run the LLM calls made in this block (and tasks it spawns) under priority class `name`."""
+    if name not in PRIORITIES:
+        raise ValueError(f"Unknown LLM priority: {name}")
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+def _class_limit(name: str) -> int:
+    return max(1, int(getattr(get_settings(), f"llm_concurrency_{name}")))
+
+
+class LLMScheduler:
+    """Admits outbound LLM calls through a token bucket, highest priority class first.
+
+    At most LLM_MAX_CONCURRENCY calls run at once and at most LLM_CONCURRENCY_<CLASS> of one
+    class; LLM_RATE_PER_SECOND (burst LLM_RATE_BURST) bounds how fast calls start. Waiting
+    calls of a capped class do not block lower classes.
+    """
+
+    def __init__(self) -> None:
+        self._waiters: List[Tuple[int, int, str, "asyncio.Future[None]"]] = []
+        self._seq = itertools.count()
+        self._running: Dict[str, int] = {name: 0 for name in PRIORITIES}
+        self._tokens: Optional[float] = None
+        self._refilled_at = time.monotonic()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._stats: Dict[str, Dict[str, float]] = {
+            name: {"admitted": 0, "wait_seconds": 0.0, "max_queue_depth": 0} for name in PRIORITIES
+        }
+
+    def _refill(self) -> float:
+        settings = get_settings()
+        burst = max(1.0, float(settings.llm_rate_burst))
+        now = time.monotonic()
+        if self._tokens is None:
+            self._tokens = burst
+        elif settings.llm_rate_per_second > 0:
+            self._tokens = min(burst, self._tokens + (now - self._refilled_at) * settings.llm_rate_per_second)
+        self._refilled_at = now
+        return self._tokens
+
+    def _queued(self, name: str) -> int:
+        return sum(1 for _, _, cls, fut in self._waiters if cls == name and not fut.done())
+
+    def _dispatch(self) -> None:
+        self._timer = None
+        settings = get_settings()
+        limited = settings.llm_rate_per_second > 0
+        self._waiters = [w for w in self._waiters if not w[3].done()]
+        heapq.heapify(self._waiters)
+        skipped: List[Tuple[int, int, str, "asyncio.Future[None]"]] = []
+        while self._waiters and sum(self._running.values()) < max(1, settings.llm_max_concurrency):
+            if limited and self._refill() < 1.0:
+                wait = (1.0 - self._refill()) / settings.llm_rate_per_second
+                self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                break
+            waiter = heapq.heappop(self._waiters)
+            _, _, name, fut = waiter
+            if self._running[name] >= _class_limit(name):
+                skipped.append(waiter)
+                continue
+            if limited:
+                self._tokens = (self._tokens or 0.0) - 1.0
+            self._running[name] += 1
+            fut.set_result(None)
+        for waiter in skipped:
+            heapq.heappush(self._waiters, waiter)
+
+    def _release(self, name: str) -> None:
+        self._running[name] -= 1
+        if self._timer is None:
+            self._dispatch()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, name: Optional[str] = None) -> AsyncIterator[None]:
+        name = name or current_priority()
+        fut: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (PRIORITIES[name], next(self._seq), name, fut))
+        stats = self._stats[name]
+        stats["max_queue_depth"] = max(stats["max_queue_depth"], self._queued(name))
+        t0 = time.perf_counter()
+        if self._timer is None:
+            self._dispatch()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # Admitted just as we were cancelled: hand the slot back.
+                self._release(name)
+            else:
+                fut.cancel()
+            raise
+        stats["admitted"] += 1
+        stats["wait_seconds"] += time.perf_counter() - t0
+        try:
+            yield
+        finally:
+            self._release(name)
+
+    def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {
+            name: {
+                **self._stats[name],
+                "wait_seconds": round(self._stats[name]["wait_seconds"], 3),
+                "queued": self._queued(name),
+                "running": self._running[name],
+                "limit": _class_limit(name),
+            }
+            for name in PRIORITIES
+        }
+        out["tokens"] = round(self._refill(), 3)
+        return out
+
+
+scheduler = LLMScheduler()
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import contextlib
+import contextvars
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Tuple
+
+from app.config import get_settings
+
+
+COUNTERS = ("calls", "input_tokens", "output_tokens", "total_tokens", "seconds", "cost")
+
+
+@dataclass(frozen=True)
+class Usage:
+    """Tokens billed for one model call."""
+
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+
+def estimate_tokens(text: str) -> int:
+    # Rough count for backends that do not report usage (about 4 characters per token).
+    return (len(text) + 3) // 4
+
+
+def messages_tokens(messages: List[Dict[str, str]]) -> int:
+    return sum(estimate_tokens(str(m.get("text", ""))) for m in messages)
+
+
+def call_cost(model: str, usage: Usage) -> float:
+    # YandexGPT bills prompt and completion tokens at the same rate per 1000 tokens.
+    price = get_settings().llm_token_prices.get(model, 0.0)
+    return (usage.input_tokens + usage.output_tokens) * price / 1000.0
+
+
+class UsageMeter:
+    """Totals and per call site breakdown of the LLM calls recorded into it."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._totals: Dict[str, float] = dict.fromkeys(COUNTERS, 0)
+        self._sites: Dict[str, Dict[str, float]] = {}
+
+    def add(self, site: str, usage: Usage, seconds: float, cost: float) -> None:
+        delta = {
+            "calls": 1,
+            "input_tokens": usage.input_tokens,
+            "output_tokens": usage.output_tokens,
+            "total_tokens": usage.input_tokens + usage.output_tokens,
+            "seconds": seconds,
+            "cost": cost,
+        }
+        with self._lock:
+            per_site = self._sites.setdefault(site, dict.fromkeys(COUNTERS, 0))
+            for name, value in delta.items():
+                self._totals[name] += value
+                per_site[name] += value
+
+    @property
+    def total_tokens(self) -> int:
+        return int(self._totals["total_tokens"])
+
+    def summary(self) -> Dict[str, Any]:
+        def rounded(counters: Dict[str, float]) -> Dict[str, Any]:
+            return {k: round(v, 6) if k in ("seconds", "cost") else int(v) for k, v in counters.items()}
+
+        with self._lock:
+            return {
+                **rounded(self._totals),
+                "by_site": {site: rounded(c) for site, c in sorted(self._sites.items())},
+            }
+
+
+# Process-wide totals for /admin/metrics.
+usage_stats = UsageMeter()
+
+_meters: contextvars.ContextVar[Tuple[UsageMeter, ...]] = contextvars.ContextVar("llm_usage_meters", default=())
+
+
+@contextlib.contextmanager
+def track_usage() -> Iterator[UsageMeter]:
+    """Collect the usage of LLM calls made in this block (and tasks it spawns); meters nest."""
+    meter = UsageMeter()
+    token = _meters.set(_meters.get() + (meter,))
+    try:
+        yield meter
+    finally:
+        _meters.reset(token)
+
+
+def record_usage(site: str, model: str, usage: Usage, seconds: float) -> None:
+    cost = call_cost(model, usage)
+    usage_stats.add(site, usage, seconds, cost)
+    for meter in _meters.get():
+        meter.add(site, usage, seconds, cost)
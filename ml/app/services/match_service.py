@@ -1,7 +1,10 @@
 from __future__ import annotations
 
+import asyncio
 import json
-from typing import Any, Iterable, List, Tuple
+from typing import Any, Iterable, List, Optional, Tuple
+
+import numpy as np
 
 from app.prompts import (
     MATCH_PREPROCESS_SYSTEM_PROMPT,
@@ -12,8 +15,22 @@ from app.prompts import (
     COURSE_MATCH_SYSTEM_PROMPT_STAGE1,
     COURSE_MATCH_SYSTEM_PROMPT_STAGE2,
 )
-from app.services.yandex_sdk import embed_text, run_structured_completion, run_text_completion
-from app.startup.load_embeddings import search_top_k, search_top_k_courses
+from app.config import get_settings
+from app.services.yandex_sdk import (
+    embed_text_async,
+    run_structured_completion_async,
+    run_text_completion_async,
+)
+from app.startup.duplicates import COURSE_DUP_KEY, VACANCY_DUP_KEY, dup_key
+from app.startup.keyword_index import reciprocal_rank_fusion
+from app.startup.load_embeddings import (
+    keyword_top_k,
+    keyword_top_k_courses,
+    search_top_k,
+    search_top_k_batch,
+    search_top_k_courses,
+    search_top_k_courses_batch,
+)
 from app.models.match_models import (
     MatchVacanciesRequest,
     MatchVacanciesResponse,
@@ -21,23 +38,18 @@ from app.models.match_models import (
     MatchCoursesRequest,
     MatchCoursesResponse,
     MatchedCourse,
+    VacancyFilters,
     MatchFutureRequest,
 )
 from app.repos.match_repos import VacanciesRepository, CoursesRepository
 
 
-def _dedup_vacancies_ordered(items: List[dict[str, Any]]) -> List[dict[str, Any]]:
-    seen: set[Tuple[str, str, str, str, str, str]] = set()
+def _dedup_ordered(items: List[dict[str, Any]], columns: Tuple[str, ...]) -> List[dict[str, Any]]:
+    # Indexes hold one vector per duplicate cluster; this covers indexes built without catalog ids.
+    seen: set[Tuple[str, ...]] = set()
     out: List[dict[str, Any]] = []
     for d in items:
-        key = (
-            str(d.get("title", "") or ""),
-            str(d.get("salary", "") or ""),
-            str(d.get("experience", "") or ""),
-            str(d.get("job_type", "") or ""),
-            str(d.get("company", "") or ""),
-            str(d.get("location", "") or ""),
-        )
+        key = dup_key(d, columns)
         if key in seen:
             continue
         seen.add(key)
@@ -45,34 +57,41 @@ def _dedup_vacancies_ordered(items: List[dict[str, Any]]) -> List[dict[str, Any]
     return out
 
 
+def _dedup_vacancies_ordered(items: List[dict[str, Any]]) -> List[dict[str, Any]]:
+    return _dedup_ordered(items, VACANCY_DUP_KEY)
+
+
 def _dedup_courses_ordered(items: List[dict[str, Any]]) -> List[dict[str, Any]]:
-    seen: set[Tuple[str, str, str, str, str]] = set()
-    out: List[dict[str, Any]] = []
-    for d in items:
-        key = (
-            str(d.get("Course Name", "") or ""),
-            str(d.get("University", "") or ""),
-            str(d.get("Difficulty Level", "") or ""),
-            str(d.get("Course Rating", "") or ""),
-            str(d.get("Course URL", "") or ""),
-        )
-        if key in seen:
-            continue
-        seen.add(key)
-        out.append(d)
-    return out
+    return _dedup_ordered(items, COURSE_DUP_KEY)
+
+
+def _filter_values(filters: VacancyFilters | None) -> dict[str, List[str]] | None:
+    if filters is None:
+        return None
+    return {k: v for k, v in filters.model_dump().items() if v}
+
+
+def _parse_selected(raw: str) -> Optional[List[int]]:
+    """Indices of a PickN answer, or None if it does not parse."""
+    try:
+        data = json.loads(raw)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get("selected", []), list):
+        return None
+    return [int(x) for x in data.get("selected", []) if isinstance(x, int)]
 
 
 class MatchService:
-    def preprocess_resume(self, resume: str) -> str:
-        txt = run_text_completion([
+    async def preprocess_resume(self, resume: str) -> str:
+        txt = (await run_text_completion_async([
             {"role": "system", "text": MATCH_PREPROCESS_SYSTEM_PROMPT},
             {"role": "user", "text": resume},
-        ]).strip()
+        ], site="preprocess_resume")).strip()
         return txt or resume
 
-    def embed_query(self, text: str) -> Any:
-        return embed_text(text, model_kind="query")
+    async def embed_query(self, text: str) -> Any:
+        return await embed_text_async(text, model_kind="query")
 
     async def fetch_vacancies_in_order(self, repo, top_idx: Iterable[int]) -> List[dict[str, Any]]:
         docs = await repo.find_by_idx(top_idx)
@@ -86,32 +105,63 @@ class MatchService:
         ordered = [by_idx.get(int(i)) for i in top_idx if int(i) in by_idx]
         return [d for d in ordered if d is not None]
 
-    def stage1_select(self, system_prompt: str, context_text: str, limit: int) -> List[int]:
+    async def stage1_select(self, system_prompt: str, context_text: str, limit: int, site: str = "stage1") -> List[int]:
         schema = {
             "title": "PickN",
             "type": "object",
             "properties": {"selected": {"type": "array", "items": {"type": "integer"}}},
             "required": ["selected"],
         }
-        raw = run_structured_completion([
+        raw = await run_structured_completion_async([
             {"role": "system", "text": system_prompt.format(limit=limit)},
             {"role": "user", "text": context_text},
-        ], schema, max_tokens=800)
-        try:
-            data = json.loads(raw)
-            selected = [int(x) for x in data.get("selected", []) if isinstance(x, int)]
-        except Exception:
-            selected = []
-        return selected[:limit]
+        ], schema, max_tokens=800, site=site, cacheable=lambda r: _parse_selected(r) is not None)
+        return (_parse_selected(raw) or [])[:limit]
 
-    def stage2_select(self, system_prompt: str, detail_text: str, limit: int) -> List[int]:
-        return self.stage1_select(system_prompt, detail_text, limit)
+    async def stage2_select(self, system_prompt: str, detail_text: str, limit: int) -> List[int]:
+        return await self.stage1_select(system_prompt, detail_text, limit, site="stage2")
+
+    def search_faiss(
+        self,
+        q_vec,
+        k: int,
+        filters: VacancyFilters | None = None,
+        ef_search: int | None = None,
+    ) -> Any:
+        return search_top_k(q_vec, k=k, filters=_filter_values(filters), ef_search=ef_search)
 
-    def search_faiss(self, q_vec, k: int) -> Any:
-        return search_top_k(q_vec, k=k)
+    def search_faiss_courses(self, q_vec, k: int, ef_search: int | None = None) -> Any:
+        return search_top_k_courses(q_vec, k=k, ef_search=ef_search)
 
-    def search_faiss_courses(self, q_vec, k: int) -> Any:
-        return search_top_k_courses(q_vec, k=k)
+    def search_faiss_many(
+        self,
+        q_vecs: List[Any],
+        k: int,
+        filters: VacancyFilters | None = None,
+        ef_search: int | None = None,
+    ) -> List[Any]:
+        ids, _ = search_top_k_batch(np.vstack(q_vecs), k=k, filters=_filter_values(filters), ef_search=ef_search)
+        return ids
+
+    def search_faiss_courses_many(self, q_vecs: List[Any], k: int, ef_search: int | None = None) -> List[Any]:
+        ids, _ = search_top_k_courses_batch(np.vstack(q_vecs), k=k, ef_search=ef_search)
+        return ids
+
+    def fuse(self, dense_ids: Any, keyword_ids: Any, k: int) -> Any:
+        """Reciprocal-rank fusion of dense and BM25 candidates, k ids."""
+        if len(keyword_ids) == 0:
+            return np.asarray(dense_ids, dtype=np.int64)[:k]
+        return reciprocal_rank_fusion([list(dense_ids), list(keyword_ids)], k, get_settings().rrf_k)
+
+    def hybrid_vacancies(self, dense_ids: Any, text: str, k: int, filters: VacancyFilters | None = None) -> Any:
+        if not get_settings().hybrid_search:
+            return dense_ids[:k]
+        return self.fuse(dense_ids, keyword_top_k(text, k=k, filters=_filter_values(filters)), k)
+
+    def hybrid_courses(self, dense_ids: Any, text: str, k: int) -> Any:
+        if not get_settings().hybrid_search:
+            return dense_ids[:k]
+        return self.fuse(dense_ids, keyword_top_k_courses(text, k=k), k)
 
     def mk_vacancy_block(self, d: dict[str, Any]) -> str:
         return (
@@ -129,15 +179,15 @@ class MatchService:
             f"Навыки: {d.get('Skills','')}\n"
         )
 
-    def preprocess_courses_query(self, desired_skills: str, field: str | None, specialization: str | None) -> str:
+    async def preprocess_courses_query(self, desired_skills: str, field: str | None, specialization: str | None) -> str:
         q_text = (f"Сфера: {field or ''}\nСпециализация: {specialization or ''}\nЦелевые навыки: {desired_skills}")
-        txt = run_text_completion([
+        txt = (await run_text_completion_async([
             {"role": "system", "text": COURSE_PREPROCESS_SYSTEM_PROMPT},
             {"role": "user", "text": q_text},
-        ]).strip()
+        ], site="preprocess_courses_query")).strip()
         return txt or desired_skills
 
-    def build_future_text(
+    async def build_future_text(
         self,
         field: str,
         specialization: str,
@@ -154,22 +204,20 @@ class MatchService:
             f"Целевой уровень: {desired_level or 'Нет'}"
             f"Дополнительная информация: {additional_info or 'Нет'}"
         )
-        txt = run_text_completion([
+        txt = (await run_text_completion_async([
             {"role": "system", "text": MATCH_FUTURE_RESUME_SYSTEM_PROMPT},
             {"role": "user", "text": goals_text},
-        ]).strip()
+        ], site="build_future_text")).strip()
         return txt
 
-    async def match_vacancies(
+    async def rank_vacancies(
         self,
-        request: MatchVacanciesRequest,
+        request: MatchVacanciesRequest | MatchFutureRequest,
         repo: VacanciesRepository,
+        top_idx_arr: Any,
+        context_label: str,
+        context_text: str,
     ) -> MatchVacanciesResponse:
-        # Preprocess and embed
-        aug_text = self.preprocess_resume(request.resume)
-        q_vec = self.embed_query(aug_text)
-        top_idx_arr = self.search_faiss(q_vec, k=int(request.k_faiss))
-
         # Fetch ordered docs
         ordered = await self.fetch_vacancies_in_order(repo, top_idx_arr)
         ordered = _dedup_vacancies_ordered(ordered)
@@ -180,17 +228,17 @@ class MatchService:
         items = [f"{d['idx']}: {d.get('title','')}" for d in ordered]
         list_text = "\n---\n".join(items)
         context1 = (
-            f"Резюме кандидата:\n{request.resume}\n\nСписок вакансий (id: title):\n{list_text}"
+            f"{context_label}:\n{context_text}\n\nСписок вакансий (id: title):\n{list_text}"
         )
-        stage1_selected = set(self.stage1_select(MATCH_SYSTEM_PROMPT_STAGE1, context1, int(request.k_stage1)))
+        stage1_selected = set(await self.stage1_select(MATCH_SYSTEM_PROMPT_STAGE1, context1, int(request.k_stage1)))
         stage2 = [d for d in ordered if int(d["idx"]) in stage1_selected][: int(request.k_stage1)] or ordered[: int(request.k_stage1)]
 
         # Stage 2 by details
         details = "\n------\n".join(self.mk_vacancy_block(d) for d in stage2)
         context2 = (
-            f"Резюме кандидата:\n{request.resume}\n\nКандидаты (подробно):\n{details}"
+            f"{context_label}:\n{context_text}\n\nКандидаты (подробно):\n{details}"
         )
-        stage2_selected = set(self.stage2_select(MATCH_SYSTEM_PROMPT_STAGE2, context2, int(request.k_stage2)))
+        stage2_selected = set(await self.stage2_select(MATCH_SYSTEM_PROMPT_STAGE2, context2, int(request.k_stage2)))
         final = [d for d in stage2 if int(d["idx"]) in stage2_selected][: int(request.k_stage2)] or stage2[: int(request.k_stage2)]
 
         return MatchVacanciesResponse(
@@ -210,16 +258,13 @@ class MatchService:
             ],
         )
 
-    async def match_courses(
+    async def rank_courses(
         self,
         request: MatchCoursesRequest,
         repo: CoursesRepository,
+        top_idx_arr: Any,
+        aug_query: str,
     ) -> MatchCoursesResponse:
-        # Preprocess and embed
-        aug_query = self.preprocess_courses_query(request.desired_skills, request.field, request.specialization)
-        q_vec = self.embed_query(aug_query)
-        top_idx_arr = self.search_faiss_courses(q_vec, k=int(request.k_faiss))
-
         # Fetch ordered docs
         ordered = await self.fetch_courses_in_order(repo, top_idx_arr)
         ordered = _dedup_courses_ordered(ordered)
@@ -232,7 +277,7 @@ class MatchService:
         context1 = (
             f"Запрос пользователя (навыки/цели):\n{aug_query}\n\nКурсы (id: name):\n{list_text}"
         )
-        stage1_selected = set(self.stage1_select(COURSE_MATCH_SYSTEM_PROMPT_STAGE1, context1, int(request.k_stage1)))
+        stage1_selected = set(await self.stage1_select(COURSE_MATCH_SYSTEM_PROMPT_STAGE1, context1, int(request.k_stage1)))
         stage2 = [d for d in ordered if int(d["idx"]) in stage1_selected][: int(request.k_stage1)] or ordered[: int(request.k_stage1)]
 
         # Stage 2 by details
@@ -240,7 +285,7 @@ class MatchService:
         context2 = (
             f"Запрос пользователя (навыки/цели):\n{aug_query}\n\nКурсы (подробно):\n{details}"
         )
-        stage2_selected = set(self.stage2_select(COURSE_MATCH_SYSTEM_PROMPT_STAGE2, context2, int(request.k_stage2)))
+        stage2_selected = set(await self.stage2_select(COURSE_MATCH_SYSTEM_PROMPT_STAGE2, context2, int(request.k_stage2)))
         final = [d for d in stage2 if int(d["idx"]) in stage2_selected][: int(request.k_stage2)] or stage2[: int(request.k_stage2)]
 
         return MatchCoursesResponse(
@@ -259,13 +304,8 @@ class MatchService:
             ],
         )
 
-    async def match_future(
-        self,
-        request: MatchFutureRequest,
-        repo: VacanciesRepository,
-    ) -> MatchVacanciesResponse:
-        # Build future text and reuse pipeline
-        future_text = self.build_future_text(
+    async def future_text_for(self, request: MatchFutureRequest) -> str:
+        return await self.build_future_text(
             request.field,
             request.specialization,
             request.activities,
@@ -274,44 +314,120 @@ class MatchService:
             request.additional_info,
             request.desired_level,
         )
-        q_vec = self.embed_query(future_text)
-        top_idx_arr = self.search_faiss(q_vec, k=int(request.k_faiss))
 
-        ordered = await self.fetch_vacancies_in_order(repo, top_idx_arr)
-        ordered = _dedup_vacancies_ordered(ordered)
-        if not ordered:
-            return MatchVacanciesResponse(top_idx=[], stage1=[], result=[])
+    async def match_vacancies(
+        self,
+        request: MatchVacanciesRequest,
+        repo: VacanciesRepository,
+    ) -> MatchVacanciesResponse:
+        # Preprocess and embed
+        aug_text = await self.preprocess_resume(request.resume)
+        q_vec = await self.embed_query(aug_text)
+        top_idx_arr = self.search_faiss(q_vec, k=int(request.k_faiss), filters=request.filters, ef_search=request.ef_search)
+        top_idx_arr = self.hybrid_vacancies(top_idx_arr, aug_text, int(request.k_faiss), request.filters)
+        return await self.rank_vacancies(request, repo, top_idx_arr, "Резюме кандидата", request.resume)
 
-        items = [f"{d['idx']}: {d.get('title','')}" for d in ordered]
-        list_text = "\n---\n".join(items)
-        context1 = (
-            f"Будущая роль кандидата:\n{future_text}\n\nСписок вакансий (id: title):\n{list_text}"
-        )
-        stage1_selected = set(self.stage1_select(MATCH_SYSTEM_PROMPT_STAGE1, context1, int(request.k_stage1)))
-        stage2 = [d for d in ordered if int(d["idx"]) in stage1_selected][: int(request.k_stage1)] or ordered[: int(request.k_stage1)]
+    async def match_courses(
+        self,
+        request: MatchCoursesRequest,
+        repo: CoursesRepository,
+    ) -> MatchCoursesResponse:
+        # Preprocess and embed
+        aug_query = await self.preprocess_courses_query(request.desired_skills, request.field, request.specialization)
+        q_vec = await self.embed_query(aug_query)
+        top_idx_arr = self.search_faiss_courses(q_vec, k=int(request.k_faiss), ef_search=request.ef_search)
+        top_idx_arr = self.hybrid_courses(top_idx_arr, aug_query, int(request.k_faiss))
+        return await self.rank_courses(request, repo, top_idx_arr, aug_query)
 
-        details = "\n------\n".join(self.mk_vacancy_block(d) for d in stage2)
-        context2 = (
-            f"Будущая роль кандидата:\n{future_text}\n\nКандидаты (подробно):\n{details}"
-        )
-        stage2_selected = set(self.stage2_select(MATCH_SYSTEM_PROMPT_STAGE2, context2, int(request.k_stage2)))
-        final = [d for d in stage2 if int(d["idx"]) in stage2_selected][: int(request.k_stage2)] or stage2[: int(request.k_stage2)]
+    async def match_future(
+        self,
+        request: MatchFutureRequest,
+        repo: VacanciesRepository,
+    ) -> MatchVacanciesResponse:
+        # Build future text and reuse pipeline
+        future_text = await self.future_text_for(request)
+        q_vec = await self.embed_query(future_text)
+        top_idx_arr = self.search_faiss(q_vec, k=int(request.k_faiss), filters=request.filters, ef_search=request.ef_search)
+        top_idx_arr = self.hybrid_vacancies(top_idx_arr, future_text, int(request.k_faiss), request.filters)
+        return await self.rank_vacancies(request, repo, top_idx_arr, "Будущая роль кандидата", future_text)
 
-        return MatchVacanciesResponse(
-            top_idx=list(map(int, top_idx_arr.tolist())),
-            stage1=list(map(int, stage1_selected)),
-            result=[
-                MatchedVacancy(
-                    idx=int(d["idx"]),
-                    title=d.get("title", ""),
-                    company=d.get("company", ""),
-                    location=d.get("location", ""),
-                    salary=d.get("salary", ""),
-                    experience=d.get("experience", ""),
-                    description=d.get("description", ""),
-                )
-                for d in final
-            ],
+    async def search_current_and_future(
+        self,
+        current: MatchVacanciesRequest,
+        future: MatchFutureRequest,
+    ) -> Tuple[Any, Any, str]:
+        """Candidate ids for match_vacancies and match_future from one batched FAISS search, plus the future text."""
+        aug_text, future_text = await asyncio.gather(
+            self.preprocess_resume(current.resume),
+            self.future_text_for(future),
         )
+        q_vecs = list(await asyncio.gather(self.embed_query(aug_text), self.embed_query(future_text)))
+        if current.filters == future.filters and current.ef_search == future.ef_search:
+            k = max(int(current.k_faiss), int(future.k_faiss))
+            cur_top, fut_top = self.search_faiss_many(q_vecs, k=k, filters=current.filters, ef_search=current.ef_search)
+        else:
+            cur_top = self.search_faiss(q_vecs[0], k=int(current.k_faiss), filters=current.filters, ef_search=current.ef_search)
+            fut_top = self.search_faiss(q_vecs[1], k=int(future.k_faiss), filters=future.filters, ef_search=future.ef_search)
+        cur_top = self.hybrid_vacancies(cur_top[: int(current.k_faiss)], aug_text, int(current.k_faiss), current.filters)
+        fut_top = self.hybrid_vacancies(fut_top[: int(future.k_faiss)], future_text, int(future.k_faiss), future.filters)
+        return cur_top, fut_top, future_text
+
+    async def match_current_and_future(
+        self,
+        current: MatchVacanciesRequest,
+        future: MatchFutureRequest,
+        repo: VacanciesRepository,
+    ) -> Tuple[MatchVacanciesResponse, MatchVacanciesResponse]:
+        """match_vacancies + match_future with both FAISS queries in one batched search."""
+        cur_top, fut_top, future_text = await self.search_current_and_future(current, future)
+        cur_resp, fut_resp = await asyncio.gather(
+            self.rank_vacancies(current, repo, cur_top, "Резюме кандидата", current.resume),
+            self.rank_vacancies(future, repo, fut_top, "Будущая роль кандидата", future_text),
+        )
+        return cur_resp, fut_resp
 
-
+    async def match_courses_many(
+        self,
+        requests: List[MatchCoursesRequest],
+        repo: CoursesRepository,
+    ) -> List[MatchCoursesResponse | Exception]:
+        """match_courses for several requests with one batched FAISS search.
+
+        Failures are isolated per request: the slot of a failed request holds its exception.
+        """
+        out: List[MatchCoursesResponse | Exception | None] = [None] * len(requests)
+
+        async def prepare(req: MatchCoursesRequest) -> Tuple[str, Any]:
+            aug_query = await self.preprocess_courses_query(req.desired_skills, req.field, req.specialization)
+            return aug_query, await self.embed_query(aug_query)
+
+        prepared: List[Tuple[int, str, Any]] = []
+        results = await asyncio.gather(*(prepare(r) for r in requests), return_exceptions=True)
+        for i, res in enumerate(results):
+            if isinstance(res, Exception):
+                out[i] = res
+            elif isinstance(res, BaseException):
+                raise res
+            else:
+                prepared.append((i, res[0], res[1]))
+        if not prepared:
+            return out  # type: ignore[return-value]
+        k = max(int(requests[i].k_faiss) for i, _, _ in prepared)
+        ef_values = [requests[i].ef_search for i, _, _ in prepared if requests[i].ef_search]
+        try:
+            tops = self.search_faiss_courses_many([v for _, _, v in prepared], k=k, ef_search=max(ef_values, default=None))
+        except Exception as e:
+            for i, _, _ in prepared:
+                out[i] = e
+            return out  # type: ignore[return-value]
+
+        async def rank(i: int, aug_query: str, top: Any) -> None:
+            try:
+                k_req = int(requests[i].k_faiss)
+                top = self.hybrid_courses(top[:k_req], aug_query, k_req)
+                out[i] = await self.rank_courses(requests[i], repo, top, aug_query)
+            except Exception as e:
+                out[i] = e
+
+        await asyncio.gather(*(rank(i, aug_query, top) for (i, aug_query, _), top in zip(prepared, tops)))
+        return out  # type: ignore[return-value]
@@ -6,7 +6,7 @@ import time
 from typing import List
 
 from app.models.trajectory_models import GapItem, GapGroup
-from app.services.yandex_sdk import run_structured_completion
+from app.services.yandex_sdk import run_structured_completion_async
 from app.prompts import PLANNER_SYSTEM_PROMPT, PLANNER_USER_INSTRUCTIONS
 
 
@@ -30,7 +30,7 @@ PLANNER_SCHEMA = {
 
 class PlannerService:
 
-    def group_gaps(self, gaps: List[GapItem], weekly_hours: int, total_months: int) -> List[GapGroup]:
+    async def group_gaps(self, gaps: List[GapItem], weekly_hours: int, total_months: int) -> List[GapGroup]:
         # Prepare LLM input
         gaps_payload = []
         for g in gaps:
@@ -56,7 +56,7 @@ class PlannerService:
         ]
 
         t0 = time.perf_counter()
-        raw = run_structured_completion(messages, PLANNER_SCHEMA)
+        raw = await run_structured_completion_async(messages, PLANNER_SCHEMA, site="planner")
         t1 = time.perf_counter()
         logger.info("Planner: llm grouping took %.3fs (gaps=%d)", (t1 - t0), len(gaps))
 
@@ -1,17 +1,26 @@
 from __future__ import annotations
 
+import hashlib
 import json
-from typing import List
+import logging
+import time
+from typing import List, Optional
 from pypdf import PdfReader
 
 from app.repos.chat_repos import SessionsRepository, MessagesRepository
-from app.services.yandex_sdk import run_structured_completion
+from app.repos.profile_repo import ProfilesRepository
+from app.services.yandex_sdk import run_structured_completion_async
 from app.prompts import PROFILE_SYSTEM_PROMPT
 
 
 class ProfileService:
     def __init__(self) -> None:
         self._system_prompt = PROFILE_SYSTEM_PROMPT
+        self._logger = logging.getLogger(__name__)
+        # Stored profiles extracted with another prompt or schema are not reused.
+        self._version = hashlib.sha256(
+            json.dumps([self._system_prompt, self.get_profile_schema()], sort_keys=True, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()[:16]
 
     def get_profile_schema(self) -> dict:
         return {
@@ -147,7 +156,18 @@ class ProfileService:
             texts.append(page.extract_text() or "")
         return "\n".join(texts)
 
-    async def build_profile(self, session_id: str, sessions_repo: SessionsRepository, messages_repo: MessagesRepository) -> dict:
+    async def build_profile(
+        self,
+        session_id: str,
+        sessions_repo: SessionsRepository,
+        messages_repo: MessagesRepository,
+        profiles_repo: Optional[ProfilesRepository] = None,
+    ) -> dict:
+        """Extract the profile from the finished interview.
+
+        With `profiles_repo`, the result is stored per session and served from there until a new
+        message arrives in the session.
+        """
         session = await sessions_repo.find_by_id(session_id)
         if not session:
             raise ValueError("Session not found")
@@ -156,14 +176,31 @@ class ProfileService:
         if not last_msg or not last_msg.get("done"):
             raise ValueError("Interview not finished: last assistant message is not done")
 
+        last_message_id: Optional[str] = None
+        if profiles_repo is not None:
+            last = await messages_repo.find_last_message(session_id)
+            last_message_id = last.get("message_id") if last else None
+            stored = await profiles_repo.find(session_id, last_message_id, self._version)
+            if stored is not None:
+                self._logger.info("Profile: session %s served from store", session_id)
+                return {"session_id": session_id, "profile": stored["profile"]}
+
+        t0 = time.perf_counter()
         msgs = await messages_repo.list_by_session(session_id, limit=1000)
         chat_messages: List[dict] = [{"role": m["role"], "text": m["content"]} for m in msgs]
         messages = [{"role": "system", "text": self._system_prompt}] + chat_messages
-        raw = run_structured_completion(messages, self.get_profile_schema(), max_tokens=8000)
+        raw = await run_structured_completion_async(
+            messages, self.get_profile_schema(), max_tokens=8000, site="profile"
+        )
         try:
             data = json.loads(raw)
         except Exception as exc:  # surfacing
             raise ValueError("Failed to parse structured profile JSON") from exc
-        return {"session_id": session_id, "profile": data}
-
+        self._logger.info("Profile: session %s extracted in %.3fs", session_id, time.perf_counter() - t0)
 
+        if profiles_repo is not None:
+            try:
+                await profiles_repo.upsert(session_id, last_message_id, self._version, data, session.get("user_id"))
+            except Exception as e:
+                self._logger.warning("Profile: cannot store profile of session %s: %s", session_id, e)
+        return {"session_id": session_id, "profile": data}
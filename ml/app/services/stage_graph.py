@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+
+StageFn = Callable[..., Awaitable[Any]]
+# on_stage(name, status, result, seconds): status is "running" (result and seconds None) or "done".
+StageCallback = Callable[[str, str, Any, Optional[float]], Awaitable[None]]
+
+
+class StageGraph:
+    """Named async stages with dependencies, run as soon as their inputs are ready.
+
+    A stage function receives the results of its dependencies as keyword arguments named after
+    them. Stages must be added after their dependencies, which also rules out cycles. At most
+    `concurrency` stages run at once; the first failure cancels the rest and is raised.
+    `on_stage` is awaited when a stage starts and when it finishes.
+    """
+
+    def __init__(
+        self,
+        concurrency: int,
+        name: str = "Pipeline",
+        logger: logging.Logger | None = None,
+        on_stage: Optional[StageCallback] = None,
+    ) -> None:
+        self.concurrency = max(1, int(concurrency))
+        self.name = name
+        self.on_stage = on_stage
+        self.timings: Dict[str, float] = {}
+        self._stages: Dict[str, Tuple[StageFn, Tuple[str, ...]]] = {}
+        self._logger = logger or logging.getLogger(__name__)
+
+    def add(self, name: str, fn: StageFn, *deps: str) -> None:
+        if name in self._stages:
+            raise ValueError(f"Duplicate stage: {name}")
+        missing = [d for d in deps if d not in self._stages]
+        if missing:
+            raise ValueError(f"Stage {name} depends on unknown stages: {missing}")
+        self._stages[name] = (fn, deps)
+
+    async def run(self) -> Dict[str, Any]:
+        sem = asyncio.Semaphore(self.concurrency)
+        tasks: Dict[str, "asyncio.Task[Any]"] = {}
+        started = time.perf_counter()
+
+        async def run_stage(name: str, fn: StageFn, deps: Tuple[str, ...]) -> Any:
+            inputs = {d: await tasks[d] for d in deps}
+            async with sem:
+                if self.on_stage is not None:
+                    await self.on_stage(name, "running", None, None)
+                t0 = time.perf_counter()
+                result = await fn(**inputs)
+                self.timings[name] = time.perf_counter() - t0
+            self._logger.info("%s: stage %s took %.3fs", self.name, name, self.timings[name])
+            if self.on_stage is not None:
+                await self.on_stage(name, "done", result, self.timings[name])
+            return result
+
+        # Tasks copy the current context, so LLM priority and usage meters carry over.
+        for name, (fn, deps) in self._stages.items():
+            tasks[name] = asyncio.ensure_future(run_stage(name, fn, deps))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for t in tasks.values():
+                t.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        self._logger.info(
+            "%s: %d stages took %.3fs (sum of stages %.3fs)",
+            self.name,
+            len(tasks),
+            time.perf_counter() - started,
+            sum(self.timings.values()),
+        )
+        return {name: t.result() for name, t in tasks.items()}
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, TypeVar
+
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+
+def _digest(value: Any) -> str:
+    raw = json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class StageMemo:
+    """Reuses stage outputs of a previous run whose inputs have not changed.
+
+    A stage's fingerprint hashes its own parameters and the output hashes of the stages it
+    depends on, so a stage that reruns but produces the same output does not invalidate what
+    follows it. `records` (fingerprint, output hash and serialized output per stage) is what the
+    next run gets as `previous`.
+    """
+
+    def __init__(self, previous: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+        self.previous = previous or {}
+        self.records: Dict[str, Dict[str, Any]] = {}
+        self.reused: List[str] = []
+
+    def fingerprint(self, name: str, params: Dict[str, Any], deps: Sequence[str]) -> str:
+        return _digest({"stage": name, "params": params, "inputs": {d: self.records[d]["output_hash"] for d in deps}})
+
+    async def run(
+        self,
+        name: str,
+        params: Dict[str, Any],
+        deps: Sequence[str],
+        compute: Callable[[], Awaitable[T]],
+        dump: Callable[[T], Any],
+        load: Callable[[Any], T],
+    ) -> T:
+        """Output of stage `name`: the stored one if the fingerprint matches, else compute()."""
+        fp = self.fingerprint(name, params, deps)
+        prev = self.previous.get(name)
+        if prev and prev.get("fingerprint") == fp and "output" in prev:
+            try:
+                value = load(prev["output"])
+            except Exception as e:
+                logger.warning("Stage %s: stored output unusable, recomputing: %s", name, e)
+            else:
+                self.records[name] = prev
+                self.reused.append(name)
+                return value
+        value = await compute()
+        data = dump(value)
+        self.records[name] = {"fingerprint": fp, "output_hash": _digest(data), "output": data}
+        return value
@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import os
+import socket
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+from app.config import get_settings
+from app.db.mongo import get_db
+from app.models.trajectory_models import TrajectoryBuildRequest, TrajectoryJobResponse
+from app.repos.chat_repos import MessagesRepository, SessionsRepository
+from app.repos.match_repos import CoursesRepository, VacanciesRepository
+from app.repos.profile_repo import ProfilesRepository
+from app.repos.trajectory_jobs_repo import TrajectoryJobsRepository
+from app.repos.trajectory_repo import TrajectoryRepository
+from app.services.trajectory_service import TrajectoryService
+
+
+logger = logging.getLogger(__name__)
+
+
+def _partial(stage: str, result: Any) -> Dict[str, Any]:
+    """The part of the response a finished stage makes available before the job is done."""
+    if stage == "current":
+        return {"current_positions": [v.model_dump() for v in result]}
+    if stage == "future":
+        return {"future_positions": [v.model_dump() for v in result]}
+    if stage == "gaps":
+        return {"gaps": [g.model_dump() for g in result]}
+    if stage == "plan":
+        return {"groups": [g.model_dump() for g in result]}
+    return {}
+
+
+class TrajectoryJobConflict(Exception):
+    """The session already has an active build, requested with different parameters."""
+
+    def __init__(self, job: Dict[str, Any]) -> None:
+        super().__init__(f"A trajectory build with different parameters is in progress, job_id={job['job_id']}")
+        self.job = job
+
+
+class TrajectoryWorkerPool:
+    """TRAJECTORY_WORKERS loops that claim queued builds from Mongo and run them.
+
+    Several processes can share the queue. A running job holds a lease that its worker keeps
+    extending; if the worker dies, another one claims the job once the lease lapses (up to
+    TRAJECTORY_JOB_MAX_ATTEMPTS attempts). A worker that finds its job claimed by another stops
+    building it, and its writes to the job are ignored.
+    """
+
+    def __init__(self) -> None:
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._service = TrajectoryService()
+        self._tasks: List["asyncio.Task[None]"] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._stats: Dict[str, int] = {"claimed": 0, "done": 0, "failed": 0, "lost": 0, "running": 0}
+
+    def start(self) -> None:
+        self._wake = asyncio.Event()
+        for i in range(max(0, get_settings().trajectory_workers)):
+            self._tasks.append(asyncio.create_task(self._loop(f"{self.worker_id}/{i}")))
+        logger.info("Trajectory jobs: started %d workers", len(self._tasks))
+
+    async def stop(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def notify(self) -> None:
+        """Wake idle workers of this process (a job was just enqueued)."""
+        if self._wake is not None:
+            self._wake.set()
+
+    def stats(self) -> Dict[str, int]:
+        return {**self._stats, "workers": len(self._tasks)}
+
+    async def _loop(self, worker_id: str) -> None:
+        settings = get_settings()
+        while True:
+            try:
+                jobs = TrajectoryJobsRepository(await get_db())
+                job = await jobs.claim(worker_id, settings.trajectory_job_lease_seconds)
+            except Exception as e:
+                logger.warning("Trajectory jobs: claim failed: %s", e)
+                await asyncio.sleep(settings.trajectory_job_poll_seconds)
+                continue
+            if job is None:
+                assert self._wake is not None
+                self._wake.clear()
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wake.wait(), settings.trajectory_job_poll_seconds)
+                continue
+            self._stats["claimed"] += 1
+            self._stats["running"] += 1
+            try:
+                await self._run(worker_id, jobs, job)
+            except Exception as e:
+                logger.warning("Trajectory job %s: worker error: %s", job["job_id"], e)
+            finally:
+                self._stats["running"] -= 1
+
+    async def _heartbeat(
+        self,
+        jobs: TrajectoryJobsRepository,
+        job_id: str,
+        worker_id: str,
+        build: "asyncio.Future[Any]",
+    ) -> bool:
+        """Extend the lease while the build runs; cancel the build and return True once the job is lost."""
+        lease = get_settings().trajectory_job_lease_seconds
+        while True:
+            await asyncio.sleep(lease / 3)
+            try:
+                owned = await jobs.extend_lease(job_id, worker_id, lease)
+            except Exception as e:
+                logger.warning("Trajectory job %s: cannot extend lease: %s", job_id, e)
+                continue
+            if not owned:
+                build.cancel()
+                return True
+
+    async def _run(self, worker_id: str, jobs: TrajectoryJobsRepository, job: Dict[str, Any]) -> None:
+        settings = get_settings()
+        ttl = settings.trajectory_job_ttl_seconds
+        job_id = job["job_id"]
+        if job.get("attempts", 1) > settings.trajectory_job_max_attempts:
+            self._stats["failed"] += 1
+            await jobs.fail(job_id, worker_id, "Build was interrupted too many times", False, ttl)
+            return
+
+        async def on_stage(name: str, status: str, result: Any, seconds: Optional[float]) -> None:
+            info: Dict[str, Any] = {"status": status}
+            if seconds is not None:
+                info["seconds"] = round(seconds, 3)
+            try:
+                partial = _partial(name, result) if status == "done" else None
+                await jobs.update_stage(job_id, worker_id, name, info, partial)
+            except Exception as e:
+                logger.warning("Trajectory job %s: cannot record stage %s: %s", job_id, name, e)
+
+        db = await get_db()
+        t0 = time.perf_counter()
+        build = asyncio.ensure_future(
+            self._service.build(
+                TrajectoryBuildRequest.model_validate(job["request"]),
+                SessionsRepository(db),
+                MessagesRepository(db),
+                VacanciesRepository(db),
+                CoursesRepository(db),
+                TrajectoryRepository(db),
+                on_stage=on_stage,
+                profiles_repo=ProfilesRepository(db),
+            )
+        )
+        heartbeat = asyncio.create_task(self._heartbeat(jobs, job_id, worker_id, build))
+        try:
+            response = await build
+        except asyncio.CancelledError:
+            if heartbeat.done() and not heartbeat.cancelled() and heartbeat.result():
+                self._stats["lost"] += 1
+                logger.warning("Trajectory job %s: claimed by another worker, build abandoned", job_id)
+                return
+            # Shutdown: give the job back instead of waiting for the lease to lapse.
+            build.cancel()
+            with contextlib.suppress(Exception):
+                await jobs.release(job_id, worker_id)
+            raise
+        except Exception as e:
+            self._stats["failed"] += 1
+            logger.warning("Trajectory job %s failed after %.3fs: %s", job_id, time.perf_counter() - t0, e)
+            try:
+                await jobs.fail(job_id, worker_id, str(e), isinstance(e, ValueError), ttl)
+            except Exception as store_error:
+                logger.warning("Trajectory job %s: cannot record failure: %s", job_id, store_error)
+        else:
+            if await jobs.finish(job_id, worker_id, response.model_dump(), ttl):
+                self._stats["done"] += 1
+                logger.info("Trajectory job %s done in %.3fs", job_id, time.perf_counter() - t0)
+            else:
+                self._stats["lost"] += 1
+                logger.warning("Trajectory job %s: claimed by another worker, result not recorded", job_id)
+        finally:
+            heartbeat.cancel()
+
+
+workers = TrajectoryWorkerPool()
+
+
+class TrajectoryJobService:
+    def to_response(self, job: Dict[str, Any], deduplicated: bool = False) -> TrajectoryJobResponse:
+        return TrajectoryJobResponse(
+            job_id=job["job_id"],
+            session_id=job["session_id"],
+            status=job["status"],
+            deduplicated=deduplicated,
+            stages=job.get("stages", {}),
+            partial=job.get("partial", {}),
+            result=job.get("result"),
+            error=job.get("error"),
+            created_at=job["created_at"],
+            started_at=job.get("started_at"),
+            finished_at=job.get("finished_at"),
+        )
+
+    async def submit(
+        self,
+        req: TrajectoryBuildRequest,
+        sessions_repo: SessionsRepository,
+        jobs_repo: TrajectoryJobsRepository,
+    ) -> Tuple[Dict[str, Any], bool]:
+        """Enqueue a build; while the session has a queued or running job, that job is returned instead.
+
+        Returns (job, created). Raises ValueError if the session does not exist and
+        TrajectoryJobConflict if the active job was requested with different parameters.
+        """
+        session = await sessions_repo.find_by_id(req.session_id)
+        if not session:
+            raise ValueError("Session not found")
+        job = {
+            "job_id": str(uuid4()),
+            "session_id": req.session_id,
+            "user_id": session.get("user_id"),
+            "request": req.model_dump(),
+            "status": "queued",
+            "stages": {name: {"status": "pending"} for name in TrajectoryService.STAGES},
+            "partial": {},
+            "attempts": 0,
+            "created_at": datetime.utcnow().isoformat(),
+        }
+        job, created = await jobs_repo.create_or_get_active(job)
+        if created:
+            workers.notify()
+        elif job.get("request") != req.model_dump():
+            # Returning it would hand back a trajectory built for the old weekly_hours, limits, etc.
+            raise TrajectoryJobConflict(job)
+        return job, created
+
+    async def wait(self, job_id: str, jobs_repo: TrajectoryJobsRepository, timeout: float) -> Optional[Dict[str, Any]]:
+        """Poll until the job is done or failed, or `timeout` passes; returns its last state."""
+        poll = get_settings().trajectory_job_poll_seconds
+        deadline = time.monotonic() + timeout
+        while True:
+            job = await jobs_repo.get(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job["status"] in ("done", "failed") or remaining <= 0:
+                return job
+            await asyncio.sleep(min(poll, remaining))
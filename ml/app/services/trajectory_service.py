@@ -2,25 +2,85 @@ from __future__ import annotations
 
 import logging
 import time
-from typing import List
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
 
-from app.models import UserProfile
+import numpy as np
+from pydantic import BaseModel
+
+from app.config import get_settings
+from app.models import LLMUsage, UserProfile
 from app.models.trajectory_models import (
+    GapGroup,
+    GapItem,
+    RecommendationItem,
     TrajectoryBuildRequest,
     TrajectoryResponse,
 )
-from app.models.match_models import MatchVacanciesRequest, MatchFutureRequest
+from app.models.match_models import MatchedVacancy, MatchVacanciesRequest, MatchFutureRequest
 from app.repos.chat_repos import SessionsRepository, MessagesRepository
 from app.repos.match_repos import VacanciesRepository, CoursesRepository
+from app.repos.profile_repo import ProfilesRepository
 from app.repos.trajectory_repo import TrajectoryRepository
+from app.services.llm_scheduler import llm_priority
+from app.services.llm_usage import track_usage
 from app.services.profile_service import ProfileService
 from app.services.match_service import MatchService
 from app.services.gap_service import GapService
 from app.services.learning_service import LearningService
 from app.services.planner_service import PlannerService
+from app.services.stage_graph import StageCallback, StageFn, StageGraph
+from app.services.stage_memo import StageMemo
+from app.startup.load_embeddings import course_index, vacancy_index
+
+
+# Output of the search stage: both match requests, candidate ids for each, and the future-role text.
+SearchResult = Tuple[MatchVacanciesRequest, MatchFutureRequest, Any, Any, str]
+# (dump, load) between a stage output and what is stored with the trajectory.
+Codec = Tuple[Callable[[Any], Any], Callable[[Any], Any]]
+
+
+def _model_codec(model: Type[BaseModel]) -> Codec:
+    return (lambda value: value.model_dump(mode="json"), model.model_validate)
+
+
+def _list_codec(model: Type[BaseModel]) -> Codec:
+    return (
+        lambda items: [i.model_dump(mode="json") for i in items],
+        lambda data: [model.model_validate(d) for d in data],
+    )
+
+
+def _nested_codec(model: Type[BaseModel]) -> Codec:
+    return (
+        lambda lists: [[i.model_dump(mode="json") for i in items] for items in lists],
+        lambda data: [[model.model_validate(d) for d in items] for items in data],
+    )
+
+
+def _dump_search(search: SearchResult) -> Dict[str, Any]:
+    current_req, future_req, cur_top, fut_top, future_text = search
+    return {
+        "current": current_req.model_dump(mode="json"),
+        "future": future_req.model_dump(mode="json"),
+        "current_top": [int(i) for i in cur_top],
+        "future_top": [int(i) for i in fut_top],
+        "future_text": future_text,
+    }
+
+
+def _load_search(data: Dict[str, Any]) -> SearchResult:
+    return (
+        MatchVacanciesRequest.model_validate(data["current"]),
+        MatchFutureRequest.model_validate(data["future"]),
+        np.asarray(data["current_top"], dtype=np.int64),
+        np.asarray(data["future_top"], dtype=np.int64),
+        data["future_text"],
+    )
 
 
 class TrajectoryService:
+    STAGES = ("profile", "search", "current", "future", "gaps", "courses", "recs", "plan")
+
     def __init__(self) -> None:
         self.profile_service = ProfileService()
         self.match_service = MatchService()
@@ -37,28 +97,176 @@ class TrajectoryService:
         vacancies_repo: VacanciesRepository,
         courses_repo: CoursesRepository,
         traj_repo: TrajectoryRepository,
+        on_stage: Optional[StageCallback] = None,
+        profiles_repo: Optional[ProfilesRepository] = None,
     ) -> TrajectoryResponse:
-        # 1) profile
+        """Build and persist the trajectory; `on_stage` is told when each of STAGES starts and finishes."""
+        # Stages whose inputs did not change since the last build reuse its outputs.
+        memo = StageMemo(await traj_repo.get_stages(req.session_id))
+        # Background-grade work: its ~20 LLM calls queue behind chat turns and match requests.
+        with llm_priority("trajectory"), track_usage() as meter:
+            response = await self._build(
+                req, sessions_repo, messages_repo, vacancies_repo, courses_repo, memo, on_stage, profiles_repo
+            )
+        if memo.reused:
+            self.logger.info("Trajectory: reused stages %s", ", ".join(memo.reused))
+        response.usage = LLMUsage.model_validate(meter.summary())
+        self.logger.info(
+            "Trajectory: LLM usage calls=%d input_tokens=%d output_tokens=%d",
+            response.usage.calls,
+            response.usage.input_tokens,
+            response.usage.output_tokens,
+        )
+
+        # Get user_id from session
+        session = await sessions_repo.find_by_id(req.session_id)
+        user_id = session.get("user_id") if session else None
+
         t0 = time.perf_counter()
-        profile_dict = await self.profile_service.build_profile(req.session_id, sessions_repo, messages_repo)
+        await traj_repo.upsert(req.session_id, response.model_dump(), user_id, stages=memo.records)
+        await sessions_repo.add_usage(req.session_id, meter.summary())
         t1 = time.perf_counter()
-        self.logger.info("Trajectory: build_profile took %.3fs", (t1 - t0))
-        profile = UserProfile.model_validate(profile_dict["profile"])  # type: ignore[arg-type]
+        self.logger.info("Trajectory: persist took %.3fs", (t1 - t0))
+        return response
 
-        # 2) current vacancies (from full resume)
-        resume_text = self._resume_text_from_full_profile(profile)
-        t0 = time.perf_counter()
-        current = await self.match_service.match_vacancies(
-            MatchVacanciesRequest(resume=resume_text, k_faiss=200, k_stage1=50, k_stage2=req.current_positions_limit),
-            vacancies_repo,
+    async def _build(
+        self,
+        req: TrajectoryBuildRequest,
+        sessions_repo: SessionsRepository,
+        messages_repo: MessagesRepository,
+        vacancies_repo: VacanciesRepository,
+        courses_repo: CoursesRepository,
+        memo: StageMemo,
+        on_stage: Optional[StageCallback] = None,
+        profiles_repo: Optional[ProfilesRepository] = None,
+    ) -> TrajectoryResponse:
+        # Stages run as soon as their inputs are ready:
+        #   profile -> search -> current
+        #                    -> future -> gaps -> courses, recs -> plan
+        settings = get_settings()
+        graph = StageGraph(settings.trajectory_stage_concurrency, "Trajectory", self.logger, on_stage)
+
+        def add(name: str, fn: StageFn, deps: Tuple[str, ...], params: Dict[str, Any], codec: Codec) -> None:
+            # Each stage is rerun only if its parameters or its inputs' outputs changed.
+            async def stage(**inputs: Any) -> Any:
+                return await memo.run(name, params, deps, lambda: fn(**inputs), *codec)
+
+            graph.add(name, stage, *deps)
+
+        last_message = await messages_repo.find_last_message(req.session_id)
+
+        # 1) profile
+        async def profile_stage() -> UserProfile:
+            profile_dict = await self.profile_service.build_profile(
+                req.session_id, sessions_repo, messages_repo, profiles_repo
+            )
+            return UserProfile.model_validate(profile_dict["profile"])  # type: ignore[arg-type]
+
+        # 2-3) current vacancies (from full resume) and future vacancies (from goals), one batched FAISS search
+        async def search_stage(profile: UserProfile) -> SearchResult:
+            current_req, future_req = self._match_requests(req, profile)
+            cur_top, fut_top, future_text = await self.match_service.search_current_and_future(current_req, future_req)
+            return current_req, future_req, cur_top, fut_top, future_text
+
+        async def current_stage(search: SearchResult) -> List[MatchedVacancy]:
+            current_req, _, cur_top, _, _ = search
+            resp = await self.match_service.rank_vacancies(
+                current_req, vacancies_repo, cur_top, "Резюме кандидата", current_req.resume
+            )
+            self.logger.info("Trajectory: current vacancies=%d", len(resp.result))
+            return resp.result
+
+        async def future_stage(search: SearchResult) -> List[MatchedVacancy]:
+            _, future_req, _, fut_top, future_text = search
+            resp = await self.match_service.rank_vacancies(
+                future_req, vacancies_repo, fut_top, "Будущая роль кандидата", future_text
+            )
+            self.logger.info("Trajectory: future vacancies=%d", len(resp.result))
+            return resp.result
+
+        # 4) gaps (on group of future vacancies)
+        async def gaps_stage(profile: UserProfile, future: List[MatchedVacancy]) -> List[GapItem]:
+            gaps = await self.gap_service.extract_gaps(profile, [v.model_dump() for v in future], limit=5)
+            self.logger.info("Trajectory: gaps=%d", len(gaps))
+            return gaps
+
+        # 5) recommendations for gaps: courses and LLM projects/tips are independent
+        async def courses_stage(profile: UserProfile, gaps: List[GapItem]) -> List[List[RecommendationItem]]:
+            field, specialization = self._target_field(profile)
+            return await self.learning_service.courses_for_gaps(
+                gaps, courses_repo, k=2, field=field, specialization=specialization
+            )
+
+        async def recs_stage(gaps: List[GapItem]) -> List[List[RecommendationItem]]:
+            return await self.learning_service.projects_and_tips_for_gaps(gaps, limit=2)
+
+        # 6) plan groups under constraints
+        async def plan_stage(
+            gaps: List[GapItem],
+            courses: List[List[RecommendationItem]],
+            recs: List[List[RecommendationItem]],
+        ) -> List[GapGroup]:
+            for gap, course_items, rec_items in zip(gaps, courses, recs):
+                gap.recommendations.extend(course_items + rec_items)
+            groups = await self.planner_service.group_gaps(
+                gaps, weekly_hours=req.weekly_hours, total_months=req.total_months
+            )
+            self.logger.info(
+                "Trajectory: groups=%d (weekly_hours=%d, total_months=%d)",
+                len(groups),
+                req.weekly_hours,
+                req.total_months,
+            )
+            return groups
+
+        vacancies = _list_codec(MatchedVacancy)
+        recommendations = _nested_codec(RecommendationItem)
+        add(
+            "profile",
+            profile_stage,
+            (),
+            {"session_id": req.session_id, "last_message": last_message.get("message_id") if last_message else None},
+            _model_codec(UserProfile),
+        )
+        add(
+            "search",
+            search_stage,
+            ("profile",),
+            {
+                "current_limit": req.current_positions_limit,
+                "target_limit": req.target_positions_limit,
+                "catalog": vacancy_index.version,
+            },
+            (_dump_search, _load_search),
+        )
+        add("current", current_stage, ("search",), {}, vacancies)
+        add("future", future_stage, ("search",), {}, vacancies)
+        add("gaps", gaps_stage, ("profile", "future"), {"limit": 5}, _list_codec(GapItem))
+        add("courses", courses_stage, ("profile", "gaps"), {"k": 2, "catalog": course_index.version}, recommendations)
+        add("recs", recs_stage, ("gaps",), {"limit": 2, "batch": settings.recs_batch}, recommendations)
+        add(
+            "plan",
+            plan_stage,
+            ("gaps", "courses", "recs"),
+            {"weekly_hours": req.weekly_hours, "total_months": req.total_months},
+            _list_codec(GapGroup),
+        )
+        results = await graph.run()
+
+        return TrajectoryResponse(
+            session_id=req.session_id,
+            current_positions=results["current"],
+            groups=results["plan"],
+            future_positions=results["future"],
         )
-        t1 = time.perf_counter()
-        self.logger.info("Trajectory: match current vacancies took %.3fs (count=%d)", (t1 - t0), len(current.result))
 
-        # 3) future vacancies (from goals)
+    def _match_requests(
+        self, req: TrajectoryBuildRequest, profile: UserProfile
+    ) -> Tuple[MatchVacanciesRequest, MatchFutureRequest]:
+        resume_text = self._resume_text_from_full_profile(profile)
         goals = profile.goals
-        t0 = time.perf_counter()
-        future = await self.match_service.match_future(
+        return (
+            MatchVacanciesRequest(resume=resume_text, k_faiss=200, k_stage1=50, k_stage2=req.current_positions_limit),
             MatchFutureRequest(
                 field=goals.target_field if goals and goals.target_field else "",
                 specialization=goals.target_specialization if goals and goals.target_specialization else "",
@@ -71,19 +279,9 @@ class TrajectoryService:
                 k_stage1=50,
                 k_stage2=req.target_positions_limit,
             ),
-            vacancies_repo,
         )
-        t1 = time.perf_counter()
-        self.logger.info("Trajectory: match future vacancies took %.3fs (count=%d)", (t1 - t0), len(future.result))
 
-        # 4) gaps (on group of future vacancies)
-        future_docs = [v.model_dump() for v in future.result]
-        t0 = time.perf_counter()
-        gaps = self.gap_service.extract_gaps(profile, future_docs, limit=5)
-        t1 = time.perf_counter()
-        self.logger.info("Trajectory: gap extraction took %.3fs (count=%d)", (t1 - t0), len(gaps))
-
-        # 5) recommendations for gaps
+    def _target_field(self, profile: UserProfile) -> Tuple[Optional[str], Optional[str]]:
         # determine field/specialization from goals or professional_context
         field = None
         specialization = None
@@ -93,45 +291,7 @@ class TrajectoryService:
         if (not field or not specialization) and profile.professional_context:
             field = field or profile.professional_context.professional_field
             specialization = specialization or profile.professional_context.specialization
-
-        t0 = time.perf_counter()
-        await self.learning_service.enrich_with_courses(gaps, courses_repo, k=2, field=field, specialization=specialization)
-        t1 = time.perf_counter()
-        self.logger.info("Trajectory: courses enrichment took %.3fs", (t1 - t0))
-
-        t0 = time.perf_counter()
-        await self.learning_service.enrich_with_projects_and_tips(gaps, limit=2)
-        t1 = time.perf_counter()
-        self.logger.info("Trajectory: LLM recs enrichment took %.3fs", (t1 - t0))
-
-        # 6) plan groups under constraints
-        t0 = time.perf_counter()
-        groups = self.planner_service.group_gaps(gaps, weekly_hours=req.weekly_hours, total_months=req.total_months)
-        t1 = time.perf_counter()
-        self.logger.info(
-            "Trajectory: planning took %.3fs (groups=%d, weekly_hours=%d, total_months=%d)",
-            (t1 - t0),
-            len(groups),
-            req.weekly_hours,
-            req.total_months,
-        )
-
-        response = TrajectoryResponse(
-            session_id=req.session_id,
-            current_positions=current.result,
-            groups=groups,
-            future_positions=future.result,
-        )
-
-        # Get user_id from session
-        session = await sessions_repo.find_by_id(req.session_id)
-        user_id = session.get("user_id") if session else None
-
-        t0 = time.perf_counter()
-        await traj_repo.upsert(req.session_id, response.model_dump(), user_id)
-        t1 = time.perf_counter()
-        self.logger.info("Trajectory: persist took %.3fs", (t1 - t0))
-        return response
+        return field, specialization
 
     def _resume_text_from_full_profile(self, profile: UserProfile) -> str:
         def to_str_list(values) -> List[str]:
@@ -1,23 +1,289 @@
 
 from __future__ import annotations
 
-import numpy as np
+import asyncio
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
 
-from typing import Any, Dict, List
+import grpc
+import numpy as np
 
 from yandex_cloud_ml_sdk import YCloudML
+from yandex_cloud_ml_sdk.exceptions import AioRpcError
 
 from app.config import get_settings
+from app.services.fake_llm import FakeBackend
+from app.services.llm_cache import cache_key, embedding_cache, llm_cache
+from app.services.llm_policy import InvalidLLMResponse, call_stats, call_with_policy, policy_for, remaining_timeout
+from app.services.llm_scheduler import scheduler
+from app.services.llm_usage import Usage, record_usage
 
 
-def _get_sdk() -> YCloudML:
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    # SDK calls block on network I/O; a dedicated bounded pool keeps them off the event loop
+    # without starving asyncio.to_thread users of the default executor.
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=max(1, get_settings().llm_thread_pool_size),
+                thread_name_prefix="yandex-sdk",
+            )
+        return _executor
+
+
+async def _offload(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    loop = asyncio.get_running_loop()
+    # Run in a copy of the caller's context so usage is recorded into the caller's meters.
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(_get_executor(), functools.partial(ctx.run, fn, *args, **kwargs))
+
+
+async def _scheduled(fn: Callable[..., T], *args: Any) -> T:
+    # Only calls that reach the API take a scheduler slot; cache hits return before this.
+    async with scheduler.slot():
+        work = asyncio.ensure_future(_offload(fn, *args))
+        try:
+            return await asyncio.shield(work)
+        except asyncio.CancelledError:
+            # A timed out or losing attempt cannot stop its thread: keep the slot until the SDK call
+            # returns (bounded by the timeout it was given), so retries and hedges queue behind it.
+            await asyncio.wait({work})
+            raise
+
+
+def _credential() -> str:
     settings = get_settings()
-    if not settings.yandex_folder_id:
-        raise RuntimeError("YANDEX_FOLDER_ID is required")
-    auth = settings.yandex_api_key or settings.yandex_iam_token
-    if not auth:
-        raise RuntimeError("YANDEX_API_KEY or YANDEX_IAM_TOKEN is required")
-    return YCloudML(folder_id=settings.yandex_folder_id, auth=auth)
+    if settings.yandex_api_key:
+        return settings.yandex_api_key
+    if settings.yandex_iam_token_file:
+        # Short-lived IAM tokens are rotated in this file by an external refresher.
+        try:
+            with open(settings.yandex_iam_token_file, "r", encoding="utf-8") as f:
+                token = f.read().strip()
+            if token:
+                return token
+        except OSError:
+            logger.warning("YandexSDK: cannot read %s", settings.yandex_iam_token_file)
+    return settings.yandex_iam_token
+
+
+def _schema_key(json_schema: Optional[Dict[str, Any]]) -> Optional[str]:
+    return json.dumps(json_schema, sort_keys=True, ensure_ascii=False) if json_schema is not None else None
+
+
+ModelKey = Tuple[str, str, Optional[str], Optional[int]]
+
+
+class ModelRegistry:
+    """Process-wide YCloudML client and configured model handles.
+
+    Handles are keyed by (model_name, version, response_format, max_tokens) and reused across
+    calls. The client is rebuilt when the credential changes (checked every
+    YANDEX_CLIENT_REFRESH_SECONDS) or after an UNAUTHENTICATED error; handles go with it.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._sdk: Optional[YCloudML] = None
+        self._auth: Optional[str] = None
+        self._checked_at = 0.0
+        self._models: Dict[ModelKey, Any] = {}
+        self._stats: Dict[str, float] = {
+            "client_builds": 0,
+            "handle_builds": 0,
+            "handle_hits": 0,
+            "setup_seconds": 0.0,
+            "inference_calls": 0,
+            "inference_seconds": 0.0,
+        }
+
+    def _add(self, name: str, value: float) -> None:
+        with self._lock:
+            self._stats[name] += value
+
+    def _client(self) -> YCloudML:
+        # Caller holds self._lock.
+        settings = get_settings()
+        now = time.monotonic()
+        if self._sdk is not None and now - self._checked_at < settings.yandex_client_refresh_seconds:
+            return self._sdk
+        self._checked_at = now
+        auth = _credential()
+        if self._sdk is not None and auth == self._auth:
+            return self._sdk
+        if not settings.yandex_folder_id:
+            raise RuntimeError("YANDEX_FOLDER_ID is required")
+        if not auth:
+            raise RuntimeError("YANDEX_API_KEY or YANDEX_IAM_TOKEN is required")
+        t0 = time.perf_counter()
+        self._sdk = YCloudML(folder_id=settings.yandex_folder_id, auth=auth)
+        self._auth = auth
+        self._models.clear()
+        self._stats["client_builds"] += 1
+        self._stats["setup_seconds"] += time.perf_counter() - t0
+        logger.info("YandexSDK: client created (builds=%d)", int(self._stats["client_builds"]))
+        return self._sdk
+
+    def sdk(self) -> YCloudML:
+        with self._lock:
+            return self._client()
+
+    def _handle(self, key: ModelKey, build: Callable[[YCloudML], Any]) -> Any:
+        with self._lock:
+            sdk = self._client()
+            model = self._models.get(key)
+            if model is not None:
+                self._stats["handle_hits"] += 1
+                return model
+            t0 = time.perf_counter()
+            model = build(sdk)
+            self._models[key] = model
+            self._stats["handle_builds"] += 1
+            self._stats["setup_seconds"] += time.perf_counter() - t0
+            return model
+
+    def completions(
+        self,
+        model_name: str,
+        model_version: str,
+        json_schema: Optional[Dict[str, Any]] = None,
+        max_tokens: Optional[int] = None,
+    ) -> Any:
+        def build(sdk: YCloudML) -> Any:
+            model = sdk.models.completions(model_name, model_version=model_version)
+            config: Dict[str, Any] = {}
+            if json_schema is not None:
+                config["response_format"] = {"json_schema": json_schema}
+            if max_tokens is not None:
+                config["max_tokens"] = max_tokens
+            return model.configure(**config) if config else model
+
+        return self._handle((model_name, model_version, _schema_key(json_schema), max_tokens), build)
+
+    def embeddings(self, model_kind: str) -> Any:
+        return self._handle(("text_embeddings", model_kind, None, None), lambda sdk: sdk.models.text_embeddings(model_kind))
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._sdk = None
+            self._auth = None
+            self._models.clear()
+
+    def run(self, get_model: Callable[[], Any], *args: Any) -> Any:
+        """Run a model handle, rebuilding the client once if the credential was rejected.
+
+        The SDK call gets what is left of the call_with_policy attempt as its own timeout.
+        """
+        for attempt in (0, 1):
+            model = get_model()
+            timeout = remaining_timeout()
+            t0 = time.perf_counter()
+            try:
+                return model.run(*args) if timeout is None else model.run(*args, timeout=timeout)
+            except AioRpcError as e:
+                if attempt or e.code() != grpc.StatusCode.UNAUTHENTICATED:
+                    raise
+                logger.warning("YandexSDK: credential rejected, rebuilding client")
+                self.invalidate()
+            finally:
+                self._add("inference_calls", 1)
+                self._add("inference_seconds", time.perf_counter() - t0)
+        raise RuntimeError("unreachable")
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            out = dict(self._stats)
+            out["cached_handles"] = len(self._models)
+            return out
+
+
+registry = ModelRegistry()
+
+
+def _get_sdk() -> YCloudML:
+    return registry.sdk()
+
+
+def _completion_usage(result: Any) -> Usage:
+    usage = getattr(result, "usage", None)
+    if usage is None:
+        return Usage()
+    return Usage(input_tokens=int(usage.input_text_tokens), output_tokens=int(usage.completion_tokens))
+
+
+class YandexBackend:
+    """Backends return (result, Usage); stream() yields (text so far, usage so far)."""
+
+    name = "yandex"
+
+    def structured(
+        self,
+        messages: List[Dict[str, str]],
+        json_schema: Dict[str, Any],
+        model_name: str,
+        model_version: str,
+        max_tokens: Optional[int],
+    ) -> Tuple[str, Usage]:
+        result = registry.run(
+            lambda: registry.completions(model_name, model_version, json_schema, max_tokens),
+            messages,
+        )
+        return result[0].text, _completion_usage(result)
+
+    def text(self, messages: List[Dict[str, str]], model_name: str, model_version: str) -> Tuple[str, Usage]:
+        result = registry.run(lambda: registry.completions(model_name, model_version), messages)
+        return result[0].text, _completion_usage(result)
+
+    def stream(
+        self,
+        messages: List[Dict[str, str]],
+        json_schema: Dict[str, Any],
+        model_name: str,
+        model_version: str,
+        max_tokens: Optional[int],
+    ) -> Iterator[Tuple[str, Usage]]:
+        model = registry.completions(model_name, model_version, json_schema, max_tokens)
+        text = ""
+        for result in model.run_stream(messages):
+            chunk = result[0].text
+            # Chunks carry the whole text so far; tolerate delta-style chunks as well.
+            text = chunk if chunk.startswith(text) else text + chunk
+            yield text, _completion_usage(result)
+
+    def embed(self, text: str, model_kind: str) -> Tuple[np.ndarray, Usage]:
+        vec = registry.run(lambda: registry.embeddings(model_kind), text)
+        return np.array(vec, dtype="float32"), Usage(input_tokens=int(getattr(vec, "num_tokens", 0)))
+
+
+_BACKENDS: Dict[str, Callable[[], Any]] = {"yandex": YandexBackend, "fake": FakeBackend}
+_backend_instances: Dict[str, Any] = {}
+
+
+def get_backend() -> Any:
+    """The LLM_BACKEND implementation: "yandex" (default) or "fake" for offline runs."""
+    name = get_settings().llm_backend
+    backend = _backend_instances.get(name)
+    if backend is None:
+        if name not in _BACKENDS:
+            raise RuntimeError(f"Unknown LLM_BACKEND: {name}")
+        backend = _backend_instances.setdefault(name, _BACKENDS[name]())
+    return backend
 
 
 def run_structured_completion(
@@ -26,33 +292,177 @@ def run_structured_completion(
     model_name: str = "yandexgpt",
     model_version: str = "rc",
     max_tokens: int = 1000,
+    site: str = "structured",
 ) -> str:
-    sdk = _get_sdk()
-    model = sdk.models.completions(model_name, model_version=model_version)
-    model = model.configure(response_format={"json_schema": json_schema}, max_tokens=max_tokens)
-    result = model.run(messages)
-    return result[0].text
+    t0 = time.perf_counter()
+    text, usage = get_backend().structured(messages, json_schema, model_name, model_version, max_tokens)
+    record_usage(site, model_name, usage, time.perf_counter() - t0)
+    return text
 
 
 def run_text_completion(
     messages: List[Dict[str, str]],
     model_name: str = "yandexgpt",
     model_version: str = "rc",
+    site: str = "text",
 ) -> str:
-    sdk = _get_sdk()
-    model = sdk.models.completions(model_name, model_version=model_version)
-    result = model.run(messages)
-    return result[0].text
+    t0 = time.perf_counter()
+    text, usage = get_backend().text(messages, model_name, model_version)
+    record_usage(site, model_name, usage, time.perf_counter() - t0)
+    return text
+
+
+def stream_structured_completion(
+    messages: List[Dict[str, str]],
+    json_schema: Dict[str, Any],
+    model_name: str = "yandexgpt",
+    model_version: str = "rc",
+    max_tokens: int = 1000,
+    site: str = "structured",
+) -> Iterator[str]:
+    """Yield the completion text accumulated so far, once per streamed chunk.
+
+    Usage is recorded when the stream ends or is closed, as of the last chunk received.
+    """
+    t0 = time.perf_counter()
+    usage = Usage()
+    try:
+        for text, usage in get_backend().stream(messages, json_schema, model_name, model_version, max_tokens):
+            yield text
+    finally:
+        record_usage(site, model_name, usage, time.perf_counter() - t0)
 
 
 def get_embeddings_model(model_kind: str = "doc"):
-    sdk = _get_sdk()
-    return sdk.models.text_embeddings(model_kind)
+    return registry.embeddings(model_kind)
 
 
 def embed_text(text: str, model_kind: str = "query") -> np.ndarray:
+    t0 = time.perf_counter()
+    vec, usage = get_backend().embed(text, model_kind)
+    record_usage(f"embed_{model_kind}", "text_embeddings", usage, time.perf_counter() - t0)
+    return vec
+
+
+def parses_as_json(raw: str) -> bool:
+    try:
+        json.loads(raw)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+async def run_structured_completion_async(
+    messages: List[Dict[str, str]],
+    json_schema: Dict[str, Any],
+    model_name: str = "yandexgpt",
+    model_version: str = "rc",
+    max_tokens: int = 1000,
+    cache: bool = True,
+    site: str = "structured",
+    cacheable: Optional[Callable[[str], bool]] = None,
+    require_valid: bool = False,
+) -> str:
+    """`site` names the call site for its timeout/retry/hedging policy (see llm_policy).
+
+    Only responses accepted by `cacheable` (by default: valid JSON) are cached, so a malformed
+    answer is asked for again next time instead of being replayed. With `require_valid`, a
+    rejected answer is retried under the site's policy and InvalidLLMResponse raised if none passes.
+    """
+    check = cacheable or parses_as_json
+
+    async def attempt() -> str:
+        raw = await _scheduled(
+            run_structured_completion, messages, json_schema, model_name, model_version, max_tokens, site
+        )
+        if require_valid and not check(raw):
+            raise InvalidLLMResponse(f"LLM call {site}: response does not match the expected format")
+        return raw
+
+    call = functools.partial(call_with_policy, site, attempt)
+    if not (cache and get_settings().llm_cache_enabled):
+        return await call()
+    key = cache_key("structured", model_name, model_version, messages, json_schema, max_tokens)
+    return await llm_cache.get_or_call(key, call, {"kind": "structured", "model": model_name}, check)
+
+
+async def run_text_completion_async(
+    messages: List[Dict[str, str]],
+    model_name: str = "yandexgpt",
+    model_version: str = "rc",
+    cache: bool = True,
+    site: str = "text",
+) -> str:
+    call = functools.partial(
+        call_with_policy,
+        site,
+        functools.partial(_scheduled, run_text_completion, messages, model_name, model_version, site),
+    )
+    if not (cache and get_settings().llm_cache_enabled):
+        return await call()
+    key = cache_key("text", model_name, model_version, messages)
+    return await llm_cache.get_or_call(key, call, {"kind": "text", "model": model_name})
+
+
+async def embed_text_async(text: str, model_kind: str = "query", cache: bool = True) -> np.ndarray:
+    call = functools.partial(
+        call_with_policy,
+        f"embed_{model_kind}",
+        functools.partial(_scheduled, embed_text, text, model_kind),
+    )
+    if not (cache and get_settings().embed_cache_enabled):
+        return await call()
+    key = embedding_cache.key(text, model_kind)
+    return await embedding_cache.get_or_call(key, call, {"model_kind": model_kind})
+
+
+async def stream_structured_completion_async(
+    messages: List[Dict[str, str]],
+    json_schema: Dict[str, Any],
+    model_name: str = "yandexgpt",
+    model_version: str = "rc",
+    max_tokens: int = 1000,
+    site: str = "structured",
+) -> AsyncIterator[str]:
+    """Async view of stream_structured_completion; never cached or retried once text has been yielded.
+
+    The site's timeout bounds the wait for each chunk. Closing the iterator stops the worker
+    thread after its current chunk; the scheduler slot is held until it has stopped.
+    """
+    loop = asyncio.get_running_loop()
+    queue: "asyncio.Queue[Tuple[str, Any]]" = asyncio.Queue()
+    stop = threading.Event()
 
-    model = get_embeddings_model(model_kind)
-    vec = model.run(text)
-    return np.array(vec, dtype="float32")
+    def pump() -> None:
+        try:
+            chunks = stream_structured_completion(messages, json_schema, model_name, model_version, max_tokens, site)
+            with contextlib.closing(chunks):
+                for text in chunks:
+                    if stop.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, ("text", text))
+            loop.call_soon_threadsafe(queue.put_nowait, ("end", None))
+        except BaseException as e:
+            loop.call_soon_threadsafe(queue.put_nowait, ("error", e))
 
+    timeout = policy_for(site).timeout
+    call_stats.count(site, "calls")
+    async with scheduler.slot():
+        t0 = time.perf_counter()
+        worker = loop.run_in_executor(_get_executor(), contextvars.copy_context().run, pump)
+        try:
+            while True:
+                kind, value = await asyncio.wait_for(queue.get(), timeout)
+                if kind == "end":
+                    break
+                if kind == "error":
+                    raise value
+                yield value
+            call_stats.observe(site, time.perf_counter() - t0)
+        except Exception:
+            call_stats.count(site, "failures")
+            raise
+        finally:
+            stop.set()
+            # Cancelling the future would not stop the thread; keep the slot until it returns, as _scheduled does.
+            await asyncio.wait({worker})
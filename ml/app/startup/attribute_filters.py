@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import logging
+from typing import Any, Iterable, Mapping, Optional, Sequence
+
+import numpy as np
+import faiss  # type: ignore
+
+from app.db.mongo import get_db
+
+
+# Vacancy columns (as seeded by seed_vacancies) that can restrict a FAISS search.
+FILTER_COLUMNS = ("location", "experience", "job_type", "type")
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_value(value: Any) -> str:
+    return " ".join(str(value).split()).lower()
+
+
+def _pack(bits: np.ndarray) -> np.ndarray:
+    # faiss.IDSelectorBitmap reads bit (i & 7) of byte (i >> 3), i.e. little-endian bit order.
+    return np.packbits(bits, bitorder="little")
+
+
+class AttributeBitmaps:
+    """Packed bitmaps over catalog idx, one per (column, normalized value).
+
+    Values of one column are OR-ed, columns are AND-ed. Instances are immutable;
+    with_rows returns a new object so searches can keep using the old one.
+    """
+
+    def __init__(self, size: int, bitmaps: dict[str, dict[str, np.ndarray]]) -> None:
+        self.size = size
+        self.bitmaps = bitmaps
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Mapping[str, Any]], columns: Sequence[str] = FILTER_COLUMNS) -> AttributeBitmaps:
+        idx_by_value: dict[str, dict[str, list[int]]] = {c: {} for c in columns}
+        size = 0
+        for row in rows:
+            if row.get("idx") is None:
+                continue
+            i = int(row["idx"])
+            size = max(size, i + 1)
+            for c in columns:
+                v = row.get(c)
+                if v is None or v == "":
+                    continue
+                idx_by_value[c].setdefault(normalize_value(v), []).append(i)
+
+        bitmaps: dict[str, dict[str, np.ndarray]] = {}
+        for c, values in idx_by_value.items():
+            bitmaps[c] = {}
+            for v, ids in values.items():
+                bits = np.zeros(size, dtype=bool)
+                bits[ids] = True
+                bitmaps[c][v] = _pack(bits)
+        return cls(size, bitmaps)
+
+    def with_rows(self, rows: Iterable[Mapping[str, Any]]) -> AttributeBitmaps:
+        """A copy with rows added or (for an existing idx) re-labelled."""
+        rows = [r for r in rows if r.get("idx") is not None]
+        if not rows:
+            return self
+        size = max(self.size, max(int(r["idx"]) for r in rows) + 1)
+        nbytes = (size + 7) // 8
+        touched = np.zeros(size, dtype=bool)
+        touched[[int(r["idx"]) for r in rows]] = True
+        clear = ~_pack(touched)
+
+        bitmaps: dict[str, dict[str, np.ndarray]] = {}
+        for c, values in self.bitmaps.items():
+            bitmaps[c] = {}
+            for v, packed in values.items():
+                grown = np.zeros(nbytes, dtype=np.uint8)
+                grown[: packed.shape[0]] = packed
+                bitmaps[c][v] = grown & clear
+        for c in bitmaps:
+            for r in rows:
+                v = r.get(c)
+                if v is None or v == "":
+                    continue
+                key = normalize_value(v)
+                packed = bitmaps[c].setdefault(key, np.zeros(nbytes, dtype=np.uint8))
+                i = int(r["idx"])
+                packed[i >> 3] |= np.uint8(1 << (i & 7))
+        return AttributeBitmaps(size, bitmaps)
+
+    def values(self, column: str) -> list[str]:
+        return sorted(self.bitmaps.get(column, {}))
+
+    def mask(self, filters: Mapping[str, Optional[Sequence[str]]]) -> Optional[np.ndarray]:
+        """Packed mask of the idx matching all filters, or None when no filter is set."""
+        out: Optional[np.ndarray] = None
+        for column, wanted in filters.items():
+            if not wanted:
+                continue
+            if column not in self.bitmaps:
+                raise ValueError(f"Unknown filter column: {column}")
+            col_mask = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+            for v in wanted:
+                packed = self.bitmaps[column].get(normalize_value(v))
+                if packed is not None:
+                    col_mask |= packed
+            out = col_mask if out is None else out & col_mask
+        return out
+
+
+def mask_count(mask: np.ndarray) -> int:
+    return int(np.unpackbits(mask).sum())
+
+
+def mask_ids(mask: np.ndarray) -> np.ndarray:
+    return np.flatnonzero(np.unpackbits(mask, bitorder="little")).astype(np.int64)
+
+
+def clear_ids(mask: np.ndarray, ids: Iterable[int]) -> np.ndarray:
+    out = mask.copy()
+    for i in ids:
+        if 0 <= i < out.shape[0] * 8:
+            out[i >> 3] &= np.uint8(~(1 << (i & 7)) & 0xFF)
+    return out
+
+
+def bitmap_selector(mask: np.ndarray) -> faiss.IDSelector:
+    """IDSelectorBitmap over a packed mask; the caller must keep `mask` alive during the search."""
+    return faiss.IDSelectorBitmap(int(mask.shape[0]) * 8, faiss.swig_ptr(mask))
+
+
+async def load_vacancy_filters() -> AttributeBitmaps:
+    db = await get_db()
+    coll = db["vacancies"]
+    projection = {"_id": 0, "idx": 1, **{c: 1 for c in FILTER_COLUMNS}}
+    rows = [d async for d in coll.find({}, projection)]
+    bitmaps = AttributeBitmaps.from_rows(rows)
+    logger.info(
+        "Filters: vacancy bitmaps over %d idx (%s)",
+        bitmaps.size,
+        ", ".join(f"{c}={len(bitmaps.values(c))}" for c in FILTER_COLUMNS),
+    )
+    return bitmaps
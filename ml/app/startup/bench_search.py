@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import sys
+import time
+
+import numpy as np
+import faiss  # type: ignore
+
+from app.config import get_settings
+from app.startup.load_embeddings import (
+    COURSE_EMBED_DIR,
+    VAC_EMBED_DIR,
+    ef_search_for,
+    iter_embedding_batches,
+    new_index,
+    search_params,
+)
+
+
+CORPORA = {
+    "vacancies": (VAC_EMBED_DIR, "faiss_index_factory"),
+    "courses": (COURSE_EMBED_DIR, "faiss_courses_index_factory"),
+}
+
+
+def _int_list(value: str) -> list[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def _recall(approx: np.ndarray, exact: np.ndarray, k: int) -> float:
+    hits = sum(len(set(a[:k].tolist()) & set(e[:k].tolist())) for a, e in zip(approx, exact))
+    return hits / (k * exact.shape[0])
+
+
+def run(corpus: str, factory: str | None, ks: list[int], efs: list[int], n_queries: int, seed: int) -> list[dict]:
+    """Recall@k of the ANN index against exact IndexFlatIP, and QPS, for every (k, efSearch) pair.
+
+    Queries are held-out corpus vectors, so neither index contains them.
+    """
+    logger = logging.getLogger(__name__)
+    dir_path, factory_setting = CORPORA[corpus]
+    factory = factory or str(getattr(get_settings(), factory_setting))
+
+    X = np.ascontiguousarray(np.vstack(list(iter_embedding_batches(dir_path))))
+    rng = np.random.default_rng(seed)
+    perm = rng.permutation(X.shape[0])
+    n_queries = min(n_queries, X.shape[0] // 10)
+    Q, base = X[perm[:n_queries]], X[perm[n_queries:]]
+    ids = np.arange(base.shape[0], dtype=np.int64)
+    logger.info("Bench: %s base=%d queries=%d dim=%d factory=%s", corpus, base.shape[0], n_queries, X.shape[1], factory)
+
+    exact = faiss.IndexFlatIP(X.shape[1])
+    exact.add(base)
+
+    t0 = time.perf_counter()
+    index = new_index(X.shape[1], factory)
+    if not index.is_trained:
+        index.train(base[rng.permutation(base.shape[0])[: get_settings().faiss_train_sample]])
+    index.add_with_ids(base, ids)
+    logger.info("Bench: built %s in %.1fs", factory, time.perf_counter() - t0)
+
+    rows: list[dict] = []
+    for k in ks:
+        k = min(k, base.shape[0])
+        t0 = time.perf_counter()
+        _, truth = exact.search(Q, k)
+        exact_qps = n_queries / (time.perf_counter() - t0)
+        for ef in [*efs, None]:
+            params = search_params(index, k, ef_search=ef)
+            t0 = time.perf_counter()
+            _, found = index.search(Q, k, params=params) if params is not None else index.search(Q, k)
+            qps = n_queries / (time.perf_counter() - t0)
+            rows.append(
+                {
+                    "k": k,
+                    "ef_search": ef if ef is not None else ef_search_for(k),
+                    "derived": ef is None,
+                    "recall": round(_recall(found, truth, k), 4),
+                    "qps": round(qps, 1),
+                    "exact_qps": round(exact_qps, 1),
+                }
+            )
+    return rows
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.startup.bench_search",
+        description="Measure recall@k and QPS of the FAISS index against exact search for several efSearch values.",
+    )
+    parser.add_argument("--corpus", choices=list(CORPORA), default="vacancies")
+    parser.add_argument("--factory", default=None, help="FAISS factory string (default: the configured one)")
+    parser.add_argument("--k", type=_int_list, default=[10, 100, 500], help="Comma-separated k values")
+    parser.add_argument("--ef", type=_int_list, default=[16, 32, 64, 128, 256, 512], help="Comma-separated efSearch values")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads (1 gives per-query latency)")
+    parser.add_argument("--json", action="store_true", help="Print rows as JSON instead of a table")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s [%(name)s] %(message)s",
+        stream=sys.stderr,
+    )
+    faiss.omp_set_num_threads(args.threads)
+    rows = run(args.corpus, args.factory, args.k, args.ef, args.queries, args.seed)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return 0
+    print(f"{'k':>5} {'efSearch':>9} {'recall@k':>9} {'QPS':>10} {'exact QPS':>10}")
+    for r in rows:
+        ef = f"{r['ef_search']}*" if r["derived"] else str(r["ef_search"])
+        print(f"{r['k']:>5} {ef:>9} {r['recall']:>9.4f} {r['qps']:>10.1f} {r['exact_qps']:>10.1f}")
+    print("* derived from k (FAISS_EF_SEARCH, FAISS_EF_SEARCH_FACTOR)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import sys
+from typing import Optional
+
+from app.config import get_settings
+from app.db.mongo import close_mongo, init_mongo
+from app.startup.load_embeddings import course_index, vacancy_index
+
+
+CORPORA = {
+    "vacancies": vacancy_index,
+    "courses": course_index,
+}
+
+
+async def _fetch_duplicates(names: list[str]) -> dict[str, Optional[list[int]]]:
+    # Duplicate clusters live in Mongo (seeded and ingested rows); without it the index keeps every row.
+    await init_mongo(get_settings())
+    try:
+        return {name: await CORPORA[name].fetch_duplicates() for name in names}
+    finally:
+        await close_mongo()
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.startup.build_index",
+        description="Build FAISS indexes offline and persist them next to the embeddings.",
+    )
+    parser.add_argument("--corpus", choices=[*CORPORA, "all"], default="all")
+    parser.add_argument("--force", action="store_true", help="Rebuild even if the manifest matches the sources")
+    parser.add_argument(
+        "--convert-store",
+        action="store_true",
+        help="Consolidate emb_*.npy shards into a single memory-mapped matrix before building",
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s [%(name)s] %(message)s",
+        stream=sys.stdout,
+    )
+    names = list(CORPORA) if args.corpus == "all" else [args.corpus]
+    duplicates = asyncio.run(_fetch_duplicates(names))
+    for name in names:
+        if args.convert_store:
+            CORPORA[name].convert_store()
+        CORPORA[name].load(force=args.force, persist=True, duplicates=duplicates[name])
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+from typing import Any, Mapping, Sequence, Tuple
+
+import polars as pl
+from pymongo import UpdateOne
+
+
+# Two catalog rows with equal key tuples are reposts of the same item. Every row stores the
+# idx of its cluster representative (the smallest idx) in `dup_of`; only representatives are
+# indexed, so retrieval returns distinct items.
+VACANCY_DUP_KEY = ("title", "salary", "experience", "job_type", "company", "location")
+COURSE_DUP_KEY = ("Course Name", "University", "Difficulty Level", "Course Rating", "Course URL")
+DUP_FIELD = "dup_of"
+
+
+def dup_key(doc: Mapping[str, Any], columns: Sequence[str]) -> Tuple[str, ...]:
+    return tuple(str(doc.get(c, "") or "") for c in columns)
+
+
+def assign_clusters(df: pl.DataFrame, columns: Sequence[str]) -> pl.DataFrame:
+    """Add `dup_of` (smallest idx among rows with the same key tuple) to a normalized catalog frame."""
+    keys = [pl.col(c).cast(pl.Utf8).fill_null("").alias(f"__key_{i}") for i, c in enumerate(columns)]
+    key_names = [f"__key_{i}" for i in range(len(columns))]
+    return (
+        df.with_columns(keys)
+        .with_columns(pl.col("idx").min().over(key_names).cast(pl.Int64).alias(DUP_FIELD))
+        .drop(key_names)
+    )
+
+
+def representatives_query() -> dict[str, Any]:
+    """Mongo filter for docs that are indexed: representatives and docs seeded before clustering."""
+    return {"$or": [{DUP_FIELD: {"$exists": False}}, {"$expr": {"$eq": [f"${DUP_FIELD}", "$idx"]}}]}
+
+
+def duplicates_query() -> dict[str, Any]:
+    """Mongo filter for docs left out of the index: cluster members other than the representative."""
+    return {DUP_FIELD: {"$exists": True}, "$expr": {"$ne": [f"${DUP_FIELD}", "$idx"]}}
+
+
+async def duplicate_idx(coll) -> list[int]:  # noqa: ANN001
+    """idx of the docs in `coll` that are not their cluster's representative, seeded or ingested."""
+    return [int(d["idx"]) async for d in coll.find(duplicates_query(), {"_id": 0, "idx": 1})]
+
+
+async def backfill_clusters(coll, df: pl.DataFrame, columns: Sequence[str]) -> None:  # noqa: ANN001
+    """Set `dup_of` on docs seeded before duplicate clustering existed.
+
+    `df` is the seeder's normalized catalog frame; it is clustered by `columns` unless it already
+    carries `dup_of`.
+    """
+    await coll.create_index(DUP_FIELD)
+    if await coll.count_documents({DUP_FIELD: {"$exists": False}}, limit=1) == 0:
+        return
+    if DUP_FIELD not in df.columns:
+        df = assign_clusters(df, columns)
+    ops = [
+        UpdateOne({"idx": int(r["idx"]), DUP_FIELD: {"$exists": False}}, {"$set": {DUP_FIELD: int(r[DUP_FIELD])}})
+        for r in df.select("idx", DUP_FIELD).to_dicts()
+    ]
+    if ops:
+        await coll.bulk_write(ops, ordered=False)
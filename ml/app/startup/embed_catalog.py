@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Optional
+
+import numpy as np
+import polars as pl
+
+from app.services.fake_llm import fake_embed
+from app.services.ingest_service import course_doc_text, vacancy_doc_text
+from app.services.llm_scheduler import llm_priority
+from app.services.yandex_sdk import embed_text_async
+from app.startup import seed_courses, seed_vacancies
+from app.startup.embedding_store import convert_shards, resolve_row_ids, shard_ranges
+from app.startup.index_files import file_checksum, shard_files
+from app.startup.load_embeddings import COURSE_EMBED_DIR, VAC_EMBED_DIR
+
+
+# Progress of a run, next to the shards it writes:
+#   <out>/embed_job.json   plan (source checksum, shard key ranges) and completed shards
+JOB_FILE = "embed_job.json"
+JOB_FORMAT_VERSION = 1
+
+Embedder = Callable[[str], Awaitable[np.ndarray]]
+
+logger = logging.getLogger(__name__)
+
+
+CORPORA: dict[str, tuple[str, Path, Callable[[pl.DataFrame], pl.DataFrame], Callable[[dict[str, Any]], str]]] = {
+    "vacancies": (seed_vacancies.PARQUET_PATH, VAC_EMBED_DIR, seed_vacancies.normalize_frame, vacancy_doc_text),
+    "courses": (seed_courses.PARQUET_PATH, COURSE_EMBED_DIR, seed_courses.normalize_frame, course_doc_text),
+}
+
+
+class RateLimiter:
+    """Spaces call starts at least 1/rate seconds apart (rate <= 0 disables it)."""
+
+    def __init__(self, rate: float) -> None:
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def _catalog_frame(parquet: str) -> pl.DataFrame:
+    df = pl.read_parquet(parquet)
+    if "idx" not in df.columns:
+        # Same numbering as the seeders.
+        df = df.with_row_count("idx", offset=1)
+    return df
+
+
+def _key_column(df: pl.DataFrame) -> str:
+    return "id" if "id" in df.columns else "idx"
+
+
+def plan_shards(keys: np.ndarray, shard_rows: int) -> list[tuple[int, int]]:
+    """Inclusive key ranges of consecutive `shard_rows` rows in key order."""
+    keys = np.sort(keys)
+    return [(int(keys[a]), int(keys[min(a + shard_rows, len(keys)) - 1])) for a in range(0, len(keys), shard_rows)]
+
+
+def _shard_name(key_start: int, key_end: int) -> str:
+    return f"emb_{key_start}-{key_end}.npy"
+
+
+def _read_job(out_dir: Path) -> Optional[dict[str, Any]]:
+    path = out_dir / JOB_FILE
+    if not path.exists():
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            job = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return job if job.get("format") == JOB_FORMAT_VERSION else None
+
+
+def _write_job(out_dir: Path, job: dict[str, Any]) -> None:
+    path = out_dir / JOB_FILE
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(job, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def _save_shard(path: Path, X: np.ndarray) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.save(f, X)
+    os.replace(tmp, path)
+
+
+async def _embed_rows(
+    texts: list[str],
+    embed: Embedder,
+    sem: asyncio.Semaphore,
+    limiter: RateLimiter,
+) -> np.ndarray:
+    # Transient failures are retried inside embed_text_async by the `embed_doc` call policy.
+    async def one(text: str) -> np.ndarray:
+        async with sem:
+            await limiter.wait()
+            return np.asarray(await embed(text), dtype="float32")
+
+    return np.vstack(await asyncio.gather(*(one(t) for t in texts)))
+
+
+async def run(
+    corpus: str,
+    parquet: str,
+    out_dir: Path,
+    embed: Embedder,
+    model: str,
+    shard_rows: int = 1000,
+    concurrency: int = 8,
+    rate: float = 0.0,
+    build_store: bool = True,
+) -> dict[str, Any]:
+    """Embed every catalog row into emb_<start>-<end>.npy shards under out_dir.
+
+    Shards are keyed by the source `id` (or `idx`) like the existing ones. Each finished shard is
+    written atomically and recorded in embed_job.json, so a rerun skips it. Rows are read per
+    shard, so memory stays at one shard of texts and vectors.
+    """
+    _, _, normalize, doc_text = CORPORA[corpus]
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    catalog = _catalog_frame(parquet)
+    key_col = _key_column(catalog)
+    keys = catalog[key_col].cast(pl.Int64).to_numpy()
+    if len(np.unique(keys)) != len(keys):
+        raise ValueError(f"{parquet}: column {key_col!r} has duplicate values")
+    checksum = file_checksum(Path(parquet))
+
+    job = _read_job(out_dir)
+    if job is not None and (
+        job.get("source_checksum") != checksum or job.get("shard_rows") != shard_rows or job.get("model") != model
+    ):
+        raise ValueError(f"{out_dir} holds a run over another source, shard size or model; use a new directory")
+    if job is None:
+        foreign = [f.name for f in shard_files(out_dir)]
+        if foreign:
+            raise ValueError(f"{out_dir} already has {len(foreign)} shards not written by this job")
+        job = {
+            "format": JOB_FORMAT_VERSION,
+            "corpus": corpus,
+            "source": str(parquet),
+            "source_checksum": checksum,
+            "key_column": key_col,
+            "model": model,
+            "shard_rows": shard_rows,
+            "shards": [list(r) for r in plan_shards(keys, shard_rows)],
+            "completed": [],
+            "created_at": datetime.utcnow().isoformat(),
+        }
+        _write_job(out_dir, job)
+
+    done = set(job["completed"])
+    pending = [
+        (a, b) for a, b in job["shards"]
+        if _shard_name(a, b) not in done or not (out_dir / _shard_name(a, b)).exists()
+    ]
+    logger.info(
+        "Embed: %s %d shards, %d done, %d to go",
+        corpus, len(job["shards"]), len(job["shards"]) - len(pending), len(pending),
+    )
+
+    sem = asyncio.Semaphore(max(1, concurrency))
+    limiter = RateLimiter(rate)
+    t_start = time.perf_counter()
+    embedded = 0
+    for key_start, key_end in pending:
+        t0 = time.perf_counter()
+        part = (
+            pl.scan_parquet(parquet)
+            .with_row_count("__row")
+            .filter(pl.col(key_col).cast(pl.Int64).is_between(key_start, key_end))
+            .sort(pl.col(key_col).cast(pl.Int64))
+            .collect()
+        )
+        if "idx" not in part.columns:
+            part = part.with_columns((pl.col("__row") + 1).alias("idx"))
+        texts = [doc_text(r) for r in normalize(part.drop("__row")).to_dicts()]
+        X = await _embed_rows(texts, embed, sem, limiter)
+        name = _shard_name(key_start, key_end)
+        _save_shard(out_dir / name, X)
+        if name not in done:
+            job["completed"].append(name)
+        job["dim"] = int(X.shape[1])
+        _write_job(out_dir, job)
+        embedded += len(texts)
+        dt = time.perf_counter() - t0
+        logger.info("Embed: %s %d rows in %.3fs (%.1f rows/s)", name, len(texts), dt, len(texts) / max(dt, 1e-9))
+
+    if build_store:
+        # resolve_row_ids checks each shard's row count against the catalog keys in its range.
+        ranges = shard_ranges(shard_files(out_dir))
+        store = convert_shards(
+            out_dir,
+            ids=resolve_row_ids(ranges, keys, catalog["idx"].cast(pl.Int64).to_numpy()),
+        )
+        logger.info("Embed: store rows=%d dim=%d", store.rows, store.dim)
+
+    total = time.perf_counter() - t_start
+    return {
+        "corpus": corpus,
+        "shards": len(job["shards"]),
+        "embedded_rows": embedded,
+        "seconds": round(total, 3),
+        "rows_per_second": round(embedded / total, 1) if total > 0 else 0.0,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.startup.embed_catalog",
+        description="Embed a catalog parquet with the doc model into emb_*.npy shards the loader reads; resumable.",
+    )
+    parser.add_argument("--corpus", choices=list(CORPORA), required=True)
+    parser.add_argument("--parquet", default=None, help="Source parquet (default: the seeder's path)")
+    parser.add_argument("--out", default=None, help="Output directory (default: a .new sibling of the corpus embeddings)")
+    parser.add_argument("--shard-rows", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=8, help="Max embedding calls in flight")
+    parser.add_argument("--rate", type=float, default=10.0, help="Max embedding calls started per second (0: no limit)")
+    parser.add_argument("--fake", action="store_true", help="Use a deterministic local embedder instead of the API")
+    parser.add_argument("--dim", type=int, default=256, help="Vector size of the --fake embedder")
+    parser.add_argument("--no-store", action="store_true", help="Only write shards, skip the consolidated store")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s [%(name)s] %(message)s",
+        stream=sys.stderr,
+    )
+    parquet, embed_dir, _, _ = CORPORA[args.corpus]
+    parquet = args.parquet or parquet
+    # Writing next to the live shards keeps the running index intact until the directories are swapped.
+    out_dir = Path(args.out) if args.out else embed_dir.with_name(embed_dir.name + ".new")
+
+    if args.fake:
+        dim = args.dim
+
+        async def embed(text: str) -> np.ndarray:
+            return fake_embed(text, dim)
+
+        model = f"fake-{dim}"
+    else:
+
+        async def embed(text: str) -> np.ndarray:
+            with llm_priority("batch"):
+                return await embed_text_async(text, "doc", cache=False)
+
+        model = "doc"
+
+    summary = asyncio.run(
+        run(
+            args.corpus,
+            parquet,
+            out_dir,
+            embed,
+            model,
+            shard_rows=args.shard_rows,
+            concurrency=args.concurrency,
+            rate=args.rate,
+            build_store=not args.no_store,
+        )
+    )
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,357 @@
+from __future__ import annotations
+
+import json
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Optional
+
+import numpy as np
+
+from app.startup.index_files import file_checksum, shard_files
+
+
+# Consolidated embedding store, one per corpus:
+#   <embeddings>/<corpus>/store/manifest.json
+#   <embeddings>/<corpus>/store/matrix.bin   (rows x dim, C order, no header)
+STORE_DIR_NAME = "store"
+MANIFEST_NAME = "manifest.json"
+MATRIX_NAME = "matrix.bin"
+IDS_NAME = "ids.npy"
+STORE_FORMAT_VERSION = 1
+
+
+class EmbeddingStore:
+    def __init__(self, dir_path: Path, manifest: dict[str, Any], matrix: np.ndarray) -> None:
+        self.dir_path = dir_path
+        self.manifest = manifest
+        self.matrix = matrix
+
+    @property
+    def rows(self) -> int:
+        return int(self.manifest["rows"])
+
+    @property
+    def dim(self) -> int:
+        return int(self.manifest["dim"])
+
+    @property
+    def normalized(self) -> bool:
+        return bool(self.manifest.get("normalized", False))
+
+    @property
+    def ranges(self) -> list[dict[str, Any]]:
+        return list(self.manifest.get("ranges", []))
+
+    @property
+    def checksum(self) -> str:
+        return str(self.manifest.get("checksum", ""))
+
+    def load_ids(self) -> Optional[np.ndarray]:
+        name = self.manifest.get("ids_file")
+        if not name:
+            return None
+        return np.load(store_dir(self.dir_path) / str(name)).astype(np.int64)
+
+
+def store_dir(dir_path: Path) -> Path:
+    return dir_path / STORE_DIR_NAME
+
+
+def _parse_shard_range(path: Path) -> tuple[int, int]:
+    start, end = path.stem.split("_")[1].split("-")
+    return int(start), int(end)
+
+
+def shard_ranges(files: list[Path]) -> list[dict[str, Any]]:
+    ranges: list[dict[str, Any]] = []
+    row = 0
+    for f in files:
+        rows = int(np.load(f, mmap_mode="r").shape[0])
+        key_start, key_end = _parse_shard_range(f)
+        ranges.append(
+            {
+                "row_start": row,
+                "row_end": row + rows,
+                "key_start": key_start,
+                "key_end": key_end,
+                "source": f.name,
+            }
+        )
+        row += rows
+    return ranges
+
+
+def shard_stamps(files: list[Path]) -> dict[str, dict[str, int]]:
+    """Size and mtime of each shard: cheap to take at every startup, unlike a checksum."""
+    stamps: dict[str, dict[str, int]] = {}
+    for f in files:
+        st = f.stat()
+        stamps[f.name] = {"size": int(st.st_size), "mtime_ns": int(st.st_mtime_ns)}
+    return stamps
+
+
+def stale_shards(dir_path: Path, manifest: dict[str, Any]) -> list[str]:
+    """Shards added, rewritten or removed since the store was converted from them."""
+    current = shard_stamps(shard_files(dir_path))
+    recorded = manifest.get("shards")
+    if recorded is None:
+        # Stores converted before shard stamps were recorded: compare against the conversion time.
+        known = {r.get("source") for r in manifest.get("ranges", []) if "key_start" in r}
+        created = manifest.get("created_at")
+        cutoff = (
+            datetime.fromisoformat(created).replace(tzinfo=timezone.utc).timestamp() * 1e9 if created else None
+        )
+        return sorted(
+            name
+            for name, stamp in current.items()
+            if name not in known or (cutoff is not None and stamp["mtime_ns"] > cutoff)
+        )
+    return sorted(name for name in set(current) | set(recorded) if current.get(name) != recorded.get(name))
+
+
+def has_appended_rows(manifest: dict[str, Any]) -> bool:
+    """Whether ingestion appended or overwrote rows (those vectors exist only in the store, not in shards)."""
+    return bool(manifest.get("overwritten")) or any("key_start" not in r for r in manifest.get("ranges", []))
+
+
+def resolve_row_ids(
+    ranges: list[dict[str, Any]],
+    catalog_keys: Optional[np.ndarray] = None,
+    catalog_idx: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Map every store row to its catalog idx using the shard key ranges.
+
+    A shard emb_<start>-<end>.npy holds the catalog rows whose source key lies in [start, end],
+    in key order. Dense ranges (end - start + 1 == rows) need no catalog; sparse ones are
+    resolved through (catalog_keys, catalog_idx), which are also applied to dense keys.
+    """
+    total = int(ranges[-1]["row_end"]) if ranges else 0
+    out = np.empty(total, dtype=np.int64)
+    sorted_keys = sorted_idx = None
+    if catalog_keys is not None and catalog_idx is not None:
+        order = np.argsort(catalog_keys, kind="stable")
+        sorted_keys = np.asarray(catalog_keys, dtype=np.int64)[order]
+        sorted_idx = np.asarray(catalog_idx, dtype=np.int64)[order]
+
+    for r in ranges:
+        a, b = int(r["row_start"]), int(r["row_end"])
+        k0, k1 = int(r["key_start"]), int(r["key_end"])
+        n = b - a
+        if sorted_keys is not None and sorted_idx is not None:
+            lo = int(np.searchsorted(sorted_keys, k0, side="left"))
+            hi = int(np.searchsorted(sorted_keys, k1, side="right"))
+            if hi - lo != n:
+                raise ValueError(
+                    f"Shard {r.get('source')} has {n} rows but the catalog has {hi - lo} keys in [{k0}, {k1}]"
+                )
+            out[a:b] = sorted_idx[lo:hi]
+        elif k1 - k0 + 1 == n:
+            out[a:b] = np.arange(k0, k1 + 1, dtype=np.int64)
+        else:
+            raise ValueError(f"Shard {r.get('source')} has a sparse key range; a catalog is required to resolve ids")
+    return out
+
+
+def _write_manifest(dir_path: Path, manifest: dict[str, Any]) -> None:
+    path = store_dir(dir_path) / MANIFEST_NAME
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def read_store_manifest(dir_path: Path) -> Optional[dict[str, Any]]:
+    path = store_dir(dir_path) / MANIFEST_NAME
+    if not path.exists():
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("format") != STORE_FORMAT_VERSION:
+        return None
+    return manifest
+
+
+def open_store(dir_path: Path, mode: str = "r") -> Optional[EmbeddingStore]:
+    """Memory-map the consolidated matrix for dir_path, or None if there is no store."""
+    manifest = read_store_manifest(dir_path)
+    if manifest is None:
+        return None
+    path = store_dir(dir_path) / str(manifest.get("file", MATRIX_NAME))
+    if not path.is_file():
+        return None
+    rows, dim = int(manifest["rows"]), int(manifest["dim"])
+    dtype = np.dtype(manifest.get("dtype", "float32"))
+    if rows == 0:
+        matrix = np.empty((0, dim), dtype=dtype)
+    else:
+        matrix = np.memmap(path, dtype=dtype, mode=mode, shape=(rows, dim))
+    return EmbeddingStore(dir_path, manifest, matrix)
+
+
+def convert_shards(
+    dir_path: Path,
+    normalize: bool = True,
+    ids: Optional[np.ndarray] = None,
+    batch_rows: int = 4096,
+) -> EmbeddingStore:
+    """Write the emb_<start>-<end>.npy shards of dir_path into one contiguous float32 matrix.
+
+    Shards are copied one at a time, so peak memory is a single shard regardless of corpus size.
+    """
+    files = shard_files(dir_path)
+    if not files:
+        raise FileNotFoundError(f"No embedding files found in {dir_path}")
+
+    shapes = [np.load(f, mmap_mode="r").shape for f in files]
+    dims = {s[1] for s in shapes}
+    if len(dims) != 1:
+        raise ValueError(f"Embedding shards in {dir_path} have mixed dimensions: {sorted(dims)}")
+    dim = dims.pop()
+    rows = sum(s[0] for s in shapes)
+
+    if ids is not None and len(ids) != rows:
+        raise ValueError(f"Got {len(ids)} ids for {rows} embedding rows")
+
+    out_dir = store_dir(dir_path)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    tmp = out_dir / (MATRIX_NAME + ".tmp")
+    out = np.memmap(tmp, dtype="float32", mode="w+", shape=(rows, dim))
+
+    row = 0
+    for f, shape in zip(files, shapes):
+        src = np.load(f, mmap_mode="r")
+        for a in range(0, shape[0], batch_rows):
+            block = np.asarray(src[a:a + batch_rows], dtype="float32")
+            if normalize:
+                block = block / (np.linalg.norm(block, axis=1, keepdims=True) + 1e-12)
+            out[row + a: row + a + block.shape[0]] = block
+        row += shape[0]
+    out.flush()
+    del out
+    os.replace(tmp, out_dir / MATRIX_NAME)
+    if ids is not None:
+        np.save(out_dir / IDS_NAME, np.asarray(ids, dtype=np.int64))
+
+    manifest = {
+        "format": STORE_FORMAT_VERSION,
+        "file": MATRIX_NAME,
+        "rows": rows,
+        "dim": dim,
+        "dtype": "float32",
+        "normalized": normalize,
+        "ranges": shard_ranges(files),
+        "shards": shard_stamps(files),
+        "ids_file": IDS_NAME if ids is not None else None,
+        "checksum": file_checksum(out_dir / MATRIX_NAME),
+        "created_at": datetime.utcnow().isoformat(),
+    }
+    _write_manifest(dir_path, manifest)
+    store = open_store(dir_path)
+    assert store is not None
+    return store
+
+
+def _save_ids(dir_path: Path, ids: np.ndarray) -> None:
+    path = store_dir(dir_path) / IDS_NAME
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.save(f, np.asarray(ids, dtype=np.int64))
+    os.replace(tmp, path)
+
+
+def set_store_ids(dir_path: Path, ids: np.ndarray) -> EmbeddingStore:
+    manifest = read_store_manifest(dir_path)
+    if manifest is None:
+        raise FileNotFoundError(f"No embedding store in {dir_path}")
+    if len(ids) != int(manifest["rows"]):
+        raise ValueError(f"Got {len(ids)} ids for {manifest['rows']} embedding rows")
+    _save_ids(dir_path, ids)
+    manifest["ids_file"] = IDS_NAME
+    _write_manifest(dir_path, manifest)
+    store = open_store(dir_path)
+    assert store is not None
+    return store
+
+
+def upsert_rows(dir_path: Path, ids: np.ndarray, vectors: np.ndarray, source: str) -> EmbeddingStore:
+    """Write vectors (and their catalog ids) into an existing store.
+
+    Ids already in the store get their row overwritten in place; the rest are appended. Existing
+    memory maps stay valid: the file only grows, and readers see new rows once they reopen the
+    store with the updated manifest. Writing an id also lifts its tombstone (see mark_removed).
+    """
+    manifest = read_store_manifest(dir_path)
+    if manifest is None:
+        raise FileNotFoundError(f"No embedding store in {dir_path}")
+    if not manifest.get("ids_file"):
+        raise ValueError(f"Embedding store in {dir_path} has no ids; set them before appending")
+    rows, dim = int(manifest["rows"]), int(manifest["dim"])
+    dtype = np.dtype(manifest.get("dtype", "float32"))
+    X = np.asarray(vectors, dtype=dtype).reshape(-1, dim)
+    ids = np.asarray(ids, dtype=np.int64)
+    if len(ids) != X.shape[0]:
+        raise ValueError(f"Got {len(ids)} ids for {X.shape[0]} vectors")
+    if manifest.get("normalized"):
+        X = X / (np.linalg.norm(X, axis=1, keepdims=True) + 1e-12)
+
+    out_dir = store_dir(dir_path)
+    path = out_dir / str(manifest.get("file", MATRIX_NAME))
+    old_ids = np.load(out_dir / str(manifest["ids_file"])).astype(np.int64)[:rows]
+    order = np.argsort(old_ids, kind="stable")
+    pos = np.searchsorted(old_ids, ids, sorter=order)
+    pos = np.minimum(pos, max(rows - 1, 0))
+    existing = (old_ids[order[pos]] == ids) if rows else np.zeros(len(ids), dtype=bool)
+    row_size = dim * dtype.itemsize
+    with open(path, "r+b") as f:
+        # Drop any tail left by an append that crashed before its manifest was written.
+        f.truncate(rows * row_size)
+        for row, vec in zip(order[pos[existing]].tolist(), X[existing]):
+            f.seek(row * row_size)
+            f.write(np.ascontiguousarray(vec).tobytes())
+        f.seek(0, os.SEEK_END)
+        f.write(np.ascontiguousarray(X[~existing]).tobytes())
+
+    added = int((~existing).sum())
+    _save_ids(dir_path, np.concatenate([old_ids, ids[~existing]]))
+
+    manifest["rows"] = rows + added
+    manifest["ids_file"] = IDS_NAME
+    if added:
+        manifest.setdefault("ranges", []).append({"row_start": rows, "row_end": rows + added, "source": source})
+    if existing.any():
+        manifest["overwritten"] = int(manifest.get("overwritten", 0)) + int(existing.sum())
+    if manifest.get("removed"):
+        manifest["removed"] = sorted(set(manifest["removed"]) - set(ids.tolist()))
+    manifest["checksum"] = file_checksum(path)
+    manifest["updated_at"] = datetime.utcnow().isoformat()
+    _write_manifest(dir_path, manifest)
+    store = open_store(dir_path)
+    assert store is not None
+    return store
+
+
+def mark_removed(dir_path: Path, ids: Iterable[int]) -> list[int]:
+    """Tombstone catalog ids in the store manifest; returns all tombstones.
+
+    Their rows stay in the matrix (and in indexes built from it) but are filtered out of search.
+    """
+    manifest = read_store_manifest(dir_path)
+    if manifest is None:
+        raise FileNotFoundError(f"No embedding store in {dir_path}")
+    removed = sorted(set(manifest.get("removed", [])) | {int(i) for i in ids})
+    manifest["removed"] = removed
+    manifest["updated_at"] = datetime.utcnow().isoformat()
+    _write_manifest(dir_path, manifest)
+    return removed
+
+
+def iter_normalized_batches(matrix: np.ndarray, normalized: bool, batch_rows: int = 16384) -> Iterator[np.ndarray]:
+    for a in range(0, matrix.shape[0], batch_rows):
+        block = np.ascontiguousarray(matrix[a:a + batch_rows], dtype="float32")
+        if not normalized:
+            block = block / (np.linalg.norm(block, axis=1, keepdims=True) + 1e-12)
+        yield block
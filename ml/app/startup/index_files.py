@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Optional
+
+import faiss  # type: ignore
+
+
+# Persisted indexes live next to the shards they were built from:
+#   <embeddings>/<corpus>/index/manifest.json
+#   <embeddings>/<corpus>/index/index_v<N>.faiss
+INDEX_DIR_NAME = "index"
+MANIFEST_NAME = "manifest.json"
+INDEX_FORMAT_VERSION = 2
+
+# Map the stored vectors from the page cache instead of copying them into RAM.
+# Indexes opened this way are read-only. Not every index type accepts every flag
+# combination (IVF inverted lists reject IO_FLAG_MMAP_IFC), so they are tried in order.
+MMAP_READ_FLAGS = [
+    faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | faiss.IO_FLAG_READ_ONLY,
+    faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY,
+]
+
+
+def shard_files(dir_path: Path) -> list[Path]:
+    return sorted(
+        dir_path.glob("emb_*.npy"),
+        key=lambda x: int(x.stem.split("_")[1].split("-")[0])
+    )
+
+
+def file_checksum(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def source_checksums(files: list[Path]) -> dict[str, str]:
+    return {f.name: file_checksum(f) for f in files}
+
+
+def index_dir(dir_path: Path) -> Path:
+    return dir_path / INDEX_DIR_NAME
+
+
+def read_manifest(dir_path: Path) -> Optional[dict[str, Any]]:
+    path = index_dir(dir_path) / MANIFEST_NAME
+    if not path.exists():
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json_atomic(path: Path, data: dict[str, Any]) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def manifest_matches(manifest: Optional[dict[str, Any]], checksums: dict[str, str], index_type: str) -> bool:
+    if not manifest:
+        return False
+    return (
+        manifest.get("format") == INDEX_FORMAT_VERSION
+        and manifest.get("index_type") == index_type
+        and manifest.get("checksums") == checksums
+    )
+
+
+def write_index(
+    index: faiss.Index,
+    dir_path: Path,
+    checksums: dict[str, str],
+    index_type: str,
+    params: Optional[dict[str, Any]] = None,
+) -> Path:
+    out_dir = index_dir(dir_path)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    prev = read_manifest(dir_path)
+    version = int(prev.get("version", 0)) + 1 if prev else 1
+    name = f"index_v{version}.faiss"
+    path = out_dir / name
+    tmp = out_dir / (name + ".tmp")
+    faiss.write_index(index, str(tmp))
+    os.replace(tmp, path)
+
+    manifest = {
+        "format": INDEX_FORMAT_VERSION,
+        "version": version,
+        "file": name,
+        "index_type": index_type,
+        "ntotal": int(index.ntotal),
+        "dim": int(index.d),
+        "params": params or {},
+        "checksums": checksums,
+        "created_at": datetime.utcnow().isoformat(),
+    }
+    _write_json_atomic(out_dir / MANIFEST_NAME, manifest)
+
+    # Keep the previous version for rollback, drop anything older.
+    keep = {name, prev.get("file") if prev else None}
+    for old in out_dir.glob("index_v*.faiss"):
+        if old.name not in keep:
+            old.unlink(missing_ok=True)
+    return path
+
+
+def load_index(
+    dir_path: Path,
+    checksums: dict[str, str],
+    index_type: str,
+    mmap: bool = True,
+) -> tuple[Optional[faiss.Index], Optional[Path]]:
+    """Return (index, mapped_path); mapped_path is set when the index is memory-mapped from it."""
+    manifest = read_manifest(dir_path)
+    if not manifest_matches(manifest, checksums, index_type):
+        return None, None
+    path = index_dir(dir_path) / str(manifest.get("file", ""))
+    if not path.is_file():
+        return None, None
+    if mmap:
+        for flags in MMAP_READ_FLAGS:
+            try:
+                return faiss.read_index(str(path), flags), path
+            except RuntimeError:
+                continue
+    return faiss.read_index(str(path)), None
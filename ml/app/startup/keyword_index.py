@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import logging
+import math
+import re
+from collections import Counter
+from typing import Any, Iterable, Mapping, Optional, Sequence
+
+import numpy as np
+
+from app.db.mongo import get_db
+from app.startup.duplicates import representatives_query
+
+
+VACANCY_FIELDS = ("title", "key_skills", "description")
+COURSE_FIELDS = ("Course Name", "Skills")
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Keeps "c++", "c#", "1c" and "node.js"-style parts ("node", "js") as separate keywords.
+_TOKEN_RE = re.compile(r"[0-9a-zа-яё]+[+#]*")
+
+logger = logging.getLogger(__name__)
+
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN_RE.findall(text.lower().replace("ё", "е"))
+
+
+def doc_text(doc: Mapping[str, Any], fields: Sequence[str]) -> str:
+    return "\n".join(str(doc[f]) for f in fields if doc.get(f))
+
+
+class KeywordIndex:
+    """BM25 inverted index over catalog docs, ids are catalog `idx` values.
+
+    Postings are stored as flat arrays sorted by term (CSR layout), so the whole index is a
+    handful of numpy arrays. Instances are immutable; with_docs returns a rebuilt copy.
+    """
+
+    def __init__(
+        self,
+        fields: Sequence[str],
+        vocab: dict[str, int],
+        doc_idx: np.ndarray,
+        doc_len: np.ndarray,
+        term_ptr: np.ndarray,
+        post_doc: np.ndarray,
+        post_tf: np.ndarray,
+    ) -> None:
+        self.fields = tuple(fields)
+        self.vocab = vocab
+        self.doc_idx = doc_idx
+        self.doc_len = doc_len
+        self.term_ptr = term_ptr
+        self.post_doc = post_doc
+        self.post_tf = post_tf
+        self.avgdl = float(doc_len.mean()) if doc_len.size else 0.0
+
+    @property
+    def size(self) -> int:
+        return int(self.doc_idx.shape[0])
+
+    @classmethod
+    def build(cls, docs: Iterable[Mapping[str, Any]], fields: Sequence[str]) -> KeywordIndex:
+        return cls._from_parts(fields, {}, [], [], [], [], docs)
+
+    @classmethod
+    def _from_parts(
+        cls,
+        fields: Sequence[str],
+        vocab: dict[str, int],
+        doc_idx: list[int],
+        doc_len: list[int],
+        terms: list[np.ndarray],
+        tfs: list[np.ndarray],
+        docs: Iterable[Mapping[str, Any]],
+    ) -> KeywordIndex:
+        rows: list[np.ndarray] = [np.full(len(t), r, dtype=np.int32) for r, t in enumerate(terms)]
+        for d in docs:
+            if d.get("idx") is None:
+                continue
+            counts = Counter(tokenize(doc_text(d, fields)))
+            r = len(doc_idx)
+            doc_idx.append(int(d["idx"]))
+            doc_len.append(sum(counts.values()))
+            ids = np.fromiter((vocab.setdefault(t, len(vocab)) for t in counts), dtype=np.int32, count=len(counts))
+            terms.append(ids)
+            tfs.append(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+            rows.append(np.full(len(counts), r, dtype=np.int32))
+
+        term = np.concatenate(terms) if terms else np.empty(0, dtype=np.int32)
+        order = np.argsort(term, kind="stable")
+        post_doc = (np.concatenate(rows) if rows else np.empty(0, dtype=np.int32))[order]
+        post_tf = (np.concatenate(tfs) if tfs else np.empty(0, dtype=np.float32))[order]
+        term_ptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term, minlength=len(vocab)), out=term_ptr[1:])
+        return cls(
+            fields,
+            vocab,
+            np.asarray(doc_idx, dtype=np.int64),
+            np.asarray(doc_len, dtype=np.float32),
+            term_ptr,
+            post_doc,
+            post_tf,
+        )
+
+    def with_docs(self, docs: Iterable[Mapping[str, Any]]) -> KeywordIndex:
+        """A rebuilt copy with docs added; a doc whose idx is already indexed replaces it."""
+        docs = [d for d in docs if d.get("idx") is not None]
+        replaced = np.isin(self.doc_idx, [int(d["idx"]) for d in docs])
+        keep = np.flatnonzero(~replaced)
+
+        # Unpack the kept docs' postings into per-doc term/tf arrays, renumbering rows.
+        term_of_post = np.repeat(np.arange(len(self.vocab), dtype=np.int32), np.diff(self.term_ptr))
+        new_row = np.full(self.size, -1, dtype=np.int64)
+        new_row[keep] = np.arange(len(keep))
+        kept = new_row[self.post_doc] >= 0
+        by_doc = np.argsort(new_row[self.post_doc][kept], kind="stable")
+        post_rows = new_row[self.post_doc][kept][by_doc]
+        splits = np.cumsum(np.bincount(post_rows, minlength=len(keep)))[:-1]
+        terms = np.split(term_of_post[kept][by_doc], splits) if len(keep) else []
+        tfs = np.split(self.post_tf[kept][by_doc], splits) if len(keep) else []
+
+        return KeywordIndex._from_parts(
+            self.fields,
+            dict(self.vocab),
+            self.doc_idx[keep].tolist(),
+            self.doc_len[keep].astype(np.int64).tolist(),
+            list(terms),
+            list(tfs),
+            docs,
+        )
+
+    def search(self, query: str, k: int = 100, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """Catalog idx of the k best BM25 matches for query, restricted to a packed idx mask if given."""
+        term_ids = {self.vocab[t] for t in tokenize(query) if t in self.vocab}
+        if not term_ids or self.size == 0:
+            return np.empty(0, dtype=np.int64)
+        n = self.size
+        docs_parts: list[np.ndarray] = []
+        score_parts: list[np.ndarray] = []
+        for t in term_ids:
+            a, b = int(self.term_ptr[t]), int(self.term_ptr[t + 1])
+            df = b - a
+            idf = math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+            docs = self.post_doc[a:b]
+            tf = self.post_tf[a:b]
+            norm = BM25_K1 * (1.0 - BM25_B + BM25_B * self.doc_len[docs] / max(self.avgdl, 1e-6))
+            docs_parts.append(docs)
+            score_parts.append(idf * tf * (BM25_K1 + 1.0) / (tf + norm))
+        scores = np.bincount(np.concatenate(docs_parts), weights=np.concatenate(score_parts), minlength=n)
+        if mask is not None:
+            bits = np.unpackbits(mask, bitorder="little")
+            allowed = np.zeros(n, dtype=bool)
+            in_range = self.doc_idx < bits.shape[0]
+            allowed[in_range] = bits[self.doc_idx[in_range]].astype(bool)
+            scores[~allowed] = 0.0
+        hits = np.flatnonzero(scores > 0)
+        if hits.size > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return self.doc_idx[hits]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int, rrf_k: int = 60) -> np.ndarray:
+    """Merge ranked id lists by sum of 1 / (rrf_k + rank); ties keep first-seen order."""
+    scores: dict[int, float] = {}
+    for ranking in rankings:
+        for rank, i in enumerate(ranking):
+            scores[int(i)] = scores.get(int(i), 0.0) + 1.0 / (rrf_k + rank + 1)
+    fused = sorted(scores, key=lambda i: -scores[i])
+    return np.asarray(fused[: int(k)], dtype=np.int64)
+
+
+async def load_keyword_index(collection: str, fields: Sequence[str]) -> KeywordIndex:
+    db = await get_db()
+    projection = {"_id": 0, "idx": 1, **{f: 1 for f in fields}}
+    # Reposts are collapsed into their cluster representative, as in the FAISS index.
+    docs = [d async for d in db[collection].find(representatives_query(), projection)]
+    index = KeywordIndex.build(docs, fields)
+    logger.info("Keywords: %s index over %d docs (%d terms)", collection, index.size, len(index.vocab))
+    return index
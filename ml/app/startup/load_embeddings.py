@@ -1,12 +1,52 @@
 from __future__ import annotations
 
+import hashlib
+import logging
+import math
 import os
+import threading
 from pathlib import Path
-from typing import Optional
+from typing import Awaitable, Callable, Iterable, Iterator, Mapping, Optional, Sequence
 
 import numpy as np
 import faiss  # type: ignore
 
+from app.config import get_settings
+from app.startup.attribute_filters import (
+    AttributeBitmaps,
+    bitmap_selector,
+    clear_ids,
+    load_vacancy_filters,
+    mask_count,
+    mask_ids,
+)
+from app.startup.embedding_store import (
+    STORE_DIR_NAME,
+    EmbeddingStore,
+    convert_shards,
+    has_appended_rows,
+    iter_normalized_batches,
+    mark_removed,
+    open_store,
+    read_store_manifest,
+    resolve_row_ids,
+    set_store_ids,
+    shard_ranges,
+    stale_shards,
+    upsert_rows,
+)
+from app.startup.keyword_index import (
+    COURSE_FIELDS,
+    VACANCY_FIELDS,
+    KeywordIndex,
+    load_keyword_index,
+)
+from app.startup.index_files import load_index, shard_files, source_checksums, write_index
+from app.startup.seed_courses import load_catalog_keys as load_course_keys
+from app.startup.seed_courses import load_duplicate_idx as load_course_duplicates
+from app.startup.seed_vacancies import load_catalog_keys as load_vacancy_keys
+from app.startup.seed_vacancies import load_duplicate_idx as load_vacancy_duplicates
+
 
 # Resolve embeddings directory:
 # 1) EMBEDDINGS_DIR env
@@ -22,72 +62,573 @@ else:
 VAC_EMBED_DIR = BASE_EMBED_DIR / 'vacancies'
 COURSE_EMBED_DIR = BASE_EMBED_DIR / 'courses'
 
-faiss_index: Optional[faiss.Index] = None
-faiss_index_courses: Optional[faiss.Index] = None
+HNSW_EF_CONSTRUCTION = 200
+# Filters matching at most this many items are scored exactly instead of through the graph,
+# where very selective filters starve the HNSW traversal of allowed neighbours.
+FILTER_EXACT_MAX = 4096
+
+logger = logging.getLogger(__name__)
+
+CatalogKeys = Callable[[], Optional[tuple[np.ndarray, np.ndarray]]]
 
 
-def _load_all_embeddings(dir_path: Path) -> np.ndarray:
-    files = sorted(
-        dir_path.glob("emb_*.npy"),
-        key=lambda x: int(x.stem.split("_")[1].split("-")[0])
-    )
+def iter_embedding_batches(dir_path: Path) -> Iterator[np.ndarray]:
+    """Yield L2-normalized float32 blocks, preferring the consolidated store over shards."""
+    store = open_store(dir_path)
+    if store is not None:
+        yield from iter_normalized_batches(store.matrix, store.normalized)
+        return
+    files = shard_files(dir_path)
     if not files:
         raise FileNotFoundError(f"No embedding files found in {dir_path}")
-    arrays = []
     for f in files:
-        arr = np.load(f).astype("float32")
-        arrays.append(arr)
-    X = np.vstack(arrays)
-    return X
+        yield from iter_normalized_batches(np.load(f), normalized=False)
+
+
+def _source_checksums(dir_path: Path) -> dict[str, str]:
+    manifest = read_store_manifest(dir_path)
+    if manifest is not None and manifest.get("checksum"):
+        return {f"{STORE_DIR_NAME}/{manifest.get('file')}": str(manifest["checksum"])}
+    return source_checksums(shard_files(dir_path))
 
 
-def build_faiss() -> None:
-    global faiss_index, faiss_index_courses
-    # Vacancies
+def resolve_ids(dir_path: Path, catalog_keys: Optional[CatalogKeys] = None) -> Optional[np.ndarray]:
+    """Catalog idx for every embedding row of dir_path, or None to keep plain row positions."""
+    store = open_store(dir_path)
+    if store is not None:
+        ids = store.load_ids()
+        if ids is not None:
+            return ids
+        ranges = store.ranges
+    else:
+        ranges = shard_ranges(shard_files(dir_path))
     try:
-        vac_dir = VAC_EMBED_DIR 
-        X = _load_all_embeddings(vac_dir)
-        norms = np.linalg.norm(X, axis=1, keepdims=True) + 1e-12
-        Xn = X / norms
-        dim = Xn.shape[1]
-        index = faiss.IndexHNSWFlat(dim, 32)
-        index.hnsw.efConstruction = 200
-        index.add(Xn)
-        faiss_index = index
-    except Exception:
-        faiss_index = None
+        keys = catalog_keys() if catalog_keys is not None else None
+        return resolve_row_ids(ranges, *keys) if keys else resolve_row_ids(ranges)
+    except Exception as e:
+        logger.warning("FAISS: %s ids fall back to row positions: %s", dir_path.name, e)
+        return None
+
+
+def _total_rows(dir_path: Path) -> int:
+    store = open_store(dir_path)
+    if store is not None:
+        return store.rows
+    ranges = shard_ranges(shard_files(dir_path))
+    return int(ranges[-1]["row_end"]) if ranges else 0
+
+
+def _training_sample(dir_path: Path, n: int, seed: int = 0) -> np.ndarray:
+    p = min(1.0, n / max(_total_rows(dir_path), 1))
+    rng = np.random.default_rng(seed)
+    parts = [b[rng.random(b.shape[0]) < p] for b in iter_embedding_batches(dir_path)]
+    return np.ascontiguousarray(np.vstack(parts))
+
+
+def hnsw_of(index: faiss.Index) -> Optional[faiss.HNSW]:
+    """The HNSW graph of an index (or of its IVF quantizer), if it has one."""
+    inner = faiss.downcast_index(index)
+    if hasattr(inner, "index") and isinstance(inner, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        inner = faiss.downcast_index(inner.index)
+    if hasattr(inner, "hnsw"):
+        return inner.hnsw
+    ivf = faiss.try_extract_index_ivf(inner)
+    if ivf is not None:
+        quantizer = faiss.downcast_index(ivf.quantizer)
+        if hasattr(quantizer, "hnsw"):
+            return quantizer.hnsw
+    return None
+
+
+def _configure_search(index: faiss.Index) -> None:
+    if faiss.try_extract_index_ivf(index) is not None:
+        faiss.ParameterSpace().set_index_parameter(index, "nprobe", get_settings().faiss_nprobe)
+
+
+def ef_search_for(k: int) -> int:
+    """efSearch for a top-k HNSW query: grows with k so large k_faiss still gets k good neighbours."""
+    settings = get_settings()
+    return max(int(settings.faiss_ef_search), int(math.ceil(int(k) * settings.faiss_ef_search_factor)))
+
+
+def search_params(
+    index: faiss.Index,
+    k: int,
+    selector: Optional[faiss.IDSelector] = None,
+    ef_search: Optional[int] = None,
+) -> Optional[faiss.SearchParameters]:
+    """Per-query search parameters for `index` (nprobe or efSearch, plus an optional id filter)."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        params = faiss.SearchParametersIVF()
+        params.nprobe = int(ivf.nprobe)
+    elif hnsw_of(index) is not None:
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = int(ef_search) if ef_search else ef_search_for(k)
+    elif selector is not None:
+        params = faiss.SearchParameters()
+    else:
+        return None
+    if selector is not None:
+        params.sel = selector
+    return params
+
+
+def _exact_search(index: faiss.Index, Q: np.ndarray, candidates: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Brute-force inner product of Q against the stored vectors of `candidates`."""
+    present = candidates[np.isin(candidates, faiss.vector_to_array(index.id_map))]
+    k = min(int(k), len(present))
+    if k == 0:
+        return np.empty((Q.shape[0], 0), dtype="float32"), np.empty((Q.shape[0], 0), dtype=np.int64)
+    vecs = index.reconstruct_batch(present)
+    S = Q @ vecs.T
+    top = np.argsort(-S, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(S, top, axis=1), present[top]
+
+
+def new_index(dim: int, factory: str) -> faiss.Index:
+    """An empty `factory` index wrapped to take catalog ids."""
+    inner = faiss.index_factory(dim, factory)
+    hnsw = hnsw_of(inner)
+    if hnsw is not None:
+        hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    return faiss.IndexIDMap2(inner)
+
+
+def _build_index(
+    dir_path: Path,
+    factory: str,
+    ids: Optional[np.ndarray] = None,
+    skip: Optional[np.ndarray] = None,
+) -> faiss.Index:
+    index: Optional[faiss.Index] = None
+    row = 0
+    for block in iter_embedding_batches(dir_path):
+        if index is None:
+            index = new_index(block.shape[1], factory)
+            if not index.is_trained:
+                sample = _training_sample(dir_path, get_settings().faiss_train_sample)
+                logger.info("FAISS: training %s on %d vectors", factory, sample.shape[0])
+                index.train(sample)
+        n = block.shape[0]
+        block_ids = ids[row:row + n] if ids is not None else np.arange(row, row + n, dtype=np.int64)
+        if skip is not None and skip.size:
+            keep = ~np.isin(block_ids, skip)
+            block, block_ids = block[keep], block_ids[keep]
+        index.add_with_ids(np.ascontiguousarray(block), np.ascontiguousarray(block_ids, dtype=np.int64))
+        row += n
+    if index is None:
+        raise ValueError("No embeddings to index")
+    if ids is not None and row != len(ids):
+        raise ValueError(f"Got {len(ids)} ids for {row} embedding rows")
+    return index
+
+
+def _index_params(factory: str) -> dict[str, object]:
+    return {
+        "factory": factory,
+        "efConstruction": HNSW_EF_CONSTRUCTION,
+        "train_sample": get_settings().faiss_train_sample,
+    }
+
+
+def _index_checksums(dir_path: Path, ids: Optional[np.ndarray], skip: Optional[np.ndarray] = None) -> dict[str, str]:
+    checksums = _source_checksums(dir_path)
+    # The id map is part of the index, so a changed catalog mapping invalidates it too.
+    checksums["ids"] = hashlib.sha256(ids.tobytes()).hexdigest() if ids is not None else "rows"
+    if skip is not None and skip.size:
+        checksums["skip"] = hashlib.sha256(skip.tobytes()).hexdigest()
+    return checksums
+
+
+def load_or_build_index(
+    dir_path: Path,
+    factory: str,
+    ids: Optional[np.ndarray] = None,
+    force: bool = False,
+    persist: Optional[bool] = None,
+    skip: Optional[np.ndarray] = None,
+) -> tuple[faiss.Index, Optional[Path]]:
+    """Load the persisted index for dir_path, rebuilding it only if its source embeddings changed.
+
+    Ids in `skip` (duplicate catalog rows) are left out. Returns the index and, if it is
+    memory-mapped, the file it is mapped from.
+    """
+    settings = get_settings()
+    if persist is None:
+        persist = settings.faiss_index_persist
+    checksums = _index_checksums(dir_path, ids, skip)
+    if not force:
+        index, mapped_path = load_index(dir_path, checksums, factory, mmap=settings.faiss_index_mmap)
+        if index is not None:
+            logger.info("FAISS: loaded persisted index for %s (ntotal=%d)", dir_path.name, index.ntotal)
+            return index, mapped_path
+
+    logger.info("FAISS: building %s index for %s", factory, dir_path.name)
+    index = _build_index(dir_path, factory, ids, skip)
+    if persist:
+        try:
+            path = write_index(
+                index,
+                dir_path,
+                checksums,
+                factory,
+                params=_index_params(factory),
+            )
+            logger.info("FAISS: wrote %s", path)
+        except OSError:
+            logger.exception("FAISS: failed to persist index for %s", dir_path.name)
+    return index, None
+
+
+class CorpusIndex:
+    """FAISS index of one corpus whose ids are catalog `idx` values.
 
-    # Courses
+    The index type comes from the FAISS factory string in Settings. Updates are copy-on-write:
+    a new index object is built and swapped in, so concurrent searches keep using the previous
+    one. Removals are kept as tombstones (HNSW graphs cannot drop vectors), saved in the store
+    manifest and filtered out of search results, across restarts too. A re-ingested id overwrites
+    its row in the store; an index that cannot drop the old vector is then not persisted, so the
+    next start rebuilds it from the store.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        dir_path: Path,
+        catalog_keys: Optional[CatalogKeys] = None,
+        factory_setting: str = "faiss_index_factory",
+        duplicates: Optional[Callable[[], Awaitable[list[int]]]] = None,
+    ) -> None:
+        self.name = name
+        self.dir_path = dir_path
+        self.catalog_keys = catalog_keys
+        self.factory_setting = factory_setting
+        self.duplicates = duplicates
+        self.skip: Optional[np.ndarray] = None
+        self.index: Optional[faiss.Index] = None
+        self.removed: frozenset[int] = frozenset()
+        self.filters: Optional[AttributeBitmaps] = None
+        self.keywords: Optional[KeywordIndex] = None
+        self._mapped_path: Optional[Path] = None
+        # Ids whose replaced vector is still in the live index (it could not be dropped).
+        self._replaced: frozenset[int] = frozenset()
+        self._lock = threading.Lock()
+
+    @property
+    def factory(self) -> str:
+        return str(getattr(get_settings(), self.factory_setting))
+
+    @property
+    def version(self) -> str:
+        """Changes when rows are added or removed; stable across restarts of an unchanged catalog."""
+        index = self.index
+        return f"{index.ntotal if index is not None else 0}-{len(self.removed)}"
+
+    async def fetch_duplicates(self) -> Optional[list[int]]:
+        """idx of the corpus' duplicate rows as clustered in Mongo; None if they cannot be read."""
+        if self.duplicates is None:
+            return None
+        try:
+            return await self.duplicates()
+        except Exception as e:
+            logger.warning("FAISS: %s duplicate clusters unavailable: %s", self.name, e)
+            return None
+
+    @staticmethod
+    def _duplicate_ids(ids: Optional[np.ndarray], duplicates: Optional[list[int]]) -> Optional[np.ndarray]:
+        # Duplicate clusters are keyed by catalog idx, so they need a resolved id map. Duplicates that
+        # were never stored (ingested reposts) do not change the index, so they stay out of its checksum.
+        if ids is None or not duplicates:
+            return None
+        skip = np.intersect1d(np.asarray(duplicates, dtype=np.int64), ids)
+        return skip if skip.size else None
+
+    def convert_store(self) -> EmbeddingStore:
+        """(Re)write the consolidated store from the shards, with catalog ids when they resolve."""
+        ranges = shard_ranges(shard_files(self.dir_path))
+        keys = self.catalog_keys() if self.catalog_keys is not None else None
+        try:
+            ids = resolve_row_ids(ranges, *keys) if keys else resolve_row_ids(ranges)
+        except ValueError as e:
+            logger.warning("Store: %s ids not resolved, keeping row positions: %s", self.name, e)
+            ids = None
+        store = convert_shards(self.dir_path, ids=ids)
+        logger.info("Store: %s rows=%d dim=%d ids=%s", self.name, store.rows, store.dim, ids is not None)
+        return store
+
+    def _refresh_store(self) -> None:
+        # The store, not the shards, feeds the index once it exists; shards dropped in later must not go unseen.
+        manifest = read_store_manifest(self.dir_path)
+        if manifest is None:
+            return
+        stale = stale_shards(self.dir_path, manifest)
+        if not stale:
+            return
+        if has_appended_rows(manifest):
+            logger.warning(
+                "Store: %s shards changed since the store was built (%s), but it also holds ingested rows; "
+                "keeping it. Run build_index --convert-store and re-ingest to pick the shards up",
+                self.name,
+                ", ".join(stale),
+            )
+            return
+        logger.warning(
+            "Store: %s shards changed since the store was built (%s), converting again", self.name, ", ".join(stale)
+        )
+        self.convert_store()
+
+    def load(
+        self, force: bool = False, persist: Optional[bool] = None, duplicates: Optional[list[int]] = None
+    ) -> None:
+        """Load or build the index; `duplicates` (see fetch_duplicates) are left out of it."""
+        self._refresh_store()
+        ids = resolve_ids(self.dir_path, self.catalog_keys)
+        skip = self._duplicate_ids(ids, duplicates)
+        index, mapped_path = load_or_build_index(
+            self.dir_path, self.factory, ids, force=force, persist=persist, skip=skip
+        )
+        if skip is not None:
+            logger.info("FAISS: %s collapsed %d duplicate rows", self.name, skip.size)
+        _configure_search(index)
+        manifest = read_store_manifest(self.dir_path)
+        removed = frozenset(int(i) for i in (manifest or {}).get("removed", []))
+        with self._lock:
+            self.index = index
+            self._mapped_path = mapped_path
+            self.skip = skip
+            self.removed = removed
+            self._replaced = frozenset()
+
+    def _require(self) -> faiss.Index:
+        if self.index is None:
+            raise RuntimeError(f"FAISS {self.name} index not built")
+        return self.index
+
+    def search(
+        self,
+        query_vec: np.ndarray,
+        k: int = 100,
+        filters: Optional[Mapping[str, Optional[Sequence[str]]]] = None,
+        ef_search: Optional[int] = None,
+    ) -> np.ndarray:
+        ids, _ = self.search_batch(np.asarray(query_vec)[None, :], k, filters, ef_search)
+        return ids[0]
+
+    def search_batch(
+        self,
+        query_mat: np.ndarray,
+        k: int = 100,
+        filters: Optional[Mapping[str, Optional[Sequence[str]]]] = None,
+        ef_search: Optional[int] = None,
+    ) -> tuple[list[np.ndarray], list[np.ndarray]]:
+        """Search an (n, dim) matrix in one FAISS call; per-query catalog ids and cosine scores.
+
+        `filters` maps attribute columns to accepted values; only matching ids are searched.
+        `ef_search` overrides the HNSW efSearch otherwise derived from k (see ef_search_for).
+        """
+        index = self._require()
+        removed = self.removed
+        fetch = min(int(k) + len(removed), max(int(index.ntotal), 1))
+        Q = np.atleast_2d(np.asarray(query_mat, dtype="float32"))
+        Q = np.ascontiguousarray(Q / (np.linalg.norm(Q, axis=1, keepdims=True) + 1e-12))
+
+        mask = self.filter_mask(filters)
+        D = I = None
+        if mask is not None and mask_count(mask) <= FILTER_EXACT_MAX:
+            try:
+                D, I = _exact_search(index, Q, mask_ids(mask), fetch)
+            except RuntimeError:
+                # No reconstruct support (e.g. IVF without a direct map): use the selector instead.
+                pass
+        if I is None:
+            # Both the selector and the mask it points into must outlive the search call.
+            selector = bitmap_selector(mask) if mask is not None else None
+            params = search_params(index, fetch, selector, ef_search)
+            D, I = index.search(Q, fetch, params=params) if params is not None else index.search(Q, fetch)
+            if index.metric_type == faiss.METRIC_L2:
+                # Squared L2 between unit vectors -> cosine similarity.
+                D = 1.0 - D / 2.0
+        all_ids: list[np.ndarray] = []
+        all_scores: list[np.ndarray] = []
+        for row_ids, row_scores in zip(I.tolist(), D.tolist()):
+            out_ids: list[int] = []
+            out_scores: list[float] = []
+            seen: set[int] = set()
+            for i, score in zip(row_ids, row_scores):
+                # An id may appear twice while its replaced vector is still in the index (see add).
+                if i < 0 or i in removed or i in seen:
+                    continue
+                seen.add(i)
+                out_ids.append(i)
+                out_scores.append(score)
+            all_ids.append(np.asarray(out_ids[: int(k)], dtype=np.int64))
+            all_scores.append(np.asarray(out_scores[: int(k)], dtype=np.float32))
+        return all_ids, all_scores
+
+    def filter_mask(self, filters: Optional[Mapping[str, Optional[Sequence[str]]]]) -> Optional[np.ndarray]:
+        if not filters or not any(filters.values()):
+            return None
+        bitmaps = self.filters
+        if bitmaps is None:
+            raise RuntimeError(f"Attribute filters are not available for {self.name}")
+        mask = bitmaps.mask(filters)
+        if mask is not None and self.removed:
+            mask = clear_ids(mask, self.removed)
+        return mask
+
+    def keyword_search(
+        self,
+        text: str,
+        k: int = 100,
+        filters: Optional[Mapping[str, Optional[Sequence[str]]]] = None,
+    ) -> np.ndarray:
+        """BM25 matches for text; empty when there is no keyword index for this corpus."""
+        keywords = self.keywords
+        if keywords is None:
+            return np.empty(0, dtype=np.int64)
+        ids = keywords.search(text, int(k) + len(self.removed), self.filter_mask(filters))
+        return np.asarray([i for i in ids.tolist() if i not in self.removed][: int(k)], dtype=np.int64)
+
+    def ensure_store(self) -> EmbeddingStore:
+        """Open the consolidated store, creating it from the shards (with ids) if needed."""
+        store = open_store(self.dir_path)
+        if store is not None and store.load_ids() is not None:
+            return store
+        ids = resolve_ids(self.dir_path, self.catalog_keys)
+        if store is None:
+            store = convert_shards(self.dir_path)
+        if ids is None:
+            ids = np.arange(store.rows, dtype=np.int64)
+        return set_store_ids(self.dir_path, ids)
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        ids = np.ascontiguousarray(ids, dtype=np.int64)
+        X = np.asarray(vectors, dtype="float32")
+        X = np.ascontiguousarray(X / (np.linalg.norm(X, axis=1, keepdims=True) + 1e-12))
+        with self._lock:
+            # An owned copy: memory-mapped indexes cannot grow, and searches may be running.
+            if self._mapped_path is not None:
+                index = faiss.read_index(str(self._mapped_path))
+            else:
+                index = faiss.deserialize_index(faiss.serialize_index(self._require()))
+            self._mapped_path = None
+            _configure_search(index)
+            present = ids[np.isin(ids, faiss.vector_to_array(index.id_map))]
+            replaced = self._replaced
+            if present.size:
+                try:
+                    index.remove_ids(faiss.IDSelectorBatch(present))
+                except RuntimeError:
+                    # HNSW cannot drop vectors: the old one stays until the index is rebuilt from the store.
+                    replaced = replaced | set(present.tolist())
+            index.add_with_ids(X, ids)
+            self.index = index
+            self._replaced = replaced
+            self.removed = self.removed - set(ids.tolist())
+
+    def remove(self, ids: Iterable[int]) -> int:
+        """Tombstone ids in the store manifest and drop them from search."""
+        id_list = [int(i) for i in ids]
+        self.ensure_store()
+        removed = mark_removed(self.dir_path, id_list)
+        with self._lock:
+            self.removed = frozenset(removed)
+        return len(id_list)
+
+    def append(self, ids: np.ndarray, vectors: np.ndarray, source: str, persist: Optional[bool] = None) -> None:
+        """Write rows to the embedding store (replacing ids it has) and the live index, then persist the index."""
+        self.ensure_store()
+        upsert_rows(self.dir_path, ids, vectors, source)
+        self.add(ids, vectors)
+        if persist if persist is not None else get_settings().faiss_index_persist:
+            self.persist()
+
+    def persist(self) -> None:
+        if self._replaced:
+            # The saved index would keep the replaced vectors; leave the stale file so that its
+            # checksums no longer match the store and the next start rebuilds.
+            logger.info("FAISS: %s has %d replaced vectors, not persisted", self.name, len(self._replaced))
+            return
+        index = self._require()
+        checksums = _index_checksums(self.dir_path, resolve_ids(self.dir_path, self.catalog_keys), self.skip)
+        path = write_index(index, self.dir_path, checksums, self.factory, params=_index_params(self.factory))
+        logger.info("FAISS: wrote %s", path)
+
+
+vacancy_index = CorpusIndex("vacancies", VAC_EMBED_DIR, load_vacancy_keys, duplicates=load_vacancy_duplicates)
+course_index = CorpusIndex(
+    "courses",
+    COURSE_EMBED_DIR,
+    load_course_keys,
+    "faiss_courses_index_factory",
+    duplicates=load_course_duplicates,
+)
+
+
+async def build_faiss() -> None:
+    for corpus in (vacancy_index, course_index):
+        try:
+            corpus.load(duplicates=await corpus.fetch_duplicates())
+        except Exception:
+            logger.exception("FAISS: %s index unavailable", corpus.name)
+            corpus.index = None
+
+
+async def build_filters() -> None:
     try:
-        XC = _load_all_embeddings(COURSE_EMBED_DIR)
-        norms = np.linalg.norm(XC, axis=1, keepdims=True) + 1e-12
-        XCn = XC / norms
-        dimc = XCn.shape[1]
-        index_c = faiss.IndexHNSWFlat(dimc, 32)
-        index_c.hnsw.efConstruction = 200
-        index_c.add(XCn)
-        faiss_index_courses = index_c
+        vacancy_index.filters = await load_vacancy_filters()
     except Exception:
-        faiss_index_courses = None
+        logger.exception("Filters: vacancy attribute filters unavailable")
+        vacancy_index.filters = None
+
+
+async def build_keyword_indexes() -> None:
+    for corpus, fields in ((vacancy_index, VACANCY_FIELDS), (course_index, COURSE_FIELDS)):
+        try:
+            corpus.keywords = await load_keyword_index(corpus.name, fields)
+        except Exception:
+            logger.exception("Keywords: %s keyword index unavailable", corpus.name)
+            corpus.keywords = None
+
+
+def search_top_k(
+    query_vec: np.ndarray,
+    k: int = 100,
+    filters: Optional[Mapping[str, Optional[Sequence[str]]]] = None,
+    ef_search: Optional[int] = None,
+) -> np.ndarray:
+    return vacancy_index.search(query_vec, k, filters, ef_search)
+
+
+def search_top_k_courses(query_vec: np.ndarray, k: int = 100, ef_search: Optional[int] = None) -> np.ndarray:
+    return course_index.search(query_vec, k, ef_search=ef_search)
+
+
+def search_top_k_batch(
+    query_mat: np.ndarray,
+    k: int = 100,
+    filters: Optional[Mapping[str, Optional[Sequence[str]]]] = None,
+    ef_search: Optional[int] = None,
+) -> tuple[list[np.ndarray], list[np.ndarray]]:
+    return vacancy_index.search_batch(query_mat, k, filters, ef_search)
 
 
-def search_top_k(query_vec: np.ndarray, k: int = 100) -> np.ndarray:
-    if faiss_index is None:
-        raise RuntimeError("FAISS index not built")
-    q = query_vec.astype("float32")
-    q = q / (np.linalg.norm(q) + 1e-12)
-    _, idx_rows = faiss_index.search(q[None, :], k)
-    rows = idx_rows[0]
-    return rows.astype(np.int64)
+def search_top_k_courses_batch(
+    query_mat: np.ndarray,
+    k: int = 100,
+    ef_search: Optional[int] = None,
+) -> tuple[list[np.ndarray], list[np.ndarray]]:
+    return course_index.search_batch(query_mat, k, ef_search=ef_search)
 
 
-def search_top_k_courses(query_vec: np.ndarray, k: int = 100) -> np.ndarray:
-    if faiss_index_courses is None:
-        raise RuntimeError("FAISS courses index not built")
-    q = query_vec.astype("float32")
-    q = q / (np.linalg.norm(q) + 1e-12)
-    _, idx_rows = faiss_index_courses.search(q[None, :], k)
-    rows = idx_rows[0]
-    return rows.astype(np.int64)
+def keyword_top_k(
+    text: str,
+    k: int = 100,
+    filters: Optional[Mapping[str, Optional[Sequence[str]]]] = None,
+) -> np.ndarray:
+    return vacancy_index.keyword_search(text, k, filters)
 
 
+def keyword_top_k_courses(text: str, k: int = 100) -> np.ndarray:
+    return course_index.keyword_search(text, k)
@@ -1,42 +1,49 @@
 from __future__ import annotations
 
 import os
-from typing import Any
+from typing import Any, Optional
 
+import numpy as np
 import polars as pl
 
 from app.db.mongo import get_db
+from app.startup.duplicates import COURSE_DUP_KEY, assign_clusters, backfill_clusters, duplicate_idx
 
 
 PARQUET_PATH = os.environ.get("COURSES_PARQUET_PATH", "data/courses.parquet")
 
 
-async def seed_courses_if_needed() -> None:
-    if not os.path.exists(PARQUET_PATH):
-        return
+REQUIRED_COLUMNS: dict[str, Any] = {
+    "idx": pl.UInt32,  # добавим по порядку, если нет
+    "Course Name": pl.Utf8,
+    "University": pl.Utf8,
+    "Difficulty Level": pl.Utf8,
+    "Course Rating": pl.Utf8,
+    "Course URL": pl.Utf8,
+    "Course Description": pl.Utf8,
+    "Skills": pl.Utf8,
+    "summary": pl.Utf8,
+}
 
-    df = pl.read_parquet(PARQUET_PATH)
-    required_cols: dict[str, Any] = {
-        "idx": pl.UInt32,  # добавим по порядку, если нет
-        "Course Name": pl.Utf8,
-        "University": pl.Utf8,
-        "Difficulty Level": pl.Utf8,
-        "Course Rating": pl.Utf8,
-        "Course URL": pl.Utf8,
-        "Course Description": pl.Utf8,
-        "Skills": pl.Utf8,
-        "summary": pl.Utf8,
-    }
 
-    if "idx" not in df.columns:
-        df = df.with_row_count("idx", offset=1)
-    for col, dtype in required_cols.items():
+def normalize_frame(df: pl.DataFrame) -> pl.DataFrame:
+    for col, dtype in REQUIRED_COLUMNS.items():
         if col not in df.columns:
             df = df.with_columns(pl.lit(None).cast(dtype).alias(col))
         else:
             df = df.with_columns(pl.col(col).cast(dtype, strict=False))
 
-    df = df.select(list(required_cols.keys()))
+    return df.select(list(REQUIRED_COLUMNS.keys()))
+
+
+async def seed_courses_if_needed() -> None:
+    if not os.path.exists(PARQUET_PATH):
+        return
+
+    df = pl.read_parquet(PARQUET_PATH)
+    if "idx" not in df.columns:
+        df = df.with_row_count("idx", offset=1)
+    df = assign_clusters(normalize_frame(df), COURSE_DUP_KEY)
 
     db = await get_db()
     coll = db["courses"]
@@ -54,5 +61,23 @@ async def seed_courses_if_needed() -> None:
     ]
     if to_insert:
         await coll.insert_many(to_insert)
+    await backfill_clusters(coll, df, COURSE_DUP_KEY)
 
 
+def load_catalog_keys() -> Optional[tuple[np.ndarray, np.ndarray]]:
+    """Source `id` and seeded `idx` for every catalog row; used to map embedding rows to idx."""
+    if not os.path.exists(PARQUET_PATH):
+        return None
+    df = pl.read_parquet(PARQUET_PATH)
+    if "idx" not in df.columns:
+        df = df.with_row_count("idx", offset=1)
+    if "id" not in df.columns or "idx" not in df.columns:
+        return None
+    df = df.select(pl.col("id").cast(pl.Int64, strict=False), pl.col("idx").cast(pl.Int64, strict=False)).drop_nulls()
+    return df["id"].to_numpy(), df["idx"].to_numpy()
+
+
+async def load_duplicate_idx() -> list[int]:
+    """idx of courses that are reposts of another one, as clustered in Mongo; these are left out of the index."""
+    db = await get_db()
+    return await duplicate_idx(db["courses"])
@@ -1,46 +1,52 @@
 from __future__ import annotations
 
 import os
-from typing import Any
+from typing import Any, Optional
 
+import numpy as np
 import polars as pl
 
 from app.db.mongo import get_db
+from app.startup.duplicates import VACANCY_DUP_KEY, assign_clusters, backfill_clusters, duplicate_idx
 
 
 PARQUET_PATH = os.environ.get("VACANCIES_PARQUET_PATH", "data/vacancies.parquet")
 
 
-async def seed_vacancies_if_needed() -> None:
-    if not os.path.exists(PARQUET_PATH):
-        return
+REQUIRED_COLUMNS: dict[str, Any] = {
+    "idx": pl.UInt32,
+    "№": pl.Int64,
+    "id": pl.Int64,
+    "title": pl.Utf8,
+    "salary": pl.Utf8,
+    "experience": pl.Utf8,
+    "job_type": pl.Utf8,
+    "description": pl.Utf8,
+    "key_skills": pl.Utf8,
+    "company": pl.Utf8,
+    "location": pl.Utf8,
+    "date_of_post": pl.Utf8,
+    "type": pl.Utf8,
+}
 
-    df = pl.read_parquet(PARQUET_PATH)
-    # Normalize schema and select required columns with types
-    required_cols: dict[str, Any] = {
-        "idx": pl.UInt32,
-        "№": pl.Int64,
-        "id": pl.Int64,
-        "title": pl.Utf8,
-        "salary": pl.Utf8,
-        "experience": pl.Utf8,
-        "job_type": pl.Utf8,
-        "description": pl.Utf8,
-        "key_skills": pl.Utf8,
-        "company": pl.Utf8,
-        "location": pl.Utf8,
-        "date_of_post": pl.Utf8,
-        "type": pl.Utf8,
-    }
 
+def normalize_frame(df: pl.DataFrame) -> pl.DataFrame:
+    # Normalize schema and select required columns with types
     # Ensure columns exist, fill missing
-    for col, dtype in required_cols.items():
+    for col, dtype in REQUIRED_COLUMNS.items():
         if col not in df.columns:
             df = df.with_columns(pl.lit(None).cast(dtype).alias(col))
         else:
             df = df.with_columns(pl.col(col).cast(dtype, strict=False))
 
-    df = df.select(list(required_cols.keys()))
+    return df.select(list(REQUIRED_COLUMNS.keys()))
+
+
+async def seed_vacancies_if_needed() -> None:
+    if not os.path.exists(PARQUET_PATH):
+        return
+
+    df = assign_clusters(normalize_frame(pl.read_parquet(PARQUET_PATH)), VACANCY_DUP_KEY)
 
     db = await get_db()
     coll = db["vacancies"]
@@ -61,5 +67,21 @@ async def seed_vacancies_if_needed() -> None:
         # create index on idx if missing
         await coll.create_index("idx")
         await coll.insert_many(to_insert)
+    await backfill_clusters(coll, df, VACANCY_DUP_KEY)
+
 
+def load_catalog_keys() -> Optional[tuple[np.ndarray, np.ndarray]]:
+    """Source `id` and seeded `idx` for every catalog row; used to map embedding rows to idx."""
+    if not os.path.exists(PARQUET_PATH):
+        return None
+    df = pl.read_parquet(PARQUET_PATH)
+    if "id" not in df.columns or "idx" not in df.columns:
+        return None
+    df = df.select(pl.col("id").cast(pl.Int64, strict=False), pl.col("idx").cast(pl.Int64, strict=False)).drop_nulls()
+    return df["id"].to_numpy(), df["idx"].to_numpy()
 
+
+async def load_duplicate_idx() -> list[int]:
+    """idx of vacancies that are reposts of another one, as clustered in Mongo; these are left out of the index."""
+    db = await get_db()
+    return await duplicate_idx(db["vacancies"])